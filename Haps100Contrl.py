@@ -9,6 +9,7 @@ import tempfile
 import sys
 from queue import Queue
 from pathlib import Path
+from haps_log import LogPipeline, LogHistory, LogView
 
 # 用于支持打包资源文件
 def get_resource_path(relative_path):
@@ -28,6 +29,9 @@ class HAPSAutomationGUI:
         self.root.geometry("1000x600")
         self.root.minsize(800, 500)  # 调整最小尺寸
         
+        # 日志管道：执行线程只入队，日志框创建后由主循环按节拍取出显示
+        self._log_pipeline = LogPipeline(root, self._render_logs)
+        
         # 检查并获取默认TCL文件路径
         self.default_tcl_path = get_resource_path("haps_control_default.tcl")
         if not os.path.exists(self.default_tcl_path):
@@ -65,9 +69,6 @@ class HAPSAutomationGUI:
             "custom_commands": [""]  # 默认至少有一个命令框
         }
         
-        # 临时日志存储（在log_text创建前使用）
-        self.temp_logs = []
-        
         # 命令队列和执行状态 - 用于串行执行
         self.command_queue = Queue()  # 存储待执行的命令
         self.is_processing = False    # 是否正在处理命令队列
@@ -114,8 +115,8 @@ class HAPSAutomationGUI:
         # 初始化右侧日志区域
         self.init_log_area()
         
-        # 显示临时日志
-        self.flush_temp_logs()
+        # 开始显示日志（包括日志框创建前产生的日志）
+        self._log_pipeline.start()
 
     def init_tab1(self):
         # 使用网格布局的主框架，确保宽度自适应
@@ -310,6 +311,13 @@ class HAPSAutomationGUI:
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD)
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.log_text.config(state=tk.DISABLED)
+        
+        # 日志框只保留一个视窗的行，全部日志写入历史文件，向上滚动时按页换入
+        try:
+            log_history = LogHistory()
+        except OSError:
+            log_history = None
+        self.log_view = LogView(self.log_text, log_history)
 
     def load_custom_commands(self):
         """从配置中加载自定义命令，确保在页面初始化时调用"""
@@ -468,35 +476,17 @@ class HAPSAutomationGUI:
             messagebox.showerror("错误", error_msg)
 
     def log(self, message):
-        """在日志框中添加消息"""
-        # 如果log_text尚未创建，先存储到临时日志
-        if not hasattr(self, 'log_text'):
-            self.temp_logs.append(message)
-            return
-            
-        self.log_text.config(state=tk.NORMAL)
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)  # 滚动到最后
-        self.log_text.config(state=tk.DISABLED)
+        """记录日志（任意线程可调用，只入队，由主循环显示）"""
+        self._log_pipeline.push(message)
+    
+    def _render_logs(self, lines):
+        self.log_view.append(lines)
     
     def clear_log(self):
         """清空日志框内容"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        self._log_pipeline.clear()
+        self.log_view.clear()
         self.log("日志已清空")
-    
-    def flush_temp_logs(self):
-        """显示临时存储的日志"""
-        if hasattr(self, 'log_text') and self.temp_logs:
-            self.log_text.config(state=tk.NORMAL)
-            for message in self.temp_logs:
-                timestamp = time.strftime("%H:%M:%S")
-                self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
-            self.temp_logs = []
 
     def run_haps_command(self, xactorscmd_path=None, tcl_script=None):
         """
@@ -1,12 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import os
-import json
+import sqlite3
 import threading
 import time
-from queue import Queue
-import paramiko
-from paramiko.ssh_exception import SSHException, AuthenticationException
+from haps_engine import HapsEngine
+from haps_log import LogPipeline, LogHistory, LogView
+from haps_search import parse_date
 
 class ScrollableFrame(ttk.Frame):
     """可滚动框架组件"""
@@ -522,6 +522,28 @@ class AutomationPanel(ttk.Frame):
         
         clear_queue_btn = ttk.Button(status_frame, text="清空队列", command=self.app.clear_command_queue)
         clear_queue_btn.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(status_frame, text="终止执行", command=self.app.cancel_running).pack(side=tk.RIGHT, padx=5)
+        
+        # 紧急模式：命令以最高优先级提交，并抢占正在执行的冲突命令
+        self.urgent_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(status_frame, text="紧急", variable=self.urgent_var,
+                        command=self.on_urgent_changed).pack(side=tk.RIGHT, padx=5)
+        
+        # 目标板卡选择（haps_config.json中boards注册的板卡，"全部"表示同时下发到所有板卡）
+        board_names = list(self.app.boards.keys())
+        if len(board_names) > 1:
+            board_names.append("全部")
+        self.board_var = tk.StringVar(value=self.app.target_board)
+        board_combo = ttk.Combobox(status_frame, textvariable=self.board_var, values=board_names,
+                                   state="readonly", width=12)
+        board_combo.pack(side=tk.RIGHT, padx=5)
+        board_combo.bind("<<ComboboxSelected>>", self.on_board_changed)
+        ttk.Label(status_frame, text="目标板卡:").pack(side=tk.RIGHT, padx=5)
+        
+        # 常驻会话开关
+        self.session_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(status_frame, text="常驻会话", variable=self.session_mode_var,
+                        command=self.on_session_mode_changed).pack(side=tk.RIGHT, padx=5)
         row += 1
         
         # 操作按钮区
@@ -536,6 +558,10 @@ class AutomationPanel(ttk.Frame):
         ttk.Button(load_frame, text="Load All", command=lambda: self.app.queue_command("load_all")).pack(side=tk.LEFT, padx=8)
         ttk.Button(load_frame, text="Load Master", command=lambda: self.app.queue_command("load_master")).pack(side=tk.LEFT, padx=8)
         ttk.Button(load_frame, text="Load Slave", command=lambda: self.app.queue_command("load_slave")).pack(side=tk.LEFT, padx=8)
+        # 仅设计变化时加载：tsd和bit文件未变化且FPGA均已配置时跳过重新配置
+        self.if_changed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(load_frame, text="仅设计变化时加载", variable=self.if_changed_var,
+                        command=self.on_if_changed_changed).pack(side=tk.LEFT, padx=8)
         
         # Reset按钮组
         reset_frame = ttk.Frame(btn_frame)
@@ -545,6 +571,18 @@ class AutomationPanel(ttk.Frame):
         ttk.Button(reset_frame, text="Reset Master", command=lambda: self.app.queue_command("reset_master")).pack(side=tk.LEFT, padx=8)
         ttk.Button(reset_frame, text="Reset Slave", command=lambda: self.app.queue_command("reset_slave")).pack(side=tk.LEFT, padx=8)
         
+        # 流程（haps_config.json中campaigns定义的依赖图）
+        campaign_names = list(self.app.config.get("campaigns", {}).keys())
+        if campaign_names:
+            campaign_frame = ttk.Frame(btn_frame)
+            campaign_frame.pack(fill=tk.X, pady=8)
+            ttk.Label(campaign_frame, text="流程操作:").pack(side=tk.LEFT, padx=8)
+            self.campaign_var = tk.StringVar(value=campaign_names[0])
+            ttk.Combobox(campaign_frame, textvariable=self.campaign_var, values=campaign_names,
+                         state="readonly", width=16).pack(side=tk.LEFT, padx=8)
+            ttk.Button(campaign_frame, text="执行流程",
+                       command=lambda: self.app.submit_campaign(self.campaign_var.get())).pack(side=tk.LEFT, padx=8)
+        
         # 路径配置区
         config_frame = ttk.LabelFrame(self.inner_frame, text="文件配置", padding="10")
         config_frame.grid(row=row, column=0, columnspan=2, sticky=tk.EW, padx=8, pady=8)
@@ -604,9 +642,11 @@ class AutomationPanel(ttk.Frame):
             self.tcl_buttons[key].grid(row=0, column=2, padx=8, pady=0)
             config_row += 1
         
-        # 保存配置按钮
-        save_btn = ttk.Button(config_frame, text="保存配置", command=self.save_config)
-        save_btn.grid(row=config_row, column=0, columnspan=2, pady=12)
+        # 保存配置和刷新路径缓存按钮
+        config_btn_frame = ttk.Frame(config_frame)
+        config_btn_frame.grid(row=config_row, column=0, columnspan=2, pady=12)
+        ttk.Button(config_btn_frame, text="保存配置", command=self.save_config).pack(side=tk.LEFT, padx=8)
+        ttk.Button(config_btn_frame, text="刷新路径缓存", command=self.app.refresh_path_cache).pack(side=tk.LEFT, padx=8)
         config_row += 1
         
         # 添加额外空白区域确保滚动条能显示
@@ -659,6 +699,23 @@ class AutomationPanel(ttk.Frame):
             except Exception as e:
                 messagebox.showerror("错误", f"浏览远程文件失败：{str(e)}")
         
+    def on_urgent_changed(self):
+        self.app.urgent = self.urgent_var.get()
+        
+    def on_if_changed_changed(self):
+        self.app.load_if_changed = self.if_changed_var.get()
+        
+    def on_board_changed(self, event):
+        """切换预设命令和自定义命令的目标板卡"""
+        self.app.target_board = self.board_var.get()
+        
+    def on_session_mode_changed(self):
+        """切换常驻会话模式，关闭时释放会话"""
+        self.app.config["session_mode"] = self.session_mode_var.get()
+        self.app.save_config()
+        if not self.session_mode_var.get():
+            self.app.close_session()
+        
     def update_mode_visibility(self, event):
         """根据模式更新控件状态"""
         mode = self.app.config.get("mode", "local")
@@ -670,6 +727,7 @@ class AutomationPanel(ttk.Frame):
         self.base_dir_var.set(self.app.config["base_dir"])
         self.haps_control_var.set(self.app.config["haps_control_path"])
         self.xactorscmd_var.set(self.app.config["xactorscmd_path"])
+        self.session_mode_var.set(self.app.config.get("session_mode", False))
         
         for key, var in self.tcl_vars.items():
             if key in self.app.config:
@@ -679,7 +737,10 @@ class AutomationPanel(ttk.Frame):
         
     def save_config(self):
         """保存常规操作配置"""
-        self.app.config["base_dir"] = self.base_dir_var.get().strip()
+        base_dir = self.base_dir_var.get().strip()
+        if base_dir != self.app.config.get("base_dir", ""):
+            self.app.path_cache.invalidate()
+        self.app.config["base_dir"] = base_dir
         self.app.config["haps_control_path"] = self.haps_control_var.get().strip()
         self.app.config["xactorscmd_path"] = self.xactorscmd_var.get().strip()
         
@@ -691,13 +752,13 @@ class AutomationPanel(ttk.Frame):
         
     def update_exec_status(self, event):
         """更新执行状态显示"""
-        queue_size = self.app.command_queue.qsize()
+        summary, busy = self.app.queue_summary()
         
-        if self.app.is_processing:
-            self.exec_status_var.set(f"执行中 - 剩余：{queue_size}")
+        if busy:
+            self.exec_status_var.set(f"执行中 - {summary}")
             self.status_label.configure(foreground="orange")
-        elif queue_size > 0:
-            self.exec_status_var.set(f"就绪 - 等待：{queue_size}")
+        elif summary:
+            self.exec_status_var.set(f"就绪 - {summary}")
             self.status_label.configure(foreground="blue")
         else:
             self.exec_status_var.set("就绪")
@@ -764,6 +825,9 @@ class CustomCommandsPanel(ttk.Frame):
         ttk.Button(btn_frame, text="添加命令框", command=self.add_command_entry).pack(side=tk.LEFT, padx=8)
         ttk.Button(btn_frame, text="删除最后一个", command=self.remove_command_entry).pack(side=tk.LEFT, padx=8)
         ttk.Button(btn_frame, text="保存命令", command=self.save_custom_commands).pack(side=tk.LEFT, padx=8)
+        self.batch_var = tk.BooleanVar(value=self.app.config.get("custom_batch", False))
+        ttk.Checkbutton(btn_frame, text="合并执行连续命令", variable=self.batch_var,
+                        command=self.on_batch_changed).pack(side=tk.LEFT, padx=8)
         row += 1
         
         # 添加额外空白区域确保滚动条能显示
@@ -771,6 +835,11 @@ class CustomCommandsPanel(ttk.Frame):
             ttk.Label(self.inner_frame, text="").grid(row=row, column=0, pady=10)
             row += 1
 
+    def on_batch_changed(self):
+        """切换合并执行：连续等待中的自定义命令共用一次打开/关闭句柄"""
+        self.app.config["custom_batch"] = self.batch_var.get()
+        self.app.save_config()
+
     def save_default_tcl_path(self):
         """单独保存默认TCL路径配置"""
         self.app.config["default_tcl_path"] = self.default_tcl_var.get().strip()
@@ -820,8 +889,10 @@ class CustomCommandsPanel(ttk.Frame):
         
         # 从配置加载命令
         custom_cmds = self.app.config.get("custom_commands", [""])
-        for cmd in custom_cmds:
-            self.add_command_entry(default_text=cmd, update_config=False)
+        idempotent_flags = self.app.config.get("custom_idempotent", [])
+        for index, cmd in enumerate(custom_cmds):
+            idempotent = idempotent_flags[index] if index < len(idempotent_flags) else False
+            self.add_command_entry(default_text=cmd, update_config=False, idempotent=idempotent)
         
         # 加载默认TCL路径配置
         self.default_tcl_var.set(self.app.config.get("default_tcl_path", "tcl\\haps_control_default.tcl"))
@@ -832,7 +903,7 @@ class CustomCommandsPanel(ttk.Frame):
             
         self.update_layout()
 
-    def add_command_entry(self, default_text="", update_config=True):
+    def add_command_entry(self, default_text="", update_config=True, idempotent=False):
         """添加命令输入框"""
         # 命令行框架
         cmd_frame = ttk.Frame(self.cmds_frame, height=35)
@@ -844,17 +915,23 @@ class CustomCommandsPanel(ttk.Frame):
         cmd_entry = ttk.Entry(cmd_frame, textvariable=cmd_var)
         cmd_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         
+        # 幂等命令：队列中已有相同的等待命令时不再重复加入
+        idem_var = tk.BooleanVar(value=idempotent)
+        
         # 执行按钮
         exec_btn = ttk.Button(
             cmd_frame, 
             text="执行", 
             width=6,
-            command=lambda v=cmd_var: self.app.queue_custom_command(v.get())
+            command=lambda v=cmd_var, i=idem_var: self.app.queue_custom_command(v.get(), idempotent=i.get())
         )
         exec_btn.pack(side=tk.LEFT, padx=5)
         
+        ttk.Checkbutton(cmd_frame, text="幂等", variable=idem_var,
+                        command=self.save_custom_commands).pack(side=tk.LEFT, padx=5)
+        
         # 记录命令框
-        self.cmd_entries.append((cmd_frame, cmd_var, exec_btn))
+        self.cmd_entries.append((cmd_frame, cmd_var, exec_btn, idem_var))
         
         # 更新配置
         if update_config:
@@ -867,7 +944,7 @@ class CustomCommandsPanel(ttk.Frame):
             messagebox.showinfo("无法删除", "至少保留一个命令输入框")
             return
         
-        cmd_frame, cmd_var, exec_btn = self.cmd_entries.pop()
+        cmd_frame, cmd_var, exec_btn, idem_var = self.cmd_entries.pop()
         cmd_frame.destroy()
         self.save_custom_commands()  # 同时保存默认TCL路径
         self.update_layout()
@@ -875,7 +952,8 @@ class CustomCommandsPanel(ttk.Frame):
     def save_custom_commands(self):
         """保存自定义命令和默认TCL路径配置"""
         # 保存自定义命令
-        self.app.config["custom_commands"] = [v.get().strip() for (f, v, b) in self.cmd_entries]
+        self.app.config["custom_commands"] = [v.get().strip() for (f, v, b, i) in self.cmd_entries]
+        self.app.config["custom_idempotent"] = [i.get() for (f, v, b, i) in self.cmd_entries]
         # 保存默认TCL路径
         self.app.config["default_tcl_path"] = self.default_tcl_var.get().strip()
         self.app.save_config()
@@ -885,56 +963,154 @@ class CustomCommandsPanel(ttk.Frame):
         self.cmds_frame.update_idletasks()
         self.scrollable_frame.force_update()
 
-class HAPSAutomationGUI:
+class LogSearchPanel(ttk.Frame):
+    """运行日志检索面板 - 按短语检索历史运行日志的输出，可按板卡、命令和日期过滤"""
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.parent = parent
+        self.results = {}  # 结果行ID -> 检索结果
+        self.create_widgets()
+        
+    def create_widgets(self):
+        filter_frame = ttk.LabelFrame(self, text="检索条件", padding="10")
+        filter_frame.pack(fill=tk.X, padx=8, pady=8)
+        filter_frame.columnconfigure(1, weight=1)
+        
+        ttk.Label(filter_frame, text="输出内容:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        self.query_var = tk.StringVar()
+        query_entry = ttk.Entry(filter_frame, textvariable=self.query_var)
+        query_entry.grid(row=0, column=1, columnspan=5, sticky=tk.EW, padx=5, pady=5)
+        query_entry.bind("<Return>", lambda event: self.search())
+        self.raw_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_frame, text="FTS语法", variable=self.raw_var).grid(row=0, column=6, padx=5)
+        ttk.Button(filter_frame, text="检索", command=self.search).grid(row=0, column=7, padx=5)
+        
+        ttk.Label(filter_frame, text="板卡:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
+        self.board_var = tk.StringVar(value="")
+        ttk.Combobox(filter_frame, textvariable=self.board_var, values=[""] + list(self.app.boards.keys()),
+                     state="readonly", width=12).grid(row=1, column=1, sticky=tk.W, padx=5)
+        ttk.Label(filter_frame, text="命令:").grid(row=1, column=2, sticky=tk.W, padx=5)
+        self.command_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.command_var, width=16).grid(row=1, column=3, padx=5)
+        ttk.Label(filter_frame, text="日期(YYYY-MM-DD):").grid(row=1, column=4, sticky=tk.W, padx=5)
+        self.since_var = tk.StringVar()
+        self.until_var = tk.StringVar()
+        date_frame = ttk.Frame(filter_frame)
+        date_frame.grid(row=1, column=5, columnspan=3, sticky=tk.W)
+        ttk.Entry(date_frame, textvariable=self.since_var, width=11).pack(side=tk.LEFT)
+        ttk.Label(date_frame, text="至").pack(side=tk.LEFT, padx=3)
+        ttk.Entry(date_frame, textvariable=self.until_var, width=11).pack(side=tk.LEFT)
+        
+        self.summary_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.summary_var, foreground="gray").pack(fill=tk.X, padx=12)
+        
+        # 检索结果，双击在日志窗口中显示所在运行日志的路径和该行内容
+        result_frame = ttk.Frame(self)
+        result_frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        columns = ("time", "board", "command", "state", "line")
+        self.tree = ttk.Treeview(result_frame, columns=columns, show="headings")
+        for column, text, width in (("time", "时间", 130), ("board", "板卡", 70), ("command", "命令", 120),
+                                    ("state", "状态", 60), ("line", "输出", 400)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, stretch=(column == "line"))
+        scrollbar = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", self.on_result_open)
+        
+    def search(self):
+        query = self.query_var.get().strip()
+        if not query:
+            return
+        try:
+            since = parse_date(self.since_var.get()) if self.since_var.get().strip() else None
+            until = parse_date(self.until_var.get(), end=True) if self.until_var.get().strip() else None
+            started = time.perf_counter()
+            results = self.app.search_run_logs(query, board=self.board_var.get() or None,
+                                               command=self.command_var.get().strip() or None,
+                                               since=since, until=until, limit=500, raw=self.raw_var.get())
+        except (ValueError, sqlite3.Error) as e:
+            self.app.report_error("检索失败", str(e))
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        
+        self.tree.delete(*self.tree.get_children())
+        self.results = {}
+        for item in results:
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item["created"]))
+            row = self.tree.insert("", tk.END, values=(created, item["board"], f"{item['kind']}[{item['content']}]",
+                                                       item["state"] or "", item["text"]))
+            self.results[row] = item
+        self.summary_var.set(f"共{len(results)}条{'（最多显示500条）' if len(results) >= 500 else ''}，耗时{elapsed:.1f}ms")
+        
+    def on_result_open(self, event):
+        item = self.results.get(self.tree.focus())
+        if item is not None:
+            self.app.sync_log(f"运行日志：{item['path']} 第{item['lineno']}行输出：{item['text']}")
+
+class PhaseStatsPanel(ttk.Frame):
+    """阶段耗时面板 - 各板卡加载/复位各阶段耗时的p50/p95，用于判断变慢的是扫描、清除还是配置"""
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.parent = parent
+        self.create_widgets()
+        
+    def create_widgets(self):
+        filter_frame = ttk.Frame(self, padding="10")
+        filter_frame.pack(fill=tk.X, padx=8)
+        ttk.Label(filter_frame, text="板卡:").pack(side=tk.LEFT, padx=5)
+        self.board_var = tk.StringVar(value="")
+        ttk.Combobox(filter_frame, textvariable=self.board_var, values=[""] + list(self.app.boards.keys()),
+                     state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Label(filter_frame, text="命令:").pack(side=tk.LEFT, padx=5)
+        self.command_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.command_var, width=16).pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="刷新", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Label(filter_frame, text="只统计成功的运行", foreground="gray").pack(side=tk.LEFT, padx=10)
+        
+        result_frame = ttk.Frame(self)
+        result_frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        columns = ("board", "command", "phase", "count", "p50", "p95", "last")
+        self.tree = ttk.Treeview(result_frame, columns=columns, show="headings")
+        for column, text, width in (("board", "板卡", 80), ("command", "命令", 100), ("phase", "阶段", 70),
+                                    ("count", "次数", 60), ("p50", "p50", 80), ("p95", "p95", 80),
+                                    ("last", "最近", 80)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, anchor=tk.W if column in ("board", "command", "phase") else tk.E)
+        scrollbar = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.refresh()
+        
+    def refresh(self):
+        def seconds(value):
+            return "-" if value is None else f"{value:.1f}s"
+        self.tree.delete(*self.tree.get_children())
+        for row in self.app.phase_summary(self.board_var.get() or None, self.command_var.get().strip() or None):
+            self.tree.insert("", tk.END, values=(row["board"], row["command"], row["phase"], row["count"],
+                                                 seconds(row["p50"]), seconds(row["p95"]), seconds(row["last"])))
+
+class HAPSAutomationGUI(HapsEngine):
+    """图形界面 - 在HapsEngine之上提供面板、日志窗口和弹窗提示"""
     def __init__(self, root):
         self.root = root
         self.root.title("HAPS远程自动化控制中心")
         self.root.geometry("1200x600")
         self.root.minsize(1000, 500)
-        
-        # 先初始化日志相关属性
-        self._log_update_timer = None
-        self._pending_logs = []
-        self._log_updating = False
-        self._freeze_ui = False
-        
-        # 配置相关初始化
-        self.config_file = "haps_config.json"
-        self.default_xactorscmd = "C:\\Synopsys\\protocomp-rtV-2024.09\\bin\\xactorscmd.bat"
-        
-        self.config = {
-            "mode": "local",  # 模式配置 local/ssh
-            "ssh_host": "192.168.1.1",
-            "ssh_port": 22,
-            "ssh_user": "admin",
-            "ssh_password": "",
-            "base_dir": "D:\\zxl_haps12\\mc8860\\mc20l\\mc20l_haps100_va_v2024",
-            "xactorscmd_path": self.default_xactorscmd,
-            "haps_control_path": "C:\\Synopsys\\tcl\\haps100control.bat",
-            "load_all_tcl": "C:\\Synopsys\\tcl\\load.tcl",
-            "load_master_tcl": "C:\\Synopsys\\tcl\\load_master.tcl",
-            "load_slave_tcl": "C:\\Synopsys\\tcl\\load_slave.tcl",
-            "reset_all_tcl": "C:\\Synopsys\\tcl\\reset.tcl",
-            "reset_master_tcl": "C:\\Synopsys\\tcl\\reset_master.tcl",
-            "reset_slave_tcl": "C:\\Synopsys\\tcl\\reset_slave.tcl",
-            "custom_commands": [""],
-            "default_tcl_path": "C:\\Synopsys\\tcl\\haps_control_default.tcl"
-        }
-        
+
+        # 先初始化日志管道：执行线程只入队，日志框创建后由主循环按节拍取出显示
+        self._log_pipeline = LogPipeline(root, self._render_logs, on_stats=self._show_log_stats)
+
         # log
         self.print_info()
-        
-        # 加载配置
-        self.load_config()
-        
-        # SSH连接状态
-        self.ssh_client = None
-        self.ssh_connected = False
-        
-        # 命令队列和执行状态
-        self.command_queue = Queue()
-        self.is_processing = False
-        
+
+        # 加载配置、板卡注册表和调度器；默认板卡需在连接配置页手动连接
+        super().__init__(auto_connect=False)
+
         # 主窗口布局
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_columnconfigure(0, weight=5)  # 操作区占5/6
@@ -952,11 +1128,15 @@ class HAPSAutomationGUI:
         self.automation_panel = AutomationPanel(self.notebook, self)
         self.ssh_panel = SSHConfigPanel(self.notebook, self)
         self.custom_commands_panel = CustomCommandsPanel(self.notebook, self)
+        self.log_search_panel = LogSearchPanel(self.notebook, self)
+        self.phase_stats_panel = PhaseStatsPanel(self.notebook, self)
         
         # 添加到标签页
         self.notebook.add(self.automation_panel, text="常规操作")
         self.notebook.add(self.ssh_panel, text="连接配置")
         self.notebook.add(self.custom_commands_panel, text="自定义命令")
+        self.notebook.add(self.log_search_panel, text="日志检索")
+        self.notebook.add(self.phase_stats_panel, text="阶段耗时")
         
         # 右侧日志区
         self.log_frame = ttk.LabelFrame(root, text="执行日志", padding="12")
@@ -972,6 +1152,10 @@ class HAPSAutomationGUI:
         clear_log_btn = ttk.Button(log_ctrl_frame, text="清空日志", command=self.clear_log)
         clear_log_btn.pack(side=tk.RIGHT, padx=5)
         
+        # 日志显示延迟（最早一行从产生到显示）和积压行数
+        self.log_stats_var = tk.StringVar(value="")
+        ttk.Label(log_ctrl_frame, textvariable=self.log_stats_var, foreground="gray").pack(side=tk.LEFT, padx=5)
+        
         # 日志文本框
         self.log_text = scrolledtext.ScrolledText(
             self.log_frame, 
@@ -983,6 +1167,16 @@ class HAPSAutomationGUI:
         )
         self.log_text.grid(row=1, column=0, sticky=tk.NSEW, pady=(0, 5))
         
+        # 日志框只保留一个视窗的行，全部日志写入历史文件，向上滚动时按页换入
+        try:
+            self.log_history = LogHistory(self.config.get("log_history_dir", ""),
+                                          keep=self.config.get("log_history_keep", 10))
+        except OSError as e:
+            self.log_history = None
+            self.sync_log(f"无法创建日志历史文件，日志框只保留最近的日志：{str(e)}")
+        self.log_view = LogView(self.log_text, self.log_history, capacity=self.config.get("log_view_lines", 2000))
+        self._log_pipeline.start()
+        
         # 底部状态栏
         self.status_bar = ttk.Label(root, text="就绪 - 本地模式", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.grid(row=1, column=0, columnspan=2, sticky=tk.EW, padx=10, pady=(0, 5))
@@ -993,683 +1187,23 @@ class HAPSAutomationGUI:
         # 初始更新状态栏
         self.update_status_bar()
 
-    # SSH连接逻辑
-    def connect_ssh(self):
-        try:
-            host = self.config["ssh_host"]
-            port = self.config["ssh_port"]
-            user = self.config["ssh_user"]
-            pwd = self.config["ssh_password"]
-            
-            if not host or not user:
-                self.sync_log("SSH连接失败：IP地址和用户名不能为空")
-                messagebox.showerror("参数错误", "IP地址和用户名不能为空")
-                return
-            
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.sync_log(f"正在连接SSH：{host}:{port}")
-            
-            self.ssh_client.connect(
-                hostname=host,
-                port=port,
-                username=user,
-                password=pwd,
-                timeout=15,
-                allow_agent=False,
-                look_for_keys=False
-            )
-            
-            # 验证连接
-            stdin, stdout, stderr = self.ssh_client.exec_command("echo HAPS_CONNECTED", timeout=5)
-            output_bytes = stdout.read()
-            error_bytes = stderr.read()
-            
-            output = self.process_data(output_bytes)
-            error = self.process_data(error_bytes)
-            
-            if error:
-                self.sync_log(f"连接验证错误: {error}")
-                
-            if "HAPS_CONNECTED" in output or "484150535f434f4e4e4543544544" in output:
-                self.ssh_connected = True
-                self.update_status_bar()
-                self.sync_log(f"SSH连接成功：{host}:{port}")
-                self.check_remote_paths()
-            else:
-                raise Exception(f"连接验证失败，响应：{output}")
-                
-        except AuthenticationException:
-            self.sync_log("SSH认证失败：用户名或密码错误")
-            messagebox.showerror("认证失败", "用户名或密码错误")
-        except SSHException as e:
-            self.sync_log(f"SSH协议错误：{str(e)}")
-            messagebox.showerror("SSH错误", f"协议错误：{str(e)}")
-        except Exception as e:
-            self.sync_log(f"SSH连接失败：{str(e)}")
-            messagebox.showerror("连接失败", f"无法连接：{str(e)}")
-        finally:
-            if not self.ssh_connected:
-                self.ssh_client = None
-                
-            self.root.event_generate("<<SSHStatusChanged>>", when="tail")
-
-    def disconnect_ssh(self):
-        if self.ssh_client:
-            try:
-                self.ssh_client.close()
-                self.sync_log("SSH连接已断开")
-            except Exception as e:
-                self.sync_log(f"断开SSH时出错：{str(e)}")
-        
-        self.ssh_connected = False
-        self.update_status_bar()
-        self.ssh_client = None
-        self.root.event_generate("<<SSHStatusChanged>>", when="tail")
-
-    def check_remote_paths(self):
-        """检查远程关键路径 - 优化Bitfile路径判断逻辑"""
-        base_dir = self.config.get("base_dir", "").strip()
-        
-        # 1. 检查Bitfile路径（只需要是目录即可）
-        if base_dir:
-            self.check_path(base_dir, "基础目录", is_directory=True)
-        
-        # 2. 检查其他文件路径
-        file_paths = [
-            (self.config["haps_control_path"], "haps100control.bat", False),
-            (self.config["xactorscmd_path"], "xactorscmd.bat", False),
-            (os.path.join(base_dir, "system", "targetsystem.tsd") if base_dir else "system\\targetsystem.tsd", "targetsystem.tsd", False),
-            (self.get_full_default_tcl_path(), "haps_control_default.tcl", False)
-        ]
-        
-        # 检查TCL脚本路径
-        tcl_paths = [
-            (self.config["load_all_tcl"], "Load All TCL", False),
-            (self.config["load_master_tcl"], "Load Master TCL", False),
-            (self.config["load_slave_tcl"], "Load Slave TCL", False),
-            (self.config["reset_all_tcl"], "Reset All TCL", False),
-            (self.config["reset_master_tcl"], "Reset Master TCL", False),
-            (self.config["reset_slave_tcl"], "Reset Slave TCL", False)
-        ]
-        
-        file_paths.extend(tcl_paths)
-        
-        # 检查所有文件路径
-        for path, desc, is_dir in file_paths:
-            if not path:
-                continue
-                
-            # 先检查原始路径
-            found, full_path = self.check_path(path, desc, is_dir, return_full_path=True)
-            
-            # 如果没找到，尝试用Bitfile路径拼接
-            if not found and base_dir and not os.path.isabs(path):
-                combined_path = os.path.join(base_dir, path).replace("/", "\\")
-                self.sync_log(f"尝试Bitfile路径拼接：{combined_path}")
-                self.check_path(combined_path, f"{desc} (Bitfile路径拼接)", is_dir)
-
-    def check_path(self, path, description, is_directory=False, return_full_path=False):
-        """检查路径是否存在"""
-        try:
-            # 处理路径格式
-            path = path.replace("/", "\\")
-            
-            # 构建检查命令
-            if is_directory:
-                # 目录检查：存在且是目录
-                cmd = f'if exist "{path}" (if exist "{path}\\*" (echo DIR_EXIST) else (echo NOT_DIR)) else (echo NOT_EXIST)'
-            else:
-                # 文件检查：存在且是文件
-                cmd = f'if exist "{path}" (if not exist "{path}\\*" (echo FILE_EXIST) else (echo IS_DIR)) else (echo NOT_EXIST)'
-            
-            stdin, stdout, stderr = self.ssh_client.exec_command(cmd, timeout=10)
-            output_bytes = stdout.read()
-            error_bytes = stderr.read()
-            
-            output = self.process_data(output_bytes).strip()
-            error = self.process_data(error_bytes)
-            
-            if error:
-                self.sync_log(f"[{description}] 检查错误：{error}")
-                return (False, path) if return_full_path else False
-            
-            # 处理检查结果
-            if is_directory:
-                if output == "DIR_EXIST" or "4449525f4558495354" in output:  # DIR_EXIST的十六进制
-                    self.sync_log(f"[{description}] 目录存在：{path}")
-                    return (True, path) if return_full_path else True
-                elif output == "NOT_DIR":
-                    self.sync_log(f"[{description}] 路径存在但不是目录：{path}")
-                    return (False, path) if return_full_path else False
-                else:
-                    self.sync_log(f"[{description}] 目录不存在：{path}")
-                    return (False, path) if return_full_path else False
-            else:
-                if output == "FILE_EXIST" or "46494C455F4558495354" in output:  # FILE_EXIST的十六进制
-                    self.sync_log(f"[{description}] 文件存在：{path}")
-                    return (True, path) if return_full_path else True
-                elif output == "IS_DIR":
-                    self.sync_log(f"[{description}] 路径存在但不是文件：{path}")
-                    return (False, path) if return_full_path else False
-                else:
-                    self.sync_log(f"[{description}] 文件不存在：{path}")
-                    return (False, path) if return_full_path else False
-                    
-        except Exception as e:
-            self.sync_log(f"[{description}] 检查失败：{str(e)}")
-            return (False, path) if return_full_path else False
-
-    # 命令执行逻辑
-    def queue_command(self, cmd_type):
-        """将预设命令加入队列"""
-        mode = self.config.get("mode", "local")
-        
-        if mode == "ssh" and not self.ssh_connected:
-            messagebox.showerror("未连接", "请先建立SSH连接")
-            return
-        
-        self.command_queue.put(('preset', cmd_type))
-        self.sync_log(f"预设命令[{cmd_type}]加入队列，当前队列：{self.command_queue.qsize()}")
-        
-        if not self.is_processing:
-            threading.Thread(target=self.process_command_queue, daemon=True).start()
-        
-        self.update_exec_status()
-
-    def queue_custom_command(self, cmd_text):
-        """将自定义命令加入队列"""
-        mode = self.config.get("mode", "local")
-        
-        if mode == "ssh" and not self.ssh_connected:
-            messagebox.showerror("未连接", "请先建立SSH连接")
-            return
-        
-        cmd_text = cmd_text.strip()
-        if not cmd_text:
-            messagebox.showwarning("命令为空", "请输入有效的命令")
-            return
-        
-        self.command_queue.put(('custom', cmd_text))
-        self.sync_log(f"自定义命令加入队列：{cmd_text}")
-        
-        if not self.is_processing:
-            threading.Thread(target=self.process_command_queue, daemon=True).start()
-        
-        self.update_exec_status()
-
-    def process_command_queue(self, *args):
-        """处理命令队列"""
-        self.is_processing = True
-        self.update_exec_status()
-        
-        try:
-            while not self.command_queue.empty():
-                cmd_type, cmd_content = self.command_queue.get()
-                try:
-                    if cmd_type == 'preset':
-                        self.sync_log(f"开始执行预设命令：{cmd_content}")
-                        self.run_haps_command(cmd_content)
-                    elif cmd_type == 'custom':
-                        self.sync_log(f"开始执行自定义命令：{cmd_content}")
-                        self.run_custom_tcl_command(cmd_content)
-                except Exception as e:
-                    self.sync_log(f"命令执行异常：{str(e)}")
-                finally:
-                    self.command_queue.task_done()
-                    self.update_exec_status()
-        finally:
-            self.is_processing = False
-            self.update_exec_status()
-            self.sync_log("队列所有命令执行完毕")
-
-    def get_full_default_tcl_path(self):
-        """获取完整的默认TCL文件路径"""
-        default_tcl_path = self.config.get("default_tcl_path", "tcl\\haps_control_default.tcl").strip()
-        base_dir = self.config.get("base_dir", "").strip()
-        
-        # 检查是否为绝对路径
-        if os.path.isabs(default_tcl_path) or (len(default_tcl_path) > 1 and default_tcl_path[1] == ':'):
-            return default_tcl_path
-        # 否则拼接Bitfile路径
-        if base_dir:
-            return os.path.join(base_dir, default_tcl_path).replace("/", "\\")
-        return default_tcl_path
-
-    def generate_temp_tcl_file(self, custom_command):
-        """生成临时TCL文件"""
-        try:
-            # 1. 获取路径信息
-            default_tcl_path = self.get_full_default_tcl_path()
-            base_dir = self.config.get("base_dir", "").strip()
-            temp_tcl_path = os.path.join(base_dir, "haps_control_tmp.tcl").replace("/", "\\") if base_dir else "haps_control_tmp.tcl"
-            
-            self.sync_log(f"默认TCL路径：{default_tcl_path}")
-            self.sync_log(f"临时TCL路径：{temp_tcl_path}")
-            
-            # 2. 读取默认TCL文件内容
-            self.sync_log("读取默认TCL文件内容...")
-            
-            mode = self.config.get("mode", "local")
-            if mode == "local":
-                # 本地模式：直接读取文件
-                with open(default_tcl_path, 'r', encoding='utf-8', errors='replace') as f:
-                    default_content = f.read()
-            else:
-                # SSH模式：通过命令读取
-                # 先检查文件是否存在，如果不存在尝试用Bitfile路径拼接
-                file_exists, full_path = self.check_path(default_tcl_path, "默认TCL文件", False, True)
-                
-                if not file_exists and base_dir and not os.path.isabs(default_tcl_path):
-                    self.sync_log(f"默认TCL文件不存在，尝试Bitfile路径拼接...")
-                    default_tcl_path = os.path.join(base_dir, default_tcl_path).replace("/", "\\")
-                    file_exists, full_path = self.check_path(default_tcl_path, "默认TCL文件(拼接后)", False, True)
-                
-                if not file_exists:
-                    raise Exception(f"默认TCL文件不存在：{default_tcl_path}")
-                
-                cat_cmd = f'type "{full_path}"'  # Windows系统使用type命令
-                stdin, stdout, stderr = self.ssh_client.exec_command(cat_cmd, timeout=30)
-                default_content_bytes = stdout.read()
-                error_bytes = stderr.read()
-                
-                error = self.process_data(error_bytes)
-                if error:
-                    raise Exception(f"读取默认TCL文件错误：{error}")
-                
-                # 处理内容编码
-                try:
-                    default_content = default_content_bytes.decode('gbk', errors='replace')
-                except:
-                    default_content = default_content_bytes.decode('utf-8', errors='replace')
-            
-            # 3. 构建临时文件内容
-            temp_content = f"{default_content}\n"  # 默认内容
-            temp_content += f"{custom_command}\n"  # 自定义命令
-            temp_content += "cfg_close $HAPS_HANDLE\n"  # 关闭句柄命令
-            
-            # 4. 写入临时文件
-            self.sync_log("生成临时TCL文件...")
-            if mode == "local":
-                # 本地模式：直接写入文件
-                with open(temp_tcl_path, 'w', encoding='utf-8') as f:
-                    f.write(temp_content)
-            else:
-                # SSH模式：使用SFTP写入
-                sftp = self.ssh_client.open_sftp()
-                
-                # 确保目录存在
-                temp_dir = os.path.dirname(temp_tcl_path)
-                if temp_dir:
-                    try:
-                        sftp.stat(temp_dir)
-                    except FileNotFoundError:
-                        self.sync_log(f"创建目录：{temp_dir}")
-                        # 递归创建目录的函数
-                        def mkdir_p(sftp, remote_directory):
-                            if remote_directory == '/':
-                                sftp.chdir('/')
-                                return
-                            if remote_directory == '':
-                                return
-                            try:
-                                sftp.stat(remote_directory)
-                            except FileNotFoundError:
-                                dirname, basename = os.path.split(remote_directory.rstrip('/'))
-                                mkdir_p(sftp, dirname)
-                                sftp.mkdir(basename)
-                                sftp.chdir(basename)
-                                return
-                        mkdir_p(sftp, temp_dir)
-                
-                # 写入文件内容
-                with sftp.file(temp_tcl_path, 'w') as f:
-                    # 确保使用正确的换行符
-                    f.write(temp_content.replace('\n', '\r\n'))
-                
-                sftp.close()
-            
-            self.sync_log(f"临时TCL文件生成成功：{temp_tcl_path}")
-            return temp_tcl_path
-            
-        except Exception as e:
-            self.sync_log(f"生成临时TCL文件失败：{str(e)}")
-            raise
-
-    def run_custom_tcl_command(self, custom_command):
-        """执行自定义命令"""
-        try:
-            # 1. 验证必要路径配置
-            haps_ctrl = self.config["haps_control_path"]
-            xactorscmd = self.config["xactorscmd_path"]
-            base_dir = self.config.get("base_dir", "").strip()
-            
-            if not haps_ctrl or not xactorscmd:
-                raise ValueError("haps100control和xactorscmd路径不能为空")
-            
-            # 处理haps_control路径
-            resolved_haps = self.resolve_path(haps_ctrl, base_dir)
-            # 处理xactorscmd路径
-            resolved_xactor = self.resolve_path(xactorscmd, base_dir)
-            
-            # 2. 生成临时TCL文件
-            temp_tcl_path = self.generate_temp_tcl_file(custom_command)
-            
-            # 3. 构建执行命令
-            mode = self.config.get("mode", "local")
-            
-            # 构建命令
-            if base_dir:
-                cmd = f'cd /d "{base_dir}" && call "{resolved_haps}" "{resolved_xactor}" "{temp_tcl_path}"'
-            else:
-                cmd = f'call "{resolved_haps}" "{resolved_xactor}" "{temp_tcl_path}"'
-            
-            self.sync_log(f"执行命令：{cmd}")
-            
-            # 4. 执行命令
-            if mode == "local":
-                # 本地模式：使用subprocess执行
-                import subprocess
-                import shlex
-                
-                try:
-                    # 执行命令
-                    process = subprocess.Popen(
-                        cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding='gbk',
-                        errors='replace'
-                    )
-                    
-                    # 实时输出
-                    for line in process.stdout:
-                        self.sync_log(f"输出：{line.rstrip()}")
-                    
-                    # 等待完成
-                    return_code = process.wait()
-                    
-                    if return_code == 0:
-                        self.sync_log(f"自定义命令执行成功，返回码：{return_code}")
-                        return True, f"返回码{return_code}"
-                    else:
-                        self.sync_log(f"自定义命令执行失败，返回码：{return_code}")
-                        return False, f"返回码{return_code}"
-                        
-                except Exception as e:
-                    return False, str(e)
-            else:
-                # SSH模式：使用SSH执行
-                success, msg = self.run_remote_command(cmd)[:2]
-                if success:
-                    self.sync_log(f"自定义命令执行成功：{msg}")
-                else:
-                    self.sync_log(f"自定义命令执行失败：{msg}")
-                    messagebox.showerror("执行失败", f"自定义命令失败：{msg}")
-                return success, msg
-                
-        except ValueError as e:
-            self.sync_log(f"参数错误：{str(e)}")
-            messagebox.showerror("参数错误", str(e))
-            return False, str(e)
-        except Exception as e:
-            self.sync_log(f"自定义命令执行异常：{str(e)}")
-            messagebox.showerror("执行异常", str(e))
-            return False, str(e)
-
-    def run_haps_command(self, cmd_type):
-        """执行HAPS预设命令"""
-        try:
-            haps_ctrl = self.config["haps_control_path"]
-            xactorscmd = self.config["xactorscmd_path"]
-            base_dir = self.config["base_dir"]
-            mode = self.config.get("mode", "local")
-            
-            if not haps_ctrl or not xactorscmd:
-                raise ValueError("haps100control和xactorscmd路径不能为空")
-            
-            tcl_map = {
-                "load_all": self.config["load_all_tcl"],
-                "load_master": self.config["load_master_tcl"],
-                "load_slave": self.config["load_slave_tcl"],
-                "reset_all": self.config["reset_all_tcl"],
-                "reset_master": self.config["reset_master_tcl"],
-                "reset_slave": self.config["reset_slave_tcl"]
-            }
-            tcl_script = tcl_map[cmd_type]
-            
-            # 处理路径：先检查原始路径，找不到则尝试用Bitfile路径拼接
-            resolved_tcl = self.resolve_path(tcl_script, base_dir)
-            if not resolved_tcl:
-                raise ValueError(f"找不到{cmd_type}的TCL脚本：{tcl_script}")
-            
-            # 处理haps_control路径
-            resolved_haps = self.resolve_path(haps_ctrl, base_dir)
-            # 处理xactorscmd路径
-            resolved_xactor = self.resolve_path(xactorscmd, base_dir)
-            
-            # 构建命令
-            if base_dir:
-                cmd = f'cd /d "{base_dir}" && call "{resolved_haps}" "{resolved_xactor}" "{resolved_tcl}"'
-            else:
-                cmd = f'call "{resolved_haps}" "{resolved_xactor}" "{resolved_tcl}"'
-            
-            self.sync_log(f"构建命令：{cmd}")
-            
-            # 执行命令
-            if mode == "local":
-                # 本地模式：使用subprocess执行
-                import subprocess
-                
-                try:
-                    # 执行命令
-                    process = subprocess.Popen(
-                        cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding='gbk',
-                        errors='replace'
-                    )
-                    
-                    # 实时输出
-                    for line in process.stdout:
-                        self.sync_log(f"输出：{line.rstrip()}")
-                    
-                    # 等待完成
-                    return_code = process.wait()
-                    
-                    if return_code == 0:
-                        self.sync_log(f"预设命令[{cmd_type}]执行成功，返回码：{return_code}")
-                        return True, f"返回码{return_code}"
-                    else:
-                        self.sync_log(f"预设命令[{cmd_type}]执行失败，返回码：{return_code}")
-                        messagebox.showerror("执行失败", f"{cmd_type}命令失败，返回码：{return_code}")
-                        return False, f"返回码{return_code}"
-                        
-                except Exception as e:
-                    error_msg = str(e)
-                    self.sync_log(f"预设命令[{cmd_type}]执行异常：{error_msg}")
-                    messagebox.showerror("执行异常", error_msg)
-                    return False, error_msg
-            else:
-                # SSH模式：使用SSH执行
-                success, msg = self.run_remote_command(cmd)[:2]
-                if success:
-                    self.sync_log(f"预设命令[{cmd_type}]执行成功：{msg}")
-                else:
-                    self.sync_log(f"预设命令[{cmd_type}]执行失败：{msg}")
-                    messagebox.showerror("执行失败", f"{cmd_type}命令失败：{msg}")
-                return success, msg
-                
-        except ValueError as e:
-            self.sync_log(f"参数错误：{str(e)}")
-            messagebox.showerror("参数错误", str(e))
-            return False, str(e)
-        except Exception as e:
-            self.sync_log(f"HAPS命令执行异常：{str(e)}")
-            messagebox.showerror("执行异常", str(e))
-            return False, str(e)
-
-    def resolve_path(self, path, base_dir):
-        """解析路径：如果路径不存在，尝试用Bitfile路径拼接"""
-        if not path:
-            return None
-            
-        mode = self.config.get("mode", "local")
-        resolved_path = path
-        
-        # 检查路径是否存在
-        if mode == "local":
-            # 本地模式检查
-            if not os.path.exists(resolved_path):
-                # 尝试用Bitfile路径拼接
-                if base_dir and not os.path.isabs(resolved_path):
-                    combined_path = os.path.join(base_dir, resolved_path)
-                    if os.path.exists(combined_path):
-                        self.sync_log(f"路径不存在，使用Bitfile路径拼接：{combined_path}")
-                        resolved_path = combined_path
-                    else:
-                        self.sync_log(f"路径不存在：{resolved_path} 和 {combined_path}")
-                        return None
-                else:
-                    self.sync_log(f"路径不存在：{resolved_path}")
-                    return None
-        else:
-            # SSH模式检查
-            if not self.ssh_connected:
-                return resolved_path
-                
-            # 先检查原始路径
-            exists, full_path = self.check_path(resolved_path, "路径解析", False, True)
-            
-            # 如果不存在，尝试用Bitfile路径拼接
-            if not exists and base_dir and not os.path.isabs(resolved_path):
-                combined_path = os.path.join(base_dir, resolved_path).replace("/", "\\")
-                exists, full_path = self.check_path(combined_path, "路径解析(拼接后)", False, True)
-                if exists:
-                    self.sync_log(f"路径不存在，使用Bitfile路径拼接：{combined_path}")
-                    resolved_path = combined_path
-                else:
-                    self.sync_log(f"路径不存在：{resolved_path} 和 {combined_path}")
-                    return None
-            elif not exists:
-                self.sync_log(f"路径不存在：{resolved_path}")
-                return None
-                
-        return resolved_path
-
-    def run_remote_command(self, cmd):
-        """执行远程命令（SSH模式）"""
-        try:
-            # 执行命令时指定终端类型，避免某些服务器默认编码问题
-            channel = self.ssh_client.get_transport().open_session()
-            channel.set_combine_stderr(True)  # 合并stderr到stdout
-            channel.exec_command(cmd)
-            
-            output = []
-            
-            # 直接读取原始字节流，使用GBK解码
-            def read_stream():
-                while True:
-                    data = channel.recv(1024)
-                    if not data:
-                        break
-                    # 强制使用GBK解码
-                    try:
-                        processed = data.decode('gbk', errors='replace')
-                    except:
-                        processed = data.decode('latin-1')
-                    output.append(processed)
-                    self.sync_log(f"输出：{processed.rstrip('\r\n')}")
-            
-            # 启动线程读取流
-            read_thread = threading.Thread(target=read_stream, daemon=True)
-            read_thread.start()
-            read_thread.join()
-            
-            # 等待命令完成
-            return_code = channel.recv_exit_status()
-            full_output = "".join(output)
-            
-            if return_code == 0:
-                return True, f"返回码0，输出：{full_output}", return_code, full_output
-            else:
-                return False, f"返回码{return_code}，错误：{full_output}", return_code, full_output
-                
-        except Exception as e:
-            return False, str(e), -1, ""
-
-    def process_data(self, data):
-        """处理数据编码"""
-        if isinstance(data, str):
-            return data.rstrip('\r\n')
-            
-        if isinstance(data, bytes):
-            # 强制使用GBK解码
-            try:
-                return data.decode('gbk', errors='replace').rstrip('\r\n')
-            except:
-                return data.decode('latin-1').rstrip('\r\n')
-            
-        return str(data)
-
     # 工具方法
     def sync_log(self, message):
-        """同步更新日志"""
-        if self._freeze_ui:
-            return
-            
-        self._pending_logs.append(message)
-        
-        if not self._log_update_timer and not self._log_updating:
-            self._log_update_timer = self.root.after(150, self._flush_logs)
+        """记录日志（任意线程可调用，只入队，由主循环显示）"""
+        self._log_pipeline.push(message)
     
-    def _flush_logs(self):
-        """批量刷新日志到UI"""
-        self._log_updating = True
-        
-        try:
-            if not self._pending_logs:
-                return
-                
-            self.log_text.config(state=tk.NORMAL)
-            timestamp = time.strftime("%H:%M:%S")
-            for message in self._pending_logs:
-                self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
-            
-            self._pending_logs = []
-        finally:
-            self._log_update_timer = None
-            self._log_updating = False
+    def _render_logs(self, lines):
+        """主循环中把一批日志写入日志视图"""
+        self.log_view.append(lines)
+
+    def _show_log_stats(self, stats):
+        self.log_stats_var.set(f"日志延迟 {stats['max_lag_ms']}ms  积压 {stats['backlog']}")
 
     def clear_log(self):
-        """清空日志"""
-        self._freeze_ui = True
-        
-        try:
-            if self._log_update_timer:
-                self.root.after_cancel(self._log_update_timer)
-                self._log_update_timer = None
-            
-            self.log_text.config(state=tk.NORMAL)
-            self.log_text.delete(1.0, tk.END)
-            self.log_text.config(state=tk.DISABLED)
-            
-            self.log_text.config(state=tk.NORMAL)
-            timestamp = time.strftime("%H:%M:%S")
-            self.log_text.insert(tk.END, f"[{timestamp}] 日志已清空\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
-            
-            self._pending_logs = []
-        finally:
-            self._freeze_ui = False
+        """清空日志（包括尚未显示的日志）"""
+        self._log_pipeline.clear()
+        self.log_view.clear()
+        self.sync_log("日志已清空")
 
     def print_info(self):
         self.sync_log(r"使用说明：")
@@ -1681,38 +1215,6 @@ class HAPSAutomationGUI:
         self.sync_log(r"https://github.com/YuZane/Haps100Contrl/")
         self.sync_log("")
 
-    def load_config(self):
-        """加载配置"""
-        try:
-            if os.path.exists(self.config_file):
-                try:
-                    with open(self.config_file, 'r', encoding='utf-8') as f:
-                        loaded_config = json.load(f)
-                        for key in self.config:
-                            if key in loaded_config:
-                                self.config[key] = loaded_config[key]
-                    
-                    self.sync_log("配置文件加载成功")
-                except Exception as e:
-                    self.sync_log(f"加载配置失败：{str(e)}")
-                    self.save_config()
-            else:
-                self.save_config()
-                self.sync_log("配置文件不存在，已创建默认配置")
-        finally:
-            pass
-
-    def save_config(self):
-        """保存配置"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
-            self.sync_log("配置已保存")
-        except Exception as e:
-            error_msg = f"保存配置失败：{str(e)}"
-            self.sync_log(error_msg)
-            messagebox.showerror("保存失败", error_msg)
-
     def update_exec_status(self):
         """更新执行状态"""
         self.root.event_generate("<<ExecutionStatusChanged>>", when="tail")
@@ -1722,39 +1224,49 @@ class HAPSAutomationGUI:
         """更新状态栏"""
         mode = self.config.get("mode", "local")
         if mode == "ssh":
-            if self.ssh_connected:
-                self.status_bar.config(text=f"SSH已连接 - {self.config['ssh_host']}")
+            if self.ssh_connected and self.ssh_client is not None:
+                stats = self.ssh_client.stats()
+                state = "SSH已连接" if self.ssh_client.connected else "SSH重连中"
+                self.status_bar.config(
+                    text=f"{state} - {self.config['ssh_host']}（连接耗时：{stats['connect_latency_ms']}ms，"
+                         f"重连：{stats['reconnects']}次，活动通道：{stats['active_channels']}）"
+                )
             else:
                 self.status_bar.config(text="SSH未连接")
         else:
-            if self.is_processing:
-                queue_size = self.command_queue.qsize()
-                self.status_bar.config(text=f"本地模式 - 执行中，剩余：{queue_size}")
+            pending, running = self.scheduler.depth("default")
+            if running:
+                self.status_bar.config(text=f"本地模式 - 执行中，剩余：{pending}")
             else:
                 self.status_bar.config(text="本地模式 - 就绪")
 
+    def notify_ssh_status(self):
+        """SSH连接状态变化：刷新状态栏并通知连接配置页"""
+        self.update_status_bar()
+        self.root.event_generate("<<SSHStatusChanged>>", when="tail")
+
+    def report_error(self, title, message, level="error"):
+        """弹窗提示错误或警告"""
+        if level == "warning":
+            messagebox.showwarning(title, message)
+        else:
+            messagebox.showerror(title, message)
+
     def clear_command_queue(self):
-        """清空命令队列"""
+        """清空所有板卡等待中的命令（正在执行的命令不受影响）"""
         try:
-            while not self.command_queue.empty():
-                self.command_queue.get()
-                self.command_queue.task_done()
-            
-            self.log_text.config(state=tk.NORMAL)
-            timestamp = time.strftime("%H:%M:%S")
-            self.log_text.insert(tk.END, f"[{timestamp}] 命令队列已清空\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
-            
-            self.is_processing = False
+            removed = self.scheduler.clear()
+            self.sync_log(f"命令队列已清空（移除{removed}条）")
             self.update_exec_status()
         finally:
             pass
             
     def on_close(self):
         """关闭主窗口时的处理"""
-        if self.ssh_connected:
-            self.disconnect_ssh()
+        self._log_pipeline.stop()
+        if self.log_history is not None:
+            self.log_history.close()
+        self.shutdown()
         self.root.destroy()
 
 if __name__ == "__main__":
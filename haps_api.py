@@ -0,0 +1,346 @@
+"""HAPS任务接口 - 本机HTTP/JSON-RPC服务，提交、查询、取消任务并以分块传输流式输出
+
+    POST /jobs                  提交任务：{"kind", "content", "board", "idempotent", "urgent", "if_changed"}、
+                                {"campaign": 流程名, "board"}，或 {"jobs": [以上任意项, ...]} 批量提交
+                                批量提交先校验全部任务，任一项不合法时不提交任何任务
+    GET  /jobs                  最近提交的任务
+    GET  /jobs/<id>             任务状态
+    POST /jobs/<id>/cancel      取消任务
+    GET  /jobs/<id>/output      输出流（chunked，每行一个JSON：line/dropped/end）
+    GET  /status                各板卡队列深度
+    GET  /phases                加载/复位各阶段耗时的p50/p95（可加?board=X&command=load_all）
+    POST /rpc                   JSON-RPC 2.0：submit/jobs/job/cancel/status/phases，参数同上
+
+每个输出订阅者有独立的有界缓冲，执行线程只做非阻塞投递；消费过慢时丢弃最旧的行并在流中
+报告丢弃数，慢客户端不会拖住命令执行。
+"""
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty, Full
+from haps_engine import PRESET_TARGETS
+
+class ApiError(Exception):
+    """请求错误，status为HTTP状态码；jobs为出错前已提交的任务摘要（批量提交时）"""
+    def __init__(self, status, message, jobs=None):
+        super().__init__(message)
+        self.status = status
+        self.jobs = jobs
+
+class OutputSubscriber:
+    """一个输出流消费者的有界缓冲"""
+    def __init__(self, maxsize):
+        self.queue = Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, item):
+        """非阻塞投递；缓冲已满时丢弃最旧的一行"""
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except Empty:
+                    pass
+
+class JobOutputHub:
+    """记录经接口提交的任务，并把任务输出分发给订阅者
+
+    每个任务保留最近history行，新订阅者先收到这些行再接收实时输出。
+    """
+    def __init__(self, buffer_size=1000, history=200, max_jobs=1000):
+        self.buffer_size = buffer_size
+        self.history = history
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # 任务编号 -> (任务, 最近输出, 订阅者列表)
+        self._lock = threading.Lock()
+
+    def track(self, job):
+        with self._lock:
+            self._entry(job)
+
+    def _entry(self, job):
+        """任务的记录，不存在时创建（需持有锁）；任务可能在登记前就已开始输出"""
+        item = self._jobs.get(job.id)
+        if item is None:
+            item = self._jobs[job.id] = (job, deque(maxlen=self.history), [])
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return item
+
+    def get(self, job_id):
+        with self._lock:
+            item = self._jobs.get(job_id)
+        return item[0] if item else None
+
+    def jobs(self):
+        with self._lock:
+            return [item[0] for item in self._jobs.values()]
+
+    def publish(self, job, line):
+        """任务输出回调（在执行线程中调用，不阻塞）"""
+        with self._lock:
+            item = self._entry(job)
+            item[1].append(line)
+            subscribers = list(item[2])
+        for subscriber in subscribers:
+            subscriber.offer(line)
+
+    def subscribe(self, job_id):
+        """订阅任务输出，返回(任务, 订阅者)；订阅者先收到最近的输出"""
+        subscriber = OutputSubscriber(self.buffer_size)
+        with self._lock:
+            item = self._jobs.get(job_id)
+            if item is None:
+                return None, None
+            for line in item[1]:
+                subscriber.offer(line)
+            item[2].append(subscriber)
+        return item[0], subscriber
+
+    def unsubscribe(self, job_id, subscriber):
+        with self._lock:
+            item = self._jobs.get(job_id)
+            if item is not None and subscriber in item[2]:
+                item[2].remove(subscriber)
+
+class JobApiServer(ThreadingHTTPServer):
+    """在HapsEngine之上提供HTTP/JSON-RPC任务接口"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, engine, host="127.0.0.1", port=47101, buffer_size=1000, log=print):
+        self.engine = engine
+        self.log = log
+        self.hub = JobOutputHub(buffer_size)
+        super().__init__((host, port), JobApiHandler)
+
+    def start(self):
+        """在后台线程中运行服务"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        self.log(f"任务接口已启动：http://{self.server_address[0]}:{self.server_address[1]}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # 接口方法（REST和JSON-RPC共用）
+    def submit(self, params):
+        """提交一个或一批任务，返回任务摘要列表
+
+        先校验全部任务再提交，任何一项不合法时不提交任何任务；校验通过后仍提交失败时，
+        错误中带上已提交任务的摘要，客户端可以据此查询或取消。
+        """
+        if isinstance(params, dict) and "jobs" in params:
+            items = params["jobs"]
+        else:
+            items = [params]
+        if not isinstance(items, list) or not items:
+            raise ApiError(400, "缺少任务")
+        for item in items:
+            self.validate(item)
+
+        jobs = []
+        for item in items:
+            board = item.get("board") or "default"
+            if item.get("campaign"):
+                submitted = self.engine.submit_campaign(item["campaign"], board, on_output=self.hub.publish)
+            else:
+                submitted = self.engine.submit_job(item.get("kind", "preset"), str(item["content"]).strip(), board,
+                                                   idempotent=bool(item.get("idempotent")),
+                                                   urgent=bool(item.get("urgent")), on_output=self.hub.publish,
+                                                   if_changed=bool(item.get("if_changed")))
+            if not submitted:
+                raise ApiError(500, f"任务提交失败：{item}", [job.summary() for job in jobs])
+            for job in submitted:
+                self.hub.track(job)
+            jobs.extend(submitted)
+        return [job.summary() for job in jobs]
+
+    def validate(self, item):
+        """校验一项任务，不合法时抛出ApiError(400)"""
+        if not isinstance(item, dict):
+            raise ApiError(400, "任务格式错误")
+        try:
+            self.engine.target_boards(item.get("board") or "default")
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        if item.get("campaign"):
+            if item["campaign"] not in self.engine.config.get("campaigns", {}):
+                raise ApiError(400, f"未定义的流程：{item['campaign']}")
+            return
+        kind, content = item.get("kind", "preset"), str(item.get("content", "")).strip()
+        if kind not in ("preset", "custom", "script") or not content:
+            raise ApiError(400, "kind须为preset/custom/script且content不能为空")
+        if kind == "preset" and content not in PRESET_TARGETS:
+            raise ApiError(400, f"未知的预设命令：{content}")
+
+    def job(self, job_id):
+        job = self.hub.get(job_id)
+        if job is None:
+            raise ApiError(404, f"未知的任务：{job_id}")
+        return job.summary()
+
+    def cancel(self, job_id):
+        job = self.hub.get(job_id)
+        if job is None:
+            raise ApiError(404, f"未知的任务：{job_id}")
+        return {"cancelled": self.engine.scheduler.cancel(job_id=job.id)}
+
+    def status(self):
+        summary, busy = self.engine.queue_summary()
+        depths = {name: {"pending": pending, "running": running}
+                  for name, (pending, running) in self.engine.scheduler.depths().items()}
+        return {"summary": summary, "busy": busy, "boards": depths}
+
+    def phases(self, params):
+        return self.engine.phase_summary(params.get("board") or None, params.get("command") or None)
+
+    def rpc(self, request):
+        """处理一条JSON-RPC 2.0请求"""
+        if not isinstance(request, dict):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "请求须为JSON对象"}}
+        method, params = request.get("method"), request.get("params")
+        params = {} if params is None else params
+        methods = {
+            "submit": lambda: self.submit(params),
+            "jobs": lambda: [job.summary() for job in self.hub.jobs()],
+            "job": lambda: self.job(int(params.get("id", 0))),
+            "cancel": lambda: self.cancel(int(params.get("id", 0))),
+            "status": self.status,
+            "phases": lambda: self.phases(params)
+        }
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if not isinstance(method, str) or method not in methods:
+            response["error"] = {"code": -32601, "message": f"未知的方法：{method}"}
+            return response
+        if not isinstance(params, dict):
+            response["error"] = {"code": -32602, "message": "params须为JSON对象"}
+            return response
+        try:
+            response["result"] = methods[method]()
+        except ApiError as e:
+            response["error"] = {"code": -32602 if e.status == 400 else -32000, "message": str(e)}
+            if e.jobs is not None:
+                response["error"]["data"] = {"jobs": e.jobs}
+        except (TypeError, ValueError) as e:
+            response["error"] = {"code": -32602, "message": str(e)}
+        return response
+
+class JobApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "HapsApi/1.0"
+
+    def do_GET(self):
+        parts = self.path_parts()
+        try:
+            if parts == ["status"]:
+                return self.send_json(200, self.server.status())
+            if parts == ["phases"]:
+                query = {key: values[-1] for key, values in parse_qs(urlsplit(self.path).query).items()}
+                return self.send_json(200, self.server.phases(query))
+            if parts == ["jobs"]:
+                return self.send_json(200, [job.summary() for job in self.server.hub.jobs()])
+            if len(parts) == 2 and parts[0] == "jobs":
+                return self.send_json(200, self.server.job(self.job_id(parts[1])))
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "output":
+                return self.stream_output(self.job_id(parts[1]))
+            raise ApiError(404, f"未知的路径：{self.path}")
+        except ApiError as e:
+            self.send_json(e.status, {"error": str(e)})
+
+    def do_POST(self):
+        parts = self.path_parts()
+        try:
+            body = self.read_json()
+            if parts == ["jobs"]:
+                return self.send_json(201, {"jobs": self.server.submit(body)})
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                return self.send_json(200, self.server.cancel(self.job_id(parts[1])))
+            if parts == ["rpc"]:
+                if isinstance(body, list):
+                    if not body:
+                        return self.send_json(200, self.server.rpc(body))
+                    return self.send_json(200, [self.server.rpc(item) for item in body])
+                return self.send_json(200, self.server.rpc(body))
+            raise ApiError(404, f"未知的路径：{self.path}")
+        except ApiError as e:
+            self.send_json(e.status, {"error": str(e)} if e.jobs is None else {"error": str(e), "jobs": e.jobs})
+
+    def path_parts(self):
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    @staticmethod
+    def job_id(text):
+        if not text.isdigit():
+            raise ApiError(400, f"任务编号错误：{text}")
+        return int(text)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            raise ApiError(400, "请求体不是有效的JSON")
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_output(self, job_id):
+        """分块传输任务输出，直到任务结束；客户端断开时取消订阅"""
+        job, subscriber = self.server.hub.subscribe(job_id)
+        if job is None:
+            raise ApiError(404, f"未知的任务：{job_id}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        reported = 0
+        try:
+            while True:
+                finished = job.wait(0) is not None
+                lines = []
+                try:
+                    lines.append(subscriber.queue.get(timeout=0.5))
+                    while len(lines) < 500:
+                        lines.append(subscriber.queue.get_nowait())
+                except Empty:
+                    pass
+                events = []
+                if subscriber.dropped != reported:
+                    events.append({"dropped": subscriber.dropped - reported})
+                    reported = subscriber.dropped
+                events.extend({"line": line} for line in lines)
+                if finished and not lines:
+                    events.append({"end": job.summary()})
+                if events:
+                    self.write_chunk("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events))
+                if finished and not lines:
+                    break
+            self.write_chunk("")
+        except OSError:
+            pass
+        finally:
+            self.server.hub.unsubscribe(job_id, subscriber)
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,388 @@
+"""haps命令行 - 不启动图形界面执行加载、复位、自定义命令和TCL脚本
+
+    haps load master --board X      加载（all/master/slave），--if-changed时设计未变化则跳过
+    haps reset all                  复位（all/master/slave）
+    haps run-tcl tcl\\my.tcl         通过haps100control.bat执行TCL脚本
+    haps custom "cfg_scan"          执行自定义命令（自动加上默认TCL的打开/关闭句柄）
+    haps campaign 加载并复位         按配置中的流程提交一组任务
+    haps manifest --board X         列出Bitfile路径下全部bit文件的SHA1（只重新计算变化过的文件）
+    haps search "FB1_C NOT configured" --board X --command load --since 2026-10-01
+                                    检索历史运行日志的输出（直接读索引，不经过守护进程）
+    haps phases --board X --command load_all
+                                    各板卡加载/复位各阶段耗时的p50/p95（直接读记录文件）
+    haps status / cancel / stop     查询、终止守护进程中的任务，停止守护进程
+    haps daemon                     启动守护进程，在多次调用之间保持SSH连接和常驻会话，
+                                    并按配置的api_port提供HTTP任务接口（见haps_api.py）
+
+守护进程运行时命令交给它执行，否则在本进程内创建HapsEngine执行。连接守护进程只使用标准库，
+haps_engine（以及paramiko）只在本进程执行或启动守护进程时才导入，命令行启动很快。
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_PORT = 47100
+ALL_BOARDS = "全部"
+EXIT_OK, EXIT_FAILED, EXIT_ERROR = 0, 1, 2
+
+def read_port(config_file):
+    """从配置文件读取守护进程端口，不加载引擎"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return int(json.load(f).get("daemon_port", DEFAULT_PORT))
+    except (OSError, ValueError, TypeError):
+        return DEFAULT_PORT
+
+def build_request(args):
+    """把命令行参数转换为请求"""
+    board = getattr(args, "board", None)
+    board = ALL_BOARDS if board in ("all", ALL_BOARDS) else board
+    if args.command in ("load", "reset"):
+        return {"action": "submit", "kind": "preset", "content": f"{args.command}_{args.target}",
+                "board": board, "urgent": args.urgent, "if_changed": getattr(args, "if_changed", False)}
+    if args.command == "run-tcl":
+        return {"action": "submit", "kind": "script", "content": args.file, "board": board, "urgent": args.urgent}
+    if args.command == "custom":
+        return {"action": "submit", "kind": "custom", "content": args.text.replace("\\n", "\n"),
+                "board": board, "urgent": args.urgent, "idempotent": args.idempotent}
+    if args.command == "campaign":
+        return {"action": "campaign", "name": args.name, "board": board}
+    if args.command == "cancel":
+        return {"action": "cancel", "board": board, "job_id": args.job}
+    if args.command == "manifest":
+        return {"action": "manifest", "board": board}
+    return {"action": args.command}
+
+class RequestRunner:
+    """在引擎上执行一个请求，通过emit逐条输出事件（守护进程和本进程执行共用）"""
+    def __init__(self, engine, emit):
+        self.engine = engine
+        self.emit = emit
+        self.events = queue.Queue()
+
+    def run(self, request):
+        action = request.get("action")
+        if action in ("submit", "campaign"):
+            return self.submit(request)
+        if action == "status":
+            summary, busy = self.engine.queue_summary()
+            self.emit({"event": "result", "summary": summary or "队列空闲", "busy": busy})
+        elif action == "cancel":
+            count = self.engine.scheduler.cancel(job_id=request.get("job_id"), board=self.board_filter(request))
+            self.emit({"event": "result", "summary": f"已取消{count}条任务"})
+        elif action == "manifest":
+            return self.manifest(request)
+        else:
+            self.emit({"event": "error", "message": f"未知的请求：{action}"})
+        return EXIT_OK
+
+    @staticmethod
+    def board_filter(request):
+        board = request.get("board")
+        return None if board in (None, ALL_BOARDS) else board
+
+    def manifest(self, request):
+        """计算板卡Bitfile路径下全部bit文件的SHA1"""
+        board = self.engine.boards.get(request.get("board") or "default")
+        if board is None:
+            self.emit({"event": "error", "message": f"未注册的板卡：{request.get('board')}"})
+            return EXIT_ERROR
+        try:
+            self.engine.ensure_board_connected(board)
+            files = self.engine.bit_manifest_of(board)
+        except Exception as e:
+            self.emit({"event": "error", "message": f"计算bit文件清单失败：{str(e)}"})
+            return EXIT_ERROR
+        self.emit({"event": "result", "summary": f"[{board.name}] {len(files)}个bit文件",
+                   "files": sorted(files.items())})
+        return EXIT_OK
+
+    def submit(self, request):
+        """提交任务，转发命令输出直到所有任务结束；返回退出码"""
+        board = request.get("board") or "default"
+        try:
+            self.engine.target_boards(board)
+        except ValueError as e:
+            self.emit({"event": "error", "message": str(e)})
+            return EXIT_ERROR
+
+        on_output = lambda job, line: self.events.put({"event": "output", "job": job.id, "board": job.board, "line": line})
+        if request["action"] == "campaign":
+            jobs = self.engine.submit_campaign(request.get("name", ""), board, on_output=on_output)
+        else:
+            jobs = self.engine.submit_job(request["kind"], request["content"], board,
+                                          idempotent=request.get("idempotent", False),
+                                          urgent=request.get("urgent", False), on_output=on_output,
+                                          if_changed=request.get("if_changed", False))
+        if not jobs:
+            self.emit({"event": "error", "message": "没有提交任何任务"})
+            return EXIT_ERROR
+        for job in jobs:
+            self.emit({"event": "queued", "job": job.summary()})
+
+        try:
+            pending = list(jobs)
+            while pending:
+                try:
+                    self.emit(self.events.get(timeout=0.2))
+                except queue.Empty:
+                    pass
+                pending = [job for job in pending if job.wait(0) is None]
+            while not self.events.empty():
+                self.emit(self.events.get())
+        except (OSError, KeyboardInterrupt):
+            # 客户端断开或按下Ctrl+C：终止本次提交的任务
+            for job in jobs:
+                self.engine.scheduler.cancel(job_id=job.id)
+            raise
+
+        summaries = [job.summary() for job in jobs]
+        self.emit({"event": "result", "jobs": summaries})
+        return EXIT_OK if all(item["state"] in ("done", "merged") for item in summaries) else EXIT_FAILED
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """守护进程连接：读取一行JSON请求，按行返回JSON事件"""
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError:
+            return
+        write_lock = threading.Lock()
+
+        def emit(event):
+            data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            with write_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+
+        if request.get("action") == "stop":
+            emit({"event": "result", "summary": "守护进程正在停止"})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        try:
+            RequestRunner(self.server.engine, emit).run(request)
+        except OSError:
+            pass
+
+class DaemonServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, engine, port):
+        self.engine = engine
+        super().__init__(("127.0.0.1", port), DaemonHandler)
+
+def run_daemon(config_file, port):
+    """启动守护进程：预先连接SSH板卡，之后保持连接和常驻会话直到收到stop"""
+    from haps_engine import HapsEngine
+    engine = HapsEngine(config_file)
+    port = port or int(engine.config.get("daemon_port", DEFAULT_PORT))
+    for board in engine.boards.values():
+        try:
+            engine.ensure_board_connected(board)
+        except Exception as e:
+            engine.sync_log(f"[{board.name}] 预连接失败，将在首次执行任务时重试：{str(e)}")
+
+    server = DaemonServer(engine, port)
+    engine.sync_log(f"haps守护进程已启动：127.0.0.1:{port}")
+    api = None
+    if engine.config.get("api_port"):
+        from haps_api import JobApiServer
+        api = JobApiServer(engine, engine.config.get("api_host", "127.0.0.1"), int(engine.config["api_port"]),
+                           buffer_size=int(engine.config.get("api_stream_buffer", 1000)),
+                           log=engine.sync_log).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if api is not None:
+            api.stop()
+        server.server_close()
+        engine.scheduler.cancel()
+        engine.shutdown()
+        engine.sync_log("haps守护进程已停止")
+    return EXIT_OK
+
+def print_event(event):
+    """在终端输出一条事件"""
+    kind = event.get("event")
+    if kind == "output":
+        print(f"[{event['board']}#{event['job']}] {event['line']}", flush=True)
+    elif kind == "queued":
+        job = event["job"]
+        note = f"（与#{job['merged_into']}合并）" if job["merged_into"] else ""
+        print(f"已提交 #{job['id']} {job['kind']}[{job['content']}]@{job['board']}{note}", flush=True)
+    elif kind == "error":
+        print(f"错误：{event['message']}", file=sys.stderr, flush=True)
+    elif kind == "result":
+        if event.get("summary"):
+            print(event["summary"], flush=True)
+        for path, sha1 in event.get("files", []):
+            print(f"{sha1}  {path}", flush=True)
+        for job in event.get("jobs", []):
+            print(f"#{job['id']} {job['content']}@{job['board']}：{job['state']} {job['message']}".rstrip(), flush=True)
+
+def exit_code(events):
+    """根据结果事件计算退出码"""
+    if any(event.get("event") == "error" for event in events):
+        return EXIT_ERROR
+    results = [event for event in events if event.get("event") == "result"]
+    if not results:
+        return EXIT_ERROR
+    jobs = results[-1].get("jobs", [])
+    return EXIT_OK if all(job["state"] in ("done", "merged") for job in jobs) else EXIT_FAILED
+
+def send_to_daemon(request, port):
+    """把请求交给守护进程并输出事件流，守护进程未运行时返回None"""
+    try:
+        sock = socket.create_connection(("127.0.0.1", port), timeout=0.5)
+    except OSError:
+        return None
+    events = []
+    with sock:
+        sock.settimeout(None)
+        sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        for line in sock.makefile("r", encoding="utf-8"):
+            event = json.loads(line)
+            events.append(event)
+            print_event(event)
+    return exit_code(events)
+
+def run_local(request, config_file):
+    """守护进程未运行时在本进程内执行"""
+    if request["action"] not in ("submit", "campaign", "manifest"):
+        print("守护进程未运行（haps daemon启动）", file=sys.stderr)
+        return EXIT_ERROR
+    from haps_engine import HapsEngine
+    engine = HapsEngine(config_file)
+    events = []
+
+    def emit(event):
+        # 本进程执行时引擎日志已包含命令输出
+        if event.get("event") != "output":
+            events.append(event)
+            print_event(event)
+    try:
+        RequestRunner(engine, emit).run(request)
+    except KeyboardInterrupt:
+        return EXIT_FAILED
+    finally:
+        engine.shutdown()
+    return exit_code(events)
+
+def run_search(args, config_file):
+    """检索运行日志索引；有结果返回0，没有结果返回1"""
+    from haps_search import RunLogIndex, index_path, parse_date
+    try:
+        since = parse_date(args.since) if args.since else None
+        until = parse_date(args.until, end=True) if args.until else None
+        started = time.perf_counter()
+        results = RunLogIndex(index_path(config_file)).search(args.query, board=args.board, command=args.command_filter,
+                                                              since=since, until=until, limit=args.limit, raw=args.raw)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"错误：{str(e)}", file=sys.stderr)
+        return EXIT_ERROR
+    elapsed = (time.perf_counter() - started) * 1000
+    for item in results:
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item["created"]))
+        print(f"{created} {item['board']} {item['kind']}[{item['content']}] {item['state'] or ''} "
+              f"{item['path']}:{item['lineno']}: {item['text']}")
+    print(f"共{len(results)}条，耗时{elapsed:.1f}ms", file=sys.stderr)
+    return EXIT_OK if results else EXIT_FAILED
+
+def run_phases(args, config_file):
+    """输出阶段耗时统计；没有记录时返回1"""
+    from haps_phases import open_profiler
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.1f}s"
+    rows = open_profiler(config_file, log=lambda message: print(message, file=sys.stderr)).summary(
+        args.board, args.command_filter)
+    current = None
+    for row in rows:
+        if (row["board"], row["command"]) != current:
+            current = (row["board"], row["command"])
+            print(f"{row['board']} {row['command']}（成功{row['count']}次）")
+        print(f"    {row['phase']:<4}  p50 {seconds(row['p50']):>8}  p95 {seconds(row['p95']):>8}  "
+              f"最近 {seconds(row['last']):>8}")
+    if not rows:
+        print("没有阶段耗时记录", file=sys.stderr)
+    return EXIT_OK if rows else EXIT_FAILED
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="haps", description="HAPS自动化控制命令行")
+    parser.add_argument("--config", default="haps_config.json", help="配置文件路径")
+    parser.add_argument("--port", type=int, help="守护进程端口（默认取配置中的daemon_port）")
+    parser.add_argument("--local", action="store_true", help="不使用守护进程，在本进程内执行")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_job_options(p):
+        p.add_argument("--board", default="default", help="目标板卡，all表示所有已注册板卡")
+        p.add_argument("--urgent", action="store_true", help="以最高优先级执行并抢占冲突任务")
+
+    for name in ("load", "reset"):
+        p = sub.add_parser(name, help=f"{name}预设命令")
+        p.add_argument("target", nargs="?", default="all", choices=("all", "master", "slave"))
+        add_job_options(p)
+        if name == "load":
+            p.add_argument("--if-changed", action="store_true",
+                           help="设计（tsd及bit文件）未变化且FPGA均已配置时跳过加载")
+
+    p = sub.add_parser("run-tcl", help="执行TCL脚本")
+    p.add_argument("file")
+    add_job_options(p)
+    p = sub.add_parser("custom", help="执行自定义TCL命令")
+    p.add_argument("text")
+    p.add_argument("--idempotent", action="store_true", help="幂等命令，相同的等待命令合并执行")
+    add_job_options(p)
+    p = sub.add_parser("campaign", help="提交配置中的流程")
+    p.add_argument("name")
+    p.add_argument("--board", default="default")
+    p = sub.add_parser("cancel", help="终止守护进程中的任务")
+    p.add_argument("--board", default=ALL_BOARDS)
+    p.add_argument("--job", type=int, help="任务编号")
+    p = sub.add_parser("manifest", help="列出Bitfile路径下全部bit文件的SHA1")
+    p.add_argument("--board", default="default")
+    p = sub.add_parser("search", help="检索历史运行日志的输出")
+    p.add_argument("query", help="要检索的短语（--raw时为FTS5查询语法）")
+    p.add_argument("--board", help="只检索该板卡")
+    p.add_argument("--command", dest="command_filter", help="命令内容包含该文本，如load_all、cfg_scan")
+    p.add_argument("--since", help="开始日期，YYYY-MM-DD或YYYY-MM-DD HH:MM")
+    p.add_argument("--until", help="结束日期（含当天）")
+    p.add_argument("--limit", type=int, default=100)
+    p.add_argument("--raw", action="store_true", help="按FTS5语法解析（AND/OR/NOT、前缀*）")
+    p = sub.add_parser("phases", help="各板卡加载/复位各阶段耗时的p50/p95")
+    p.add_argument("--board", help="只显示该板卡")
+    p.add_argument("--command", dest="command_filter", help="命令包含该文本，如load_all、reset")
+    sub.add_parser("status", help="查询守护进程的队列")
+    sub.add_parser("stop", help="停止守护进程")
+    sub.add_parser("daemon", help="启动守护进程")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config_file = os.path.abspath(args.config)
+    if args.command == "daemon":
+        return run_daemon(config_file, args.port)
+    if args.command == "search":
+        return run_search(args, config_file)
+    if args.command == "phases":
+        return run_phases(args, config_file)
+
+    request = build_request(args)
+    if not args.local:
+        code = send_to_daemon(request, args.port or read_port(config_file))
+        if code is not None:
+            return code
+    return run_local(request, config_file)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3538 @@
+"""HAPS控制引擎 - 配置、路径解析、TCL生成、本地/SSH执行和任务调度，不依赖Tkinter
+
+图形界面（Haps100ContrlRemote.py）、命令行和守护进程（haps_cli.py）共用同一个HapsEngine。
+"""
+import os
+import json
+import codecs
+import gzip
+import hashlib
+import io
+import selectors
+import shutil
+import signal
+import socket
+import itertools
+import mmap
+import ntpath
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+import paramiko
+from paramiko.ssh_exception import SSHException, AuthenticationException
+from haps_search import RunLogIndex, SEGMENT_PATTERN, segment_path
+from haps_phases import PhaseProfiler, DEFAULT_PHASE_MARKERS
+
+def tcl_quote(text):
+    """将任意文本转义为Tcl双引号字符串，用于通过管道安全发送多行命令"""
+    escaped = []
+    for ch in text:
+        if ch in '\\"$[]{};':
+            escaped.append("\\" + ch)
+        elif ch == "\n":
+            escaped.append("\\n")
+        elif ch == "\r":
+            continue
+        else:
+            escaped.append(ch)
+    return '"' + "".join(escaped) + '"'
+
+class StreamDecoder:
+    """增量解码 - 跨数据块安全地解码多字节字符，并按完整行输出
+
+    encoding为"auto"时按完整行判断编码（haps100control.bat会chcp 65001，但GBK输出同样常见）：
+    纯ASCII行直接输出；含非法UTF-8序列的行判定为GBK；含三字节UTF-8序列（中文字符）的合法UTF-8行判定为UTF-8。
+    只含双字节序列的行（如GBK的"系统"、"扫"）两种编码都能解码，此时只按GBK解码这一行而不下结论，
+    GBK也解码失败才判定为UTF-8。判定后剩余的字节交给该编码的增量解码器。
+    """
+    def __init__(self, encoding="auto", on_detect=None):
+        self.encoding = None if encoding in (None, "", "auto") else encoding
+        self.on_detect = on_detect
+        self._decoder = codecs.getincrementaldecoder(self.encoding)("replace") if self.encoding else None
+        self._raw = bytearray()  # 编码未确定时尚未凑成完整行的字节
+        self._pending = ""
+
+    def feed(self, data, final=False):
+        """解码一块字节数据（bytes/bytearray/memoryview），返回本次凑齐的完整行"""
+        if self._decoder is None:
+            return self._probe(data, final)
+        text = self._pending + self._decoder.decode(data, final)
+        lines = text.split("\n")
+        self._pending = lines.pop()
+        if final and self._pending:
+            lines.append(self._pending)
+            self._pending = ""
+        return [line.rstrip("\r") for line in lines]
+
+    def _probe(self, data, final):
+        """编码未确定时逐个完整行判断，确定后剩余字节改由feed解码"""
+        self._raw += data
+        lines, start = [], 0
+        while self._decoder is None and start < len(self._raw):
+            end = self._raw.find(b"\n", start)
+            if end < 0:
+                if not final:
+                    break
+                end = len(self._raw)
+            lines.append(self._classify(bytes(self._raw[start:end])).rstrip("\r"))
+            start = end + 1
+        rest = bytes(self._raw[start:])
+        self._raw = bytearray()
+        if self._decoder is None:
+            self._raw += rest
+            return lines
+        return lines + self.feed(rest, final)
+
+    def _classify(self, line):
+        """解码一个完整行；证据充分时选定编码"""
+        if line.isascii():
+            return line.decode("ascii")
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            self._select("gbk")
+            return line.decode("gbk", "replace")
+        # 合法UTF-8中0xE0-0xEF只能是三字节序列的首字节
+        if any(0xE0 <= byte <= 0xEF for byte in line):
+            self._select("utf-8")
+            return text
+        try:
+            return line.decode("gbk")
+        except UnicodeDecodeError:
+            self._select("utf-8")
+            return text
+
+    def _select(self, encoding):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)("replace")
+        if self.on_detect:
+            self.on_detect(encoding)
+
+class OutputMultiplexer:
+    """单线程输出读取循环 - 同时监听多个SSH通道和本地子进程管道，按完整行分发给各任务的sink
+
+    SSH通道通过selectors监听；Windows的匿名管道不支持select，此时由轻量读取线程
+    读入并解码后把完整行交给事件循环，分发仍统一在循环线程中完成。
+    """
+    READ_SIZE = 65536
+
+    class Stream:
+        """一个被监听的输出源"""
+        def __init__(self, source, kind, sink, decoder):
+            self.source = source
+            self.kind = kind  # "channel" 或 "pipe"
+            self.sink = sink
+            self.decoder = decoder or StreamDecoder()
+            self.done = threading.Event()
+
+    def __init__(self, log=print):
+        self.log = log
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._actions = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # 循环线程复用的读缓冲区
+        self._buffer = bytearray(self.READ_SIZE)
+        self._view = memoryview(self._buffer)
+
+    def add_channel(self, channel, sink, decoder=None):
+        """监听SSH通道，返回结束事件"""
+        stream = self.Stream(channel, "channel", sink, decoder)
+        self._post(("register", stream, None))
+        return stream.done
+
+    def add_pipe(self, pipe, sink, decoder=None):
+        """监听本地子进程输出管道，返回结束事件"""
+        stream = self.Stream(getattr(pipe, "raw", pipe), "pipe", sink, decoder)
+        if os.name == "nt":
+            threading.Thread(target=self._pipe_feeder, args=(stream,), daemon=True).start()
+        else:
+            os.set_blocking(pipe.fileno(), False)
+            self._post(("register", stream, None))
+        return stream.done
+
+    def _post(self, action):
+        """向循环线程投递操作并唤醒select"""
+        self._ensure_started()
+        self._actions.put(action)
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def _pipe_feeder(self, stream):
+        """Windows下管道读取线程：读入复用缓冲区并解码，把完整行投递给循环线程"""
+        buffer = bytearray(self.READ_SIZE)
+        view = memoryview(buffer)
+        try:
+            while True:
+                n = stream.source.readinto(buffer)
+                if not n:
+                    break
+                self._post(("lines", stream, stream.decoder.feed(view[:n])))
+        except OSError:
+            pass
+        self._post(("eof", stream, None))
+
+    def _loop(self):
+        while True:
+            for key, _ in self._selector.select(timeout=1):
+                if key.data is None:
+                    self._drain_actions()
+                    continue
+                stream = key.data
+                try:
+                    if stream.kind == "channel":
+                        data = stream.source.recv(self.READ_SIZE)
+                    else:
+                        n = stream.source.readinto(self._buffer)
+                        if n is None:
+                            continue
+                        data = self._view[:n]
+                except BlockingIOError:
+                    continue
+                except Exception as e:
+                    self.log(f"读取输出异常：{str(e)}")
+                    data = b""
+                if data:
+                    self._emit(stream, stream.decoder.feed(data))
+                else:
+                    self._finish(stream)
+
+    def _drain_actions(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while not self._actions.empty():
+            action, stream, data = self._actions.get()
+            if action == "register":
+                self._selector.register(stream.source, selectors.EVENT_READ, stream)
+            elif action == "lines":
+                self._emit(stream, data)
+            elif action == "eof":
+                self._finish(stream)
+
+    def _emit(self, stream, lines):
+        """把完整行交给任务的sink"""
+        for line in lines:
+            try:
+                stream.sink(line)
+            except Exception as e:
+                self.log(f"输出处理异常：{str(e)}")
+
+    def _finish(self, stream):
+        """输出结束：输出残留的不完整行，注销并通知等待方"""
+        if stream.kind == "channel" or os.name != "nt":
+            try:
+                self._selector.unregister(stream.source)
+            except (KeyError, ValueError):
+                pass
+        self._emit(stream, stream.decoder.feed(b"", final=True))
+        stream.done.set()
+
+class OutputSpool:
+    """任务输出暂存 - 内存中只保留末尾若干行，完整输出写入磁盘暂存文件
+
+    调用方拿到的是暂存句柄而不是完整字符串，日志再大内存占用也保持不变。
+    并行任务各自持有的暂存文件在close之前不会被清理。
+    """
+    _active = set()  # 尚未close的暂存文件路径（进程内所有暂存共享）
+    _active_lock = threading.Lock()
+
+    def __init__(self, spool_dir, tail_lines=200, keep_files=50, prefix="job"):
+        os.makedirs(spool_dir, exist_ok=True)
+        # 清理与创建在同一把锁内完成，避免清理掉其他线程刚创建的文件
+        with self._active_lock:
+            self._cleanup(spool_dir, keep_files)
+            fd, self.path = tempfile.mkstemp(prefix=f"haps_{prefix}_", suffix=".log", dir=spool_dir)
+            self._active.add(os.path.abspath(self.path))
+        self._file = os.fdopen(fd, "w", encoding="utf-8", errors="replace")
+        self._tail = deque(maxlen=tail_lines)
+        self._lock = threading.Lock()
+        self.line_count = 0
+
+    def write(self, line):
+        """追加一行输出"""
+        with self._lock:
+            self._tail.append(line)
+            self.line_count += 1
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def close(self):
+        """结束写入（暂存文件保留，供调用方查看）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with self._active_lock:
+            self._active.discard(os.path.abspath(self.path))
+
+    def tail(self, n=20):
+        """返回最后n行"""
+        with self._lock:
+            return list(self._tail)[-n:]
+
+    def tail_text(self, n=20):
+        return "\n".join(self.tail(n))
+
+    def read(self):
+        """从暂存文件读取完整输出（仅在确实需要时使用）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    def __str__(self):
+        return f"{self.path}（共{self.line_count}行）"
+
+    @classmethod
+    def _cleanup(cls, spool_dir, keep_files):
+        """只保留最近的keep_files个暂存文件，仍在写入的不删除（需持有_active_lock）"""
+        try:
+            files = [e for e in os.scandir(spool_dir) if e.name.startswith("haps_") and e.name.endswith(".log")]
+            excess = len(files) - keep_files + 1
+            idle = sorted((e for e in files if os.path.abspath(e.path) not in cls._active),
+                          key=lambda e: e.stat().st_mtime)
+            for entry in idle[:max(excess, 0)]:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+class RunLogWriter:
+    """任务运行日志 - 每条任务一个文件（名称、板卡、开始/结束时间、返回码和完整输出）
+
+    执行线程和调度器只把事件放入无界队列，从不等待磁盘；后台写线程取出事件批量写入，
+    每flush_interval秒统一flush一次。单个文件超过file_max_bytes时滚动为~segN.log分段；
+    已结束的运行日志只保留最近keep_plain个明文，其余（含分段）gzip压缩；
+    超过max_age_days或目录总大小超过max_bytes时删除最早的日志。
+    index（haps_search.RunLogIndex）不为None时，输出行在写入的同时加入全文索引，每批一个事务。
+    """
+    MAINTAIN_INTERVAL = 60  # 压缩和清理的间隔（秒）
+    SEGMENT_PATTERN = SEGMENT_PATTERN
+
+    def __init__(self, directory, file_max_bytes=50 * 1024 * 1024, keep_plain=20, max_age_days=30,
+                 max_bytes=1024 * 1024 * 1024, flush_interval=1.0, index=None, log=print):
+        self.directory = directory
+        self.index = index
+        self.file_max_bytes = file_max_bytes
+        self.keep_plain = keep_plain
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.log = log
+        self._events = Queue()
+        self._files = {}  # 任务编号 -> [文件对象, 路径, 已写入字节数, 分段序号, 索引中的运行编号, 已写入行数]
+        self._dirty = set()
+        self._index_rows = []
+        self._last_maintain = 0
+        self._thread = threading.Thread(target=self._run, name="run-log-writer", daemon=True)
+        self._thread.start()
+
+    # 以下方法可在任意线程调用，只入队
+    def start(self, job):
+        self._events.put(("start", job, time.time()))
+
+    def line(self, job, text):
+        self._events.put(("line", job, text))
+
+    def finish(self, job):
+        self._events.put(("end", job, time.time()))
+
+    def close(self, timeout=5):
+        """写完队列中的事件后停止写线程"""
+        self._events.put(("close", None, None))
+        self._thread.join(timeout)
+
+    # 以下方法只在写线程中执行
+    def _run(self):
+        if self.index is not None:
+            try:
+                self.index.open()
+            except Exception as e:
+                self.log(f"打开运行日志索引失败，不建立索引：{str(e)}")
+                self.index = None
+        while True:
+            events = []
+            try:
+                events.append(self._events.get(timeout=self.flush_interval))
+                while len(events) < 1000:
+                    events.append(self._events.get_nowait())
+            except Empty:
+                pass
+            try:
+                closing = self._handle(events)
+                self._flush()
+                if closing or time.time() - self._last_maintain >= self.MAINTAIN_INTERVAL:
+                    self._maintain()
+            except Exception as e:
+                closing = False
+                self.log(f"写入运行日志失败：{str(e)}")
+            if closing:
+                for item in list(self._files.values()):
+                    item[0].close()
+                self._files.clear()
+                if self.index is not None:
+                    self.index.close()
+                return
+
+    def _handle(self, events):
+        closing = False
+        for kind, job, value in events:
+            if kind == "close":
+                closing = True
+            elif kind == "start":
+                self._open(job, value)
+            elif kind == "line":
+                item = self._files.get(job.id) or self._open(job, None)
+                lineno = item[5] + 1  # 文件中的行号（含头部，跨分段累计），滚动发生在写入之后
+                self._write(job, item, value + "\n")
+                if item[4] is not None:
+                    self._index_rows.append((value, item[4], lineno))
+            elif kind == "end":
+                item = self._files.get(job.id) or self._open(job, None)
+                result = job.result[1] if job.result else ""
+                merged = f"（合并到#{job.merged_into.id}）" if job.merged_into is not None else ""
+                self._write(job, item, f"# 结束：{self._time(value)}\n# 状态：{job.state}{merged}\n"
+                                       f"# 返回码：{'' if job.return_code is None else job.return_code}\n"
+                                       f"# 结果：{result}\n")
+                item[0].close()
+                if item[4] is not None:
+                    self.index.finish_run(item[4], job, value)
+                del self._files[job.id]
+                self._dirty.discard(job.id)
+        return closing
+
+    @staticmethod
+    def _time(timestamp):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else ""
+
+    def _open(self, job, started):
+        """创建任务的运行日志并写入头部"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in job.content.split("\n")[0])[:40]
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(job.created))}"
+                                            f"_{job.board}_job{job.id}_{name}.log")
+        run_id = self.index.add_run(job, path, started) if self.index is not None else None
+        item = self._files[job.id] = [open(path, "a", encoding="utf-8", errors="replace"), path, 0, 0, run_id, 0]
+        self._write(job, item, f"# 任务：#{job.id} {job.kind}[{job.content}]\n# 板卡：{job.board}\n"
+                               f"# 目标：{'、'.join(sorted(job.targets))}\n# 提交：{self._time(job.created)}\n"
+                               f"# 开始：{self._time(started)}\n")
+        return item
+
+    def _write(self, job, item, text):
+        item[0].write(text)
+        item[2] += len(text.encode("utf-8", errors="replace"))
+        item[5] += text.count("\n")
+        self._dirty.add(job.id)
+        if item[2] >= self.file_max_bytes:
+            # 按大小滚动：当前内容改名为分段，继续写入新文件；索引记录新分段从第几行开始
+            item[0].close()
+            item[3] += 1
+            os.replace(item[1], segment_path(item[1], item[3]))
+            item[0] = open(item[1], "a", encoding="utf-8", errors="replace")
+            item[2] = 0
+            if item[4] is not None:
+                self.index.add_chunk(item[4], item[3], item[5] + 1)
+
+    def _flush(self):
+        for job_id in self._dirty:
+            item = self._files.get(job_id)
+            if item is not None:
+                item[0].flush()
+        self._dirty.clear()
+        if self.index is not None:
+            if self._index_rows:
+                self.index.add_lines(self._index_rows)
+                self._index_rows = []
+            self.index.commit()
+
+    def _maintain(self):
+        """压缩较早的运行日志，按保留天数和总大小删除最早的日志"""
+        self._last_maintain = time.time()
+        if not os.path.isdir(self.directory):
+            return
+        open_paths = {item[1] for item in self._files.values()}
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()
+                          and (entry.name.endswith(".log") or entry.name.endswith(".log.gz"))),
+                         key=lambda entry: entry.stat().st_mtime)
+        plain = [entry for entry in entries if entry.name.endswith(".log") and entry.path not in open_paths]
+        for index, entry in enumerate(plain):
+            # 滚动出的分段直接压缩
+            if index < len(plain) - self.keep_plain or self.SEGMENT_PATTERN.search(entry.name):
+                self._compress(entry.path)
+                if self.index is not None:
+                    self.index.rename(entry.path, entry.path + ".gz")
+        
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()
+                          and entry.path not in open_paths
+                          and (entry.name.endswith(".log") or entry.name.endswith(".log.gz"))),
+                         key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        expire = time.time() - self.max_age_days * 86400
+        for entry in entries:
+            if entry.stat().st_mtime >= expire and total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            if self.index is not None:
+                self.index.remove(entry.path)
+
+    @staticmethod
+    def _compress(path):
+        with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        shutil.copystat(path, path + ".gz")
+        os.remove(path)
+
+class SSHConnectionManager:
+    """SSH连接管理 - 在共享transport上复用通道，限制并发通道数，保活并自动重连
+
+    对外提供与paramiko.SSHClient相同的exec_command/open_sftp接口，供文件浏览、路径检查等复用；
+    长时间运行的命令通过open_session获取通道，通道关闭后自动归还名额。
+    """
+    RETRYABLE_ERRORS = (SSHException, EOFError, OSError)
+
+    def __init__(self, host, port, user, password, keepalive=30, max_channels=8,
+                 max_retries=5, log=print, on_state_change=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.max_channels = max_channels
+        self.max_retries = max_retries
+        self.log = log
+        self.on_state_change = on_state_change
+
+        self.client = None
+        self.connect_latency = None
+        self.reconnect_count = 0
+        self._channels = set()
+        self._reserved = 0  # 已占用名额、正在打开的通道数
+        self._cond = threading.Condition()
+        self._connect_lock = threading.Lock()
+        self._closed = False
+        self._monitor = None
+
+    @property
+    def connected(self):
+        """底层transport是否可用"""
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    @property
+    def active_channels(self):
+        """当前打开的通道数"""
+        with self._cond:
+            self._prune()
+            return len(self._channels) + self._reserved
+
+    def stats(self):
+        """连接延迟(ms)、重连次数和活动通道数"""
+        latency = round(self.connect_latency * 1000) if self.connect_latency is not None else None
+        return {"connect_latency_ms": latency, "reconnects": self.reconnect_count, "active_channels": self.active_channels}
+
+    def connect(self):
+        """建立连接（认证失败等异常直接抛出），并启动保活监控线程"""
+        with self._connect_lock:
+            self._connect()
+        self._closed = False
+        if self._monitor is None or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+            self._monitor.start()
+
+    def _connect(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        start = time.time()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            timeout=15,
+            allow_agent=False,
+            look_for_keys=False
+        )
+        client.get_transport().set_keepalive(self.keepalive)
+        self.client = client
+        self.connect_latency = time.time() - start
+        with self._cond:
+            self._channels.clear()
+            self._cond.notify_all()
+
+    def ensure_connected(self):
+        """连接已断开时按指数退避重连，重试耗尽抛出SSHException"""
+        if self.connected:
+            return
+        with self._connect_lock:
+            if self.connected:
+                return
+            if self._closed:
+                raise SSHException("SSH连接已关闭")
+            delay = 1
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    self.log(f"SSH连接中断，第{attempt}次重连：{self.host}:{self.port}")
+                    self._connect()
+                    self.reconnect_count += 1
+                    self.log(f"SSH重连成功（耗时{self.connect_latency:.2f}s）")
+                    if self.on_state_change:
+                        self.on_state_change()
+                    return
+                except AuthenticationException:
+                    raise
+                except Exception as e:
+                    self.log(f"SSH重连失败：{str(e)}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+            if self.on_state_change:
+                self.on_state_change()
+            raise SSHException(f"SSH重连失败，已重试{self.max_retries}次")
+
+    def open_session(self, timeout=None):
+        """在共享transport上打开会话通道；通道数达到上限时等待其他通道关闭"""
+        self._reserve()
+        channel = None
+        try:
+            for attempt in range(2):
+                self.ensure_connected()
+                try:
+                    channel = self.client.get_transport().open_session(timeout=timeout)
+                    break
+                except self.RETRYABLE_ERRORS:
+                    if attempt:
+                        raise
+                    self.client.get_transport().close()
+        finally:
+            self._commit(channel)
+        return channel
+
+    def exec_command(self, cmd, timeout=10):
+        """执行短命令并读取全部输出，接口与SSHClient.exec_command一致；断线时重连后重试一次"""
+        for attempt in range(2):
+            channel = None
+            try:
+                channel = self.open_session(timeout=timeout)
+                channel.settimeout(timeout)
+                channel.exec_command(cmd)
+                stdout = channel.makefile("rb").read()
+                stderr = channel.makefile_stderr("rb").read()
+                return None, io.BytesIO(stdout), io.BytesIO(stderr)
+            except self.RETRYABLE_ERRORS:
+                if attempt or self.connected:
+                    raise
+            finally:
+                if channel is not None:
+                    channel.close()
+                    self._release(channel)
+
+    def open_sftp(self):
+        """在共享transport上打开SFTP会话（占用一个通道名额，达到上限时同样等待）"""
+        self._reserve()
+        sftp = None
+        try:
+            self.ensure_connected()
+            sftp = self.client.open_sftp()
+        finally:
+            self._commit(sftp.get_channel() if sftp is not None else None)
+        return sftp
+
+    def get_transport(self):
+        self.ensure_connected()
+        return self.client.get_transport()
+
+    def close(self):
+        """关闭连接并停止自动重连"""
+        self._closed = True
+        if self.client is not None:
+            self.client.close()
+        with self._cond:
+            self._channels.clear()
+            self._cond.notify_all()
+
+    def _reserve(self):
+        """等待并占用一个通道名额；检查和占用在同一次加锁中完成，并发调用不会超过上限"""
+        with self._cond:
+            while True:
+                self._prune()
+                if len(self._channels) + self._reserved < self.max_channels:
+                    self._reserved += 1
+                    return
+                self._cond.wait(0.2)
+
+    def _commit(self, channel):
+        """把占用的名额交给打开的通道；打开失败（channel为None）时归还名额"""
+        with self._cond:
+            self._reserved -= 1
+            if channel is not None:
+                self._channels.add(channel)
+            self._cond.notify_all()
+
+    def _release(self, channel):
+        with self._cond:
+            self._channels.discard(channel)
+            self._cond.notify_all()
+
+    def _prune(self):
+        """移除已关闭的通道（需持有_cond）"""
+        closed = [c for c in self._channels if c.closed]
+        for channel in closed:
+            self._channels.discard(channel)
+        if closed:
+            self._cond.notify_all()
+
+    def _monitor_loop(self):
+        """定期检查transport，断线时在后台重连，使下一条命令无需等待"""
+        while not self._closed:
+            time.sleep(max(self.keepalive, 5))
+            if self._closed or self.connected:
+                continue
+            try:
+                self.ensure_connected()
+            except Exception as e:
+                self.log(f"SSH后台重连失败：{str(e)}")
+
+class RemotePathCache:
+    """远程路径元数据缓存 - 按(主机, 规范化路径)缓存存在性、类型、大小和修改时间
+
+    条目在TTL内有效；重连、Bitfile路径变化或手动刷新时整体失效。
+    精确探测（mtime为LastWriteTimeUtc的ticks）与cmd探测（mtime为%~t的本地格式字符串）的条目分开存放，
+    同一份条目中的修改时间始终是同一种格式；失效时两种条目一起失效。
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(path):
+        """Windows路径不区分大小写，统一分隔符和大小写作为键"""
+        return path.replace("/", "\\").rstrip("\\").lower()
+
+    def get(self, host, path, precise=False):
+        """返回缓存条目，未命中或已过期返回None"""
+        key = (host, self.normalize(path), precise)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and time.time() - item[0] <= self.ttl:
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, host, path, entry, precise=False):
+        """写入缓存条目"""
+        with self._lock:
+            self._entries[(host, self.normalize(path), precise)] = (time.time(), entry)
+
+    def invalidate(self, host=None, path=None):
+        """失效缓存：指定路径、指定主机或全部"""
+        with self._lock:
+            if path is not None:
+                for precise in (False, True):
+                    self._entries.pop((host, self.normalize(path), precise), None)
+            elif host is not None:
+                for key in [k for k in self._entries if k[0] == host]:
+                    del self._entries[key]
+            else:
+                self._entries.clear()
+
+    def stats(self):
+        """返回命中/未命中计数和当前条目数"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+class HardwareCache:
+    """硬件发现缓存 - 按主机缓存cfg_scan得到的DEVICE/SERIAL，TTL内生成的脚本跳过cfg_scan
+
+    脚本输出的"HAPS_DEVICE:"/"HAPS_SERIAL:"行在真正扫描时写入缓存；命中缓存时在脚本前加上prelude，
+    用缓存值替换cfg_scan的结果并预设$HAPS_DEVICE/$HAPS_SERIAL；包装后的cfg_open失败时输出
+    OPEN_FAILED标记，缓存随即失效，下一次重新扫描。
+    常驻会话中解释器跨命令保留，每次执行完包装脚本后须执行RESTORE恢复原始命令，
+    否则缓存失效后cfg_scan仍会返回旧的设备。
+    """
+    OPEN_FAILED = "HAPS_CFG_OPEN_FAILED"
+    CACHED = "HAPS_HW_CACHED"
+    VALUE_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.-:/")
+    RESTORE = (
+        'if {[info commands __haps_cfg_scan] ne ""} {\n'
+        '    rename cfg_scan ""\n'
+        "    rename __haps_cfg_scan cfg_scan\n"
+        '    rename cfg_open ""\n'
+        "    rename __haps_cfg_open cfg_open\n"
+        "}\n"
+        "unset -nocomplain __haps_hw_device __haps_hw_serial\n"
+    )
+
+    def __init__(self, ttl=3600, log=print):
+        self.ttl = ttl
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # 主机 -> (时间, DEVICE, SERIAL)
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """返回(DEVICE, SERIAL)，未命中、已过期或禁用时返回None"""
+        with self._lock:
+            item = self._entries.get(host)
+            if item is not None and self.ttl and time.time() - item[0] <= self.ttl:
+                self.hits += 1
+                return item[1], item[2]
+            self._entries.pop(host, None)
+            self.misses += 1
+            return None
+
+    def put(self, host, device, serial):
+        if not self.ttl or not device or not set(device + serial) <= self.VALUE_CHARS:
+            return
+        with self._lock:
+            self._entries[host] = (time.time(), device, serial)
+
+    def invalidate(self, host=None):
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(host, None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def prelude(self, host):
+        """命中缓存时返回放在脚本最前面的TCL，否则返回空字符串"""
+        cached = self.get(host)
+        if cached is None:
+            return ""
+        device, serial = cached
+        return (
+            "package require proto_rt\n"
+            f"set __haps_hw_device {{{device}}}\n"
+            f"set __haps_hw_serial {{{serial}}}\n"
+            'if {[info commands __haps_cfg_scan] eq "" && [info commands cfg_scan] ne "" && [info commands cfg_open] ne ""} {\n'
+            "    rename cfg_scan __haps_cfg_scan\n"
+            "    rename cfg_open __haps_cfg_open\n"
+            "    proc cfg_scan {args} {\n"
+            "        if {[llength $args]} {return [__haps_cfg_scan {*}$args]}\n"
+            f'        puts "{self.CACHED}: $::__haps_hw_device"\n'
+            "        return [list [list DEVICE $::__haps_hw_device SERIAL $::__haps_hw_serial STATE available]]\n"
+            "    }\n"
+            "    proc cfg_open {args} {\n"
+            "        if {[catch {__haps_cfg_open {*}$args} handle]} {\n"
+            f'            puts "{self.OPEN_FAILED}: $handle"\n'
+            "            return -code error $handle\n"
+            "        }\n"
+            "        return $handle\n"
+            "    }\n"
+            "}\n"
+            "set HAPS_DEVICE $__haps_hw_device\n"
+            "set HAPS_SERIAL $__haps_hw_serial\n"
+        )
+
+    def watcher(self, host):
+        """返回逐行检查输出的函数：记录真正扫描得到的DEVICE/SERIAL，cfg_open失败时失效缓存"""
+        found = {}
+
+        def on_line(line):
+            line = line.strip()
+            if line.startswith(self.CACHED):
+                found["cached"] = True
+            elif line.startswith(self.OPEN_FAILED):
+                self.invalidate(host)
+                self.log(f"cfg_open失败，已清除硬件发现缓存（{host}）")
+            elif line.startswith("HAPS_DEVICE:"):
+                found["device"] = line.split(":", 1)[1].strip()
+            elif line.startswith("HAPS_SERIAL:"):
+                found["serial"] = line.split(":", 1)[1].strip()
+                if found.get("device") and not found.get("cached"):
+                    self.put(host, found["device"], found["serial"])
+        return on_line
+
+class LoadStateStore:
+    """加载记录 - 按板卡和目标FPGA保存最近一次成功加载的设计指纹（JSON文件，跨进程保留）
+
+    指纹覆盖targetsystem.tsd及其引用的bit文件内容；加载失败或无法计算指纹时清除对应记录，
+    下一次"仅设计变化时加载"必定重新配置。
+    """
+    def __init__(self, path, log=print):
+        self.path = path
+        self.log = log
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.log(f"读取加载记录失败，忽略：{str(e)}")
+            return {}
+
+    def _save(self):
+        """先写临时文件再替换，中途退出不会留下损坏的记录（需持有锁）"""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.log(f"保存加载记录失败：{str(e)}")
+
+    def matches(self, board, targets, fingerprint):
+        """所有目标FPGA最近一次加载的都是该指纹"""
+        with self._lock:
+            records = self._state.get(board, {})
+            return all(records.get(target, {}).get("fingerprint") == fingerprint for target in targets)
+
+    def record(self, board, targets, fingerprint):
+        with self._lock:
+            records = self._state.setdefault(board, {})
+            for target in targets:
+                records[target] = {"fingerprint": fingerprint, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self._save()
+
+    def clear(self, board, targets):
+        with self._lock:
+            records = self._state.get(board, {})
+            removed = [records.pop(target, None) for target in targets]
+            if any(item is not None for item in removed):
+                self._save()
+
+class BitfileManifest:
+    """bit文件清单 - 按主机记录文件的(大小, 修改时间)和SHA1，只重新计算变化过的文件
+
+    本地文件在线程池中并行计算，每个文件以mmap只读映射后分块送入hashlib（计算时释放GIL，
+    多个文件可同时占用多个核心）；远程文件由引擎在一次exec中批量计算后通过update写入。
+    远程修改时间为LastWriteTimeUtc的ticks（100ns），与大小一起判断文件是否变化；
+    %~t只精确到分钟，同一分钟内重新生成的同样大小的文件无法区分，因此不用于清单。
+    """
+    LOCAL_HOST = "local"
+    BLOCK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, path, workers=4, log=print):
+        self.path = path
+        self.workers = max(int(workers), 1)
+        self.log = log
+        self._lock = threading.Lock()
+        self._hosts = self._load()  # 主机 -> {路径: {"size", "mtime", "sha1"}}
+        self._pool = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                hosts = json.load(f)
+            return hosts if isinstance(hosts, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.log(f"读取bit文件清单失败，将重新计算：{str(e)}")
+            return {}
+
+    def _save(self):
+        """先写临时文件再替换（需持有锁）"""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._hosts, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.log(f"保存bit文件清单失败：{str(e)}")
+
+    def lookup(self, host, stats):
+        """stats为 {路径: (大小, 修改时间)}，返回(清单中仍有效的 {路径: SHA1}, 需要重新计算的路径列表)"""
+        hashes, changed = {}, []
+        with self._lock:
+            records = self._hosts.get(host, {})
+            for path, (size, mtime) in stats.items():
+                entry = records.get(path)
+                if entry and entry.get("size") == size and entry.get("mtime") == mtime:
+                    hashes[path] = entry["sha1"]
+                else:
+                    changed.append(path)
+        return hashes, changed
+
+    def update(self, host, entries):
+        """写入 {路径: (大小, 修改时间, SHA1)} 并保存清单"""
+        with self._lock:
+            records = self._hosts.setdefault(host, {})
+            for path, (size, mtime, sha1) in entries.items():
+                records[path] = {"size": size, "mtime": mtime, "sha1": sha1}
+            self._save()
+
+    def hash_local(self, paths):
+        """计算本地文件的SHA1，返回 {路径: 摘要}；大小和修改时间未变的文件直接使用清单"""
+        stats = {}
+        for path in paths:
+            st = os.stat(path)
+            stats[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns)
+        hashes, changed = self.lookup(self.LOCAL_HOST, stats)
+        if changed:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            computed = dict(zip(changed, self._pool.map(self.hash_file, changed)))
+            self.update(self.LOCAL_HOST, {path: stats[path] + (computed[path],) for path in changed})
+            hashes.update(computed)
+        return {path: hashes[os.path.abspath(path)] for path in paths}
+
+    @classmethod
+    def hash_file(cls, path):
+        """mmap只读映射后分块计算SHA1；空文件或无法映射（如32位进程中的大文件）时按块读取"""
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(view), cls.BLOCK_SIZE):
+                            digest.update(view[offset:offset + cls.BLOCK_SIZE])
+                    finally:
+                        view.release()
+                return digest.hexdigest()
+            except (OSError, ValueError):
+                digest = hashlib.sha1()
+                f.seek(0)
+                for block in iter(lambda: f.read(cls.BLOCK_SIZE), b""):
+                    digest.update(block)
+                return digest.hexdigest()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+class ScriptStore:
+    """内容寻址的临时脚本存储 - 以内容哈希命名，已存在则跳过写入，按数量/大小LRU清理
+
+    SSH模式复用同一个SFTP会话（由sftp_factory提供），本地模式直接读写文件系统。
+    put(pin=True)的脚本在release之前不会被清理：同一主机上并行的任务（包括其他板卡上
+    指向同一目录的存储）可能已上传但尚未执行该脚本。固定计数按key（模式, 主机, 目录）在所有实例间共享。
+    """
+    _pins = {}  # (key, 文件名) -> 固定次数
+    _pins_lock = threading.Lock()
+
+    def __init__(self, mode, root_dir, sftp_factory=None, max_files=200, max_bytes=50 * 1024 * 1024, log=print,
+                 key=None):
+        self.mode = mode
+        self.key = key or (mode, root_dir)
+        self.root_dir = root_dir.replace("/", "\\").rstrip("\\") if mode == "ssh" else root_dir
+        self.sftp_factory = sftp_factory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.log = log
+        self._index = None  # 文件名 -> 大小，按最近使用排序
+        self._lock = threading.Lock()
+
+    def put(self, content, pin=False):
+        """保存脚本内容，返回脚本路径（Windows格式）；pin为True时固定到release为止"""
+        data = content.replace("\n", "\r\n").encode("utf-8") if self.mode == "ssh" else content.encode("utf-8")
+        name = f"haps_{hashlib.sha1(data).hexdigest()[:16]}.tcl"
+        path = self._join(name)
+
+        with self._lock:
+            if pin:
+                with ScriptStore._pins_lock:
+                    ScriptStore._pins[(self.key, name)] = ScriptStore._pins.get((self.key, name), 0) + 1
+            if self._index is None:
+                self._load_index()
+
+            if name in self._index and self._exists(path):
+                # 已有相同内容的脚本：只刷新使用时间
+                self._index.move_to_end(name)
+                self._touch(path)
+                return path
+
+            self._write(path, data)
+            self._index[name] = len(data)
+            self._index.move_to_end(name)
+            self._evict(keep=name)
+        return path
+
+    def _load_index(self):
+        """首次使用时确保目录存在，并按修改时间从旧到新建立LRU索引"""
+        self._index = OrderedDict()
+        if self.mode == "local":
+            os.makedirs(self.root_dir, exist_ok=True)
+            entries = [(e.name, e.stat().st_size, e.stat().st_mtime) for e in os.scandir(self.root_dir)]
+        else:
+            sftp = self.sftp_factory()
+            self._sftp_mkdir_p(sftp, self._sftp_path(self.root_dir))
+            entries = [(a.filename, a.st_size, a.st_mtime) for a in sftp.listdir_attr(self._sftp_path(self.root_dir))]
+
+        for name, size, _ in sorted(entries, key=lambda e: e[2] or 0):
+            if name.startswith("haps_") and name.endswith(".tcl"):
+                self._index[name] = size or 0
+
+    def release(self, path):
+        """解除put(pin=True)的固定"""
+        name = path.replace("/", "\\").rsplit("\\", 1)[-1]
+        with ScriptStore._pins_lock:
+            count = ScriptStore._pins.get((self.key, name), 0) - 1
+            if count > 0:
+                ScriptStore._pins[(self.key, name)] = count
+            else:
+                ScriptStore._pins.pop((self.key, name), None)
+
+    def _evict(self, keep):
+        """超出数量或总大小上限时删除最久未使用的脚本，跳过固定中的脚本"""
+        total = sum(self._index.values())
+        with ScriptStore._pins_lock:
+            pinned = {name for key, name in ScriptStore._pins if key == self.key}
+        for name in list(self._index):
+            if len(self._index) <= self.max_files and total <= self.max_bytes:
+                break
+            if name == keep or name in pinned:
+                continue
+            size = self._index.pop(name)
+            total -= size
+            try:
+                self._remove(self._join(name))
+            except Exception as e:
+                self.log(f"清理临时脚本失败：{name} - {str(e)}")
+
+    def _join(self, name):
+        if self.mode == "local":
+            return os.path.join(self.root_dir, name)
+        return f"{self.root_dir}\\{name}"
+
+    @staticmethod
+    def _sftp_path(path):
+        return path.replace("\\", "/")
+
+    def _sftp_mkdir_p(self, sftp, remote_directory):
+        """递归创建远程目录"""
+        if remote_directory in ("", "/") or remote_directory.endswith(":"):
+            return
+        try:
+            sftp.stat(remote_directory)
+        except FileNotFoundError:
+            self._sftp_mkdir_p(sftp, remote_directory.rsplit("/", 1)[0] if "/" in remote_directory else "")
+            sftp.mkdir(remote_directory)
+
+    def _exists(self, path):
+        if self.mode == "local":
+            return os.path.exists(path)
+        try:
+            self.sftp_factory().stat(self._sftp_path(path))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _touch(self, path):
+        try:
+            if self.mode == "local":
+                os.utime(path)
+            else:
+                now = time.time()
+                self.sftp_factory().utime(self._sftp_path(path), (now, now))
+        except Exception:
+            pass
+
+    def _write(self, path, data):
+        if self.mode == "local":
+            with open(path, "wb") as f:
+                f.write(data)
+        else:
+            with self.sftp_factory().file(self._sftp_path(path), "wb") as f:
+                f.write(data)
+
+    def _remove(self, path):
+        if self.mode == "local":
+            os.remove(path)
+        else:
+            self.sftp_factory().remove(self._sftp_path(path))
+
+def kill_process_tree(process):
+    """结束本地进程及其所有子进程（xactorscmd会再启动confprosh等子进程）"""
+    if process.poll() is not None:
+        return
+    if os.name == "nt":
+        subprocess.call(f"taskkill /F /T /PID {process.pid}",
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        # 进程以start_new_session启动，自成一个进程组
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+        except OSError:
+            process.kill()
+
+def new_job_token():
+    """命令的标记，写入HAPS_JOB环境变量（远程为命令行中的set "HAPS_JOB=..."）以便取消时定位远程进程，
+    haps100control.bat也用它命名本次运行的临时命令文件"""
+    return f"HAPSJOB_{uuid.uuid4().hex[:12]}"
+
+def remote_kill_command(token):
+    """在远程Windows上结束命令行含token的进程树
+
+    token被拆成两段在PowerShell中拼接，避免匹配到执行本命令的cmd/powershell进程自身。
+    """
+    head, tail = token[:4], token[4:]
+    return ('powershell -NoProfile -Command "Get-CimInstance Win32_Process | '
+            f"Where-Object {{ $_.CommandLine -like ('*' + '{head}' + '{tail}*') }} | "
+            'ForEach-Object { taskkill /F /T /PID $_.ProcessId }"')
+
+def local_popen_kwargs():
+    """本地子进程独立成组，取消时可以结束整个进程树"""
+    return {} if os.name == "nt" else {"start_new_session": True}
+
+class ProtoRtSession:
+    """常驻proto_rt会话 - 保持一个xactorscmd/confprosh进程和$HAPS_HANDLE打开
+
+    进程启动后只执行一次 package require / cfg_scan / cfg_open（即source默认TCL），
+    之后每条命令通过stdin发送，并以哨兵行界定命令结束和返回码。
+    """
+    SENTINEL = "__HAPS_SESSION_DONE__"
+
+    def __init__(self, mode, xactorscmd, default_tcl_path, base_dir="", ssh_client=None, mux=None,
+                 decoder=None, log=print):
+        self.mode = mode
+        self.xactorscmd = xactorscmd
+        self.default_tcl_path = default_tcl_path
+        self.base_dir = base_dir
+        self.ssh_client = ssh_client
+        self.mux = mux or OutputMultiplexer(log=log)
+        self.decoder = decoder
+        self.log = log
+
+        self.process = None
+        self.channel = None
+        self.token = new_job_token()
+        self._lines = Queue()
+        self._lock = threading.Lock()
+        self._alive = False
+        self._seq = 0
+
+    @property
+    def alive(self):
+        """会话进程是否仍在运行"""
+        if not self._alive:
+            return False
+        if self.mode == "local":
+            return self.process is not None and self.process.poll() is None
+        return self.channel is not None and not self.channel.closed
+
+    def start(self):
+        """启动xactorscmd并进入confprosh，source默认TCL打开$HAPS_HANDLE"""
+        if self.mode == "local":
+            self.process = subprocess.Popen(
+                f'"{self.xactorscmd}"',
+                shell=True,
+                cwd=self.base_dir or None,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **local_popen_kwargs()
+            )
+        else:
+            self.channel = self.ssh_client.open_session()
+            self.channel.set_combine_stderr(True)
+            if self.base_dir:
+                self.channel.exec_command(f'set "HAPS_JOB={self.token}" && cd /d "{self.base_dir}" && "{self.xactorscmd}"')
+            else:
+                self.channel.exec_command(f'set "HAPS_JOB={self.token}" && "{self.xactorscmd}"')
+
+        self._alive = True
+        if self.mode == "local":
+            done = self.mux.add_pipe(self.process.stdout, self._lines.put, self.decoder)
+        else:
+            done = self.mux.add_channel(self.channel, self._lines.put, self.decoder)
+        # 输出结束时放入None通知等待方
+        threading.Thread(target=lambda: (done.wait(), self._lines.put(None)), daemon=True).start()
+
+        # 进入confprosh，并屏蔽脚本中的exit，避免预设脚本退出整个会话
+        self._send("confprosh")
+        self._send("rename exit __haps_real_exit")
+        self._send('proc exit {{code 0}} {return -code error "exit $code"}')
+        self._send("set argc 0")
+        self._send("set argv {}")
+
+        default_tcl = self.default_tcl_path.replace("\\", "/")
+        success, _ = self.run(f"source {{{default_tcl}}}", on_line=lambda line: self.log(f"输出：{line}"))
+        if not success:
+            self.close()
+            raise RuntimeError(f"会话初始化失败：无法执行默认TCL {self.default_tcl_path}")
+        self.log("proto_rt常驻会话已建立，$HAPS_HANDLE保持打开")
+
+    def run(self, script, on_line=None):
+        """在会话中执行TCL脚本，返回(成功, 返回码)"""
+        with self._lock:
+            if not self.alive:
+                raise RuntimeError("proto_rt会话未运行")
+
+            self._seq += 1
+            token = f"{self._seq}_{uuid.uuid4().hex[:8]}"
+            self._send(f"set __haps_cmd {tcl_quote(script)}")
+            self._send("set __haps_rc [catch {uplevel #0 $__haps_cmd} __haps_msg]")
+            self._send('if {$__haps_rc} {puts "ERROR: $__haps_msg"}')
+            self._send(f'puts "{self.SENTINEL} {token} $__haps_rc"')
+            self._send("flush stdout")
+
+            while True:
+                line = self._lines.get()
+                if line is None:
+                    self._alive = False
+                    return False, -1
+                if self.SENTINEL in line and token in line:
+                    try:
+                        return_code = int(line.rsplit(" ", 1)[-1])
+                    except ValueError:
+                        return_code = -1
+                    return return_code == 0, return_code
+                if on_line:
+                    on_line(line)
+
+    def run_script_file(self, tcl_path, on_line=None, prelude=""):
+        """在会话中执行预设脚本：临时释放句柄，source脚本后重新打开$HAPS_HANDLE
+
+        prelude为硬件发现缓存的预设内容，在source之前执行；source结束后（无论成败）恢复原始的cfg_scan/cfg_open，
+        缓存失效后的下一次执行重新扫描。
+        """
+        tcl_path = tcl_path.replace("\\", "/")
+        script = prelude + (
+            "catch {cfg_close $HAPS_HANDLE}\n"
+            f"set __haps_src_rc [catch {{source {{{tcl_path}}}}} __haps_src_msg]\n"
+            + HardwareCache.RESTORE +
+            "set HAPS_HANDLE [cfg_open $HAPS_DEVICE]\n"
+            "if {$__haps_src_rc && $__haps_src_msg ne {exit 0}} {error $__haps_src_msg}"
+        )
+        return self.run(script, on_line)
+
+    def close(self):
+        """关闭句柄并结束会话进程"""
+        if self._alive:
+            try:
+                self._send("catch {cfg_close $HAPS_HANDLE}")
+                self._send("__haps_real_exit 0")
+                self._send("exit")
+            except Exception:
+                pass
+        self._alive = False
+
+        try:
+            if self.process is not None:
+                if self.process.poll() is None:
+                    self.process.kill()
+                self.process = None
+            if self.channel is not None:
+                self.channel.close()
+                self.channel = None
+        except Exception as e:
+            self.log(f"关闭proto_rt会话时出错：{str(e)}")
+
+    def kill(self):
+        """强制结束会话（取消正在执行的命令）：结束本地进程树，或结束远程进程树后关闭通道"""
+        self._alive = False
+        if self.process is not None:
+            kill_process_tree(self.process)
+        if self.channel is not None:
+            try:
+                stdin, stdout, stderr = self.ssh_client.exec_command(remote_kill_command(self.token), timeout=15)
+                stdout.read()
+            except Exception as e:
+                self.log(f"结束远程会话进程失败：{str(e)}")
+            self.channel.close()
+
+    def _send(self, line):
+        """向会话stdin发送一行"""
+        data = (line + "\r\n").encode("utf-8")
+        if self.mode == "local":
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        else:
+            self.channel.sendall(data)
+
+class CustomBatch:
+    """合并执行的一组自定义命令 - 生成带标记的脚本，按标记把输出和返回码拆分到各条命令
+
+    每条命令单独catch，一条失败不影响后续命令，整个脚本只打开/关闭一次$HAPS_HANDLE。
+    """
+    BEGIN = "__HAPS_BATCH_BEGIN__"
+    END = "__HAPS_BATCH_END__"
+
+    def __init__(self, jobs, loggers, fallback):
+        self.jobs = jobs
+        self.loggers = loggers  # 任务编号 -> 该任务的输出处理
+        self.fallback = fallback  # 标记之外的输出（默认TCL、关闭句柄）
+        self.codes = {}
+        self._current = None
+
+    def script(self):
+        """生成合并后的命令部分（默认TCL和cfg_close由调用方添加）"""
+        lines = []
+        for job in self.jobs:
+            lines.append(f'puts "{self.BEGIN} {job.id}"')
+            lines.append(f"set __haps_cmd {tcl_quote(job.content)}")
+            lines.append("set __haps_rc [catch {uplevel #0 $__haps_cmd} __haps_msg]")
+            lines.append('if {$__haps_rc} {puts "ERROR: $__haps_msg"}')
+            lines.append(f'puts "{self.END} {job.id} $__haps_rc"')
+            lines.append("flush stdout")
+        return "\n".join(lines)
+
+    def feed(self, line):
+        """逐行处理输出：识别标记，其余行交给当前命令"""
+        if self.BEGIN in line:
+            tail = line.split(self.BEGIN, 1)[1].split()
+            self._current = int(tail[0]) if tail and tail[0].isdigit() else None
+            return
+        if self.END in line:
+            tail = line.split(self.END, 1)[1].split()
+            if len(tail) >= 2 and tail[0].isdigit():
+                try:
+                    self.codes[int(tail[0])] = int(tail[1])
+                except ValueError:
+                    self.codes[int(tail[0])] = -1
+            self._current = None
+            return
+        self.loggers.get(self._current, self.fallback)(line)
+
+    def result(self, job, overall):
+        """单条命令的(成功, 消息)；没有结束标记说明脚本在执行到它之前已中止"""
+        code = self.codes.get(job.id)
+        if code is None:
+            return False, f"未执行完成（{overall}）"
+        return code == 0, f"返回码{code}（合并执行{len(self.jobs)}条）"
+
+# 预设命令作用的FPGA；自定义命令无法判断作用范围，按整板处理
+PRESET_TARGETS = {
+    "load_all": ("master", "slave"),
+    "load_master": ("master",),
+    "load_slave": ("slave",),
+    "reset_all": ("master", "slave"),
+    "reset_master": ("master",),
+    "reset_slave": ("slave",)
+}
+ALL_TARGETS = ("master", "slave")
+BIT_FILE_PATTERN = re.compile(r'[^\s"\'{}<>=;,|]+\.bit\b', re.IGNORECASE)  # tsd中引用的bit文件
+URGENT_PRIORITY = 100
+
+class Job:
+    """队列中的一条命令（预设命令或自定义命令），记录目标板卡、目标FPGA、前置任务和执行状态
+
+    同一板卡上目标FPGA有交集的任务按提交顺序执行，没有交集的任务可以并行；
+    after中的前置任务全部成功后才会开始，任一前置任务失败或被取消则本任务跳过。
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, board, kind, content, targets=None, after=None, idempotent=False,
+                 priority=0, preempt=False, if_changed=False):
+        self.id = next(Job._ids)
+        self.board = board
+        self.kind = kind  # preset/custom/script
+        self.content = content
+        if targets is None:
+            targets = PRESET_TARGETS.get(content, ALL_TARGETS) if kind == "preset" else ALL_TARGETS
+        self.targets = frozenset(targets)
+        self.after = list(after or [])
+        self.idempotent = idempotent or kind == "preset"  # 预设命令重复执行结果相同
+        self.merged_into = None  # 入队时被合并，指向保留的任务
+        self.superseded = []  # 入队时被本任务替代的旧任务
+        self.priority = priority  # 数值越大越先执行
+        self.preempt = preempt  # 被正在执行的低优先级任务阻塞时，终止这些任务
+        self.if_changed = if_changed  # load_*：设计未变化且FPGA均已配置时跳过加载
+        # pending/running/done/failed/skipped/cancelled/preempted/timeout/stalled/merged/superseded
+        self.state = "pending"
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()  # 任务结束（含跳过、取消、被合并/替代）时置位
+        self.cancel_reason = None
+        self.cancel_detail = ""
+        self.watchdog = None
+        self.batch = []  # 合并到本任务一起执行的后续自定义命令
+        self.batch_leader = None  # 本任务被合并执行时，执行它的任务
+        self.output_hooks = []  # 每行命令输出的额外接收方（如命令行客户端）
+        self.finish_hooks = []  # 任务结束时调用hook(job)（持有调度器锁时调用，不能阻塞）
+        self.return_code = None  # 命令进程的返回码（常驻会话中执行时没有）
+        self._cancel_hooks = []
+        self._cancel_lock = threading.Lock()
+
+    def add_cancel_hook(self, hook):
+        """注册取消时执行的动作（结束进程树、关闭通道）；已取消时立即执行"""
+        with self._cancel_lock:
+            if not self.cancel_event.is_set():
+                self._cancel_hooks.append(hook)
+                return
+        hook()
+
+    def remove_cancel_hook(self, hook):
+        with self._cancel_lock:
+            if hook in self._cancel_hooks:
+                self._cancel_hooks.remove(hook)
+
+    @property
+    def cancel_text(self):
+        return f"命令已终止（{self.cancel_detail}）" if self.cancel_detail else "命令已终止"
+
+    def cancel(self, reason="cancelled", detail=""):
+        """请求取消任务，执行所有已注册的取消动作"""
+        with self._cancel_lock:
+            if self.cancel_event.is_set():
+                return
+            self.cancel_reason = reason
+            self.cancel_detail = detail
+            self.cancel_event.set()
+            hooks, self._cancel_hooks = self._cancel_hooks, []
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+
+    def finish(self, state):
+        """记录最终状态并通知等待方"""
+        self.state = state
+        self.finished = time.time()
+        self.done_event.set()
+        for hook in self.finish_hooks:
+            hook(self)
+
+    @property
+    def final(self):
+        """最终生效的任务：被合并的任务沿merged_into找到保留的任务"""
+        job = self
+        while job.merged_into is not None:
+            job = job.merged_into
+        return job
+
+    def wait(self, timeout=None):
+        """等待任务结束；被合并的任务等待保留的任务，返回最终生效的任务（超时返回None）"""
+        job = self.final
+        return job if job.done_event.wait(timeout) else None
+
+    def summary(self):
+        """可序列化的任务摘要；被合并的任务报告保留任务的状态和结果"""
+        final = self.wait(0) or self
+        return {
+            "id": self.id,
+            "board": self.board,
+            "kind": self.kind,
+            "content": self.content,
+            "if_changed": self.if_changed,
+            "state": final.state,
+            "message": final.result[1] if final.result else "",
+            "merged_into": self.merged_into.id if self.merged_into is not None else None,
+            "created": self.created,
+            "started": final.started,
+            "finished": final.finished
+        }
+
+    def __str__(self):
+        return f"#{self.id} {self.kind}[{self.content}]@{self.board}"
+
+class HapsBoard:
+    """单台HAPS系统的执行上下文 - 每台板卡独立的SSH连接、SFTP、脚本存储和常驻会话
+
+    settings为该板卡在haps_config.json的boards中声明的覆盖项（如ssh_host、base_dir），
+    未声明的配置项沿用全局配置；默认板卡没有覆盖项，直接使用全局配置。
+    """
+    def __init__(self, name, base_config, settings=None):
+        self.name = name
+        self.settings = dict(settings or {})
+        self.settings.pop("name", None)
+        self._base_config = base_config
+        self.ssh_client = None
+        self.ssh_connected = False
+        self.sftp = None
+        self.script_store = None
+        self.script_store_key = None
+        self.session = None
+        self.session_key = None
+        self.session_lock = threading.Lock()  # 常驻会话同一时间只执行一条命令
+
+    @property
+    def config(self):
+        if not self.settings:
+            return self._base_config
+        merged = dict(self._base_config)
+        merged.update(self.settings)
+        return merged
+
+    @property
+    def host(self):
+        config = self.config
+        return config.get("ssh_host", "") if config.get("mode", "local") == "ssh" else "local"
+
+class CommandWatchdog:
+    """任务看门狗 - 总时长超时、长时间无输出、或输出中出现等待输入的提示时终止任务
+
+    haps100control.bat在文件缺失时会pause等待按键，远程执行时永远等不到输入，
+    通过stall_patterns识别这类输出后立即终止，工作线程随即处理下一条任务。
+    timeout/inactivity为0表示不限制。
+    """
+    def __init__(self, job, timeout=0, inactivity=0, patterns=(), log=print):
+        self.job = job
+        self.timeout = timeout
+        self.inactivity = inactivity
+        self.patterns = [pattern.lower() for pattern in patterns if pattern]
+        self.log = log
+        self.started = time.time()
+        self.last_output = self.started
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.timeout or self.inactivity:
+            threading.Thread(target=self._loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def feed(self, line):
+        """每行输出调用一次：刷新活动时间并检查等待输入的提示"""
+        self.last_output = time.time()
+        lowered = line.lower()
+        for pattern in self.patterns:
+            if pattern in lowered:
+                self._trip("stalled", f"检测到等待输入的输出：{line.strip()}")
+                return
+
+    def _loop(self):
+        while not self._stop.wait(1):
+            now = time.time()
+            if self.timeout and now - self.started > self.timeout:
+                self._trip("timeout", f"执行超过{self.timeout}s")
+                return
+            if self.inactivity and now - self.last_output > self.inactivity:
+                self._trip("timeout", f"超过{self.inactivity}s无输出")
+                return
+
+    def _trip(self, reason, detail):
+        if self.job.cancel_event.is_set():
+            return
+        self.log(f"[{self.job.board}] 看门狗终止{self.job}：{detail}")
+        self._stop.set()
+        self.job.cancel(reason, detail)
+
+class BoardScheduler:
+    """多板卡依赖调度 - 按目标FPGA和前置任务构成的依赖图执行任务
+
+    同一板卡上目标有交集的任务按优先级、同优先级按提交顺序执行，互不相关的分支（不同板卡，
+    或同一板卡的master/slave）并行执行，每个板卡同时执行的任务数不超过max_parallel(板卡名)。
+    允许抢占的任务只被正在执行的低优先级任务阻塞时，终止这些任务后执行。
+    每个可执行的任务启动一个工作线程；run_job(job)返回(成功, 消息)，
+    on_change在队列深度或任务状态变化时调用，on_finish(job)在每条任务结束时调用（含合并、跳过）。
+    batch_limit(板卡名)大于1时，自定义命令开始执行时把紧随其后的等待中自定义命令（最多共batch_limit条）
+    合并到job.batch中由同一个工作线程执行，run_job负责为每条合并的命令设置result。
+    """
+    def __init__(self, run_job, on_change=None, log=print, max_parallel=None, batch_limit=None, on_finish=None):
+        self.run_job = run_job
+        self.on_change = on_change
+        self.on_finish = on_finish
+        self.log = log
+        self.max_parallel = max_parallel or (lambda name: 1)
+        self.batch_limit = batch_limit or (lambda name: 1)
+        self._lock = threading.Lock()
+        self._jobs = []  # 未结束的任务（等待中和执行中），按提交顺序
+        self._boards = OrderedDict()  # 出现过的板卡名 -> 是否有未结束的任务
+        self.coalesce_stats = {"duplicate": 0, "superseded": 0, "idempotent": 0}
+
+    def submit(self, job):
+        """提交任务，前置任务和目标冲突满足时立即开始执行
+
+        入队时先按合并规则处理：被合并的任务状态为merged，merged_into指向保留的任务；
+        替代了旧任务时旧任务状态为superseded并记录在job.superseded中。
+        """
+        if self.on_finish is not None:
+            job.finish_hooks.append(self.on_finish)
+        with self._lock:
+            rule, kept = self._coalesce(job)
+            if rule in ("duplicate", "idempotent"):
+                job.merged_into = kept
+                job.finish("merged")
+                self.coalesce_stats[rule] += 1
+            else:
+                for old in job.superseded:
+                    old.finish("superseded")
+                    self._jobs.remove(old)
+                self.coalesce_stats["superseded"] += len(job.superseded)
+                self._jobs.append(job)
+                self._boards[job.board] = True
+        self._notify()
+        self._dispatch()
+        return job
+
+    def _coalesce(self, job):
+        """入队合并规则，返回(规则, 保留的任务)，调用时需持有锁
+
+        duplicate：与该板卡最近一条等待任务完全相同的预设命令直接合并（强制加载不并入仅变化时加载）；
+        idempotent：声明为幂等的自定义命令或脚本，已有相同的等待命令时合并；
+        superseded：新的load_*替代同一板卡上目标被其覆盖的旧load_*等待任务，
+        旧任务与新任务之间有目标冲突的其他任务时不替代，以免改变执行顺序；
+        仅变化时加载的新任务不替代强制加载的旧任务。
+        保留的任务优先级不低于被合并的任务，被合并的任务允许抢占时保留的任务也须允许抢占，
+        否则紧急任务会因并入普通任务而失去优先级和抢占。
+        带前置任务或被其他任务依赖的任务不参与合并。前置任务被合并时依赖的是保留的任务。
+        """
+        if job.after:
+            return None, None
+        pending = [other for other in self._jobs if other.board == job.board and other.state == "pending"]
+        referenced = {id(dep.final) for other in self._jobs for dep in other.after}
+        
+        if job.kind != "preset":
+            if job.idempotent:
+                for other in pending:
+                    if (other.kind == job.kind and other.content == job.content and not other.after
+                            and self._covers(other, job)):
+                        return "idempotent", other
+            return None, None
+        
+        if pending:
+            last = pending[-1]
+            if (last.kind == job.kind and last.content == job.content and not last.after
+                    and (job.if_changed or not last.if_changed) and self._covers(last, job)):
+                return "duplicate", last
+        
+        if job.content.startswith("load_"):
+            for other in reversed(pending):
+                if (other.kind == "preset" and other.content.startswith("load_") and not other.after
+                        and other.targets <= job.targets and id(other) not in referenced
+                        and (other.if_changed or not job.if_changed) and self._covers(job, other)):
+                    job.superseded.append(other)
+                elif other.targets & job.targets:
+                    break
+            if job.superseded:
+                return "superseded", job
+        return None, None
+
+    @staticmethod
+    def _covers(kept, job):
+        """kept能否代替job执行：优先级不低于job，job允许抢占时kept也允许"""
+        return kept.priority >= job.priority and (kept.preempt or not job.preempt)
+
+    def depth(self, name):
+        """板卡的(等待数, 执行中任务数)"""
+        with self._lock:
+            pending = sum(1 for job in self._jobs if job.board == name and job.state == "pending")
+            running = sum(1 for job in self._jobs if job.board == name and job.state == "running")
+            return pending, running
+
+    def depths(self):
+        """所有有过任务的板卡的 {板卡名: (等待数, 执行中任务数)}"""
+        with self._lock:
+            result = OrderedDict((name, [0, 0]) for name in self._boards)
+            for job in self._jobs:
+                result[job.board][0 if job.state == "pending" else 1] += 1
+            return {name: tuple(counts) for name, counts in result.items()}
+
+    def is_busy(self):
+        with self._lock:
+            return bool(self._jobs)
+
+    def clear(self, name=None):
+        """取消等待中的任务（不影响正在执行的任务），依赖它们的任务随之跳过，返回取消的任务数"""
+        return self.cancel(board=name, running=False)
+
+    def cancel(self, job_id=None, board=None, running=True, pending=True):
+        """取消任务：等待中的任务直接移除，执行中的任务结束其进程或远程通道，返回取消的任务数
+
+        执行中的任务在其工作线程返回后才从调度中移除，期间板卡通道保持占用，状态始终一致。
+        """
+        count, to_stop = 0, []
+        with self._lock:
+            for job in self._jobs:
+                if (job_id is not None and job.id != job_id) or (board is not None and job.board != board):
+                    continue
+                if pending and job.state == "pending":
+                    job.cancel_reason = "cancelled"
+                    job.cancel_event.set()
+                    job.finish("cancelled")
+                    count += 1
+                elif running and job.state == "running" and not job.cancel_event.is_set():
+                    to_stop.append(job)
+                    count += 1
+            self._jobs = [job for job in self._jobs if job.state in ("pending", "running")]
+        
+        for job in to_stop:
+            self.log(f"[{job.board}] 正在终止：{job}")
+            threading.Thread(target=job.cancel, daemon=True).start()
+        self._notify()
+        self._dispatch()
+        return count
+
+    def get(self, job_id):
+        """按编号查找未结束的任务"""
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    @staticmethod
+    def _ahead(other, job):
+        """other是否应先于job执行"""
+        if other.state == "running":
+            return True
+        return (other.priority, -other.id) > (job.priority, -job.id)
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+    def _dispatch(self):
+        """启动所有已满足条件的任务；前置任务失败的任务标记为跳过（被合并的前置任务按保留的任务判断）"""
+        started, skipped, preempted = [], [], []
+        with self._lock:
+            changed = True
+            while changed:
+                changed = False
+                for job in list(self._jobs):
+                    if job.state != "pending":
+                        continue
+                    if any(dep.final.state not in ("pending", "running", "done") for dep in job.after):
+                        job.finish("skipped")
+                        self._jobs.remove(job)
+                        skipped.append(job)
+                        changed = True
+            
+            running = {}
+            for job in self._jobs:
+                if job.state == "running":
+                    running[job.board] = running.get(job.board, 0) + 1
+            
+            pending = sorted((job for job in self._jobs if job.state == "pending"),
+                             key=lambda job: (-job.priority, job.id))
+            for job in pending:
+                if job.state != "pending" or any(dep.final.state != "done" for dep in job.after):
+                    continue
+                # 同一板卡上目标有交集、优先级更高或同优先级更早提交、以及正在执行的任务先执行
+                blockers = [other for other in self._jobs
+                            if other is not job and other.board == job.board
+                            and other.targets & job.targets and self._ahead(other, job)]
+                if blockers:
+                    if job.preempt and all(other.state == "running" and other.priority < job.priority
+                                           for other in blockers):
+                        preempted.extend(other for other in blockers
+                                         if not other.cancel_event.is_set() and other not in preempted)
+                    continue
+                if running.get(job.board, 0) >= self.max_parallel(job.board):
+                    continue
+                job.state = "running"
+                job.started = time.time()
+                running[job.board] = running.get(job.board, 0) + 1
+                started.append(job)
+                if job.kind == "custom":
+                    self._take_batch(job)
+        
+        for job in skipped:
+            self.log(f"[{job.board}] 前置任务未成功，跳过：{job}")
+        for job in preempted:
+            self.log(f"[{job.board}] 被更高优先级任务抢占，正在终止：{job}")
+            threading.Thread(target=job.cancel, args=("preempted",), daemon=True).start()
+        for job in started:
+            threading.Thread(target=self._worker, args=(job,), daemon=True).start()
+        if started or skipped:
+            self._notify()
+
+    def _take_batch(self, job):
+        """把紧随job之后、可以一起执行的等待中自定义命令合并到job.batch（需持有锁）
+
+        按提交顺序向后查找同一板卡的任务，遇到目标冲突但不能合并的任务即停止，保证执行顺序不变。
+        """
+        limit = self.batch_limit(job.board)
+        if limit <= 1 or job.after:
+            return
+        referenced = {id(dep.final) for other in self._jobs for dep in other.after}
+        for other in self._jobs[self._jobs.index(job) + 1:]:
+            if len(job.batch) + 1 >= limit:
+                break
+            if other.board != job.board or not (other.targets & job.targets):
+                continue
+            if (other.state != "pending" or other.kind != "custom" or other.after or id(other) in referenced
+                    or other.priority != job.priority):
+                break
+            other.state = "running"
+            other.started = job.started
+            other.batch_leader = job
+            job.batch.append(other)
+
+    def _worker(self, job):
+        try:
+            job.result = self.run_job(job)
+            state = "done" if job.result and job.result[0] else "failed"
+        except Exception as e:
+            job.result = (False, str(e))
+            state = "failed"
+            self.log(f"[{job.board}] 命令执行异常：{str(e)}")
+        if job.cancel_event.is_set():
+            state = job.cancel_reason or "cancelled"
+            self.log(f"[{job.board}] {job.cancel_text}：{job}")
+        
+        with self._lock:
+            job.finish(state)
+            self._jobs.remove(job)
+            for member in job.batch:
+                if member.cancel_event.is_set():
+                    member_state = member.cancel_reason or "cancelled"
+                elif member.result is None:
+                    # 批次异常或被终止，未得到本条命令的结果
+                    member.result = job.result
+                    member_state = state if job.cancel_event.is_set() else "failed"
+                else:
+                    member_state = "done" if member.result[0] else "failed"
+                member.finish(member_state)
+                self._jobs.remove(member)
+        
+        self._dispatch()
+        with self._lock:
+            # 只由把板卡变为空闲的那个线程输出一次
+            board_idle = self._boards.get(job.board) and not any(other.board == job.board for other in self._jobs)
+            if board_idle:
+                self._boards[job.board] = False
+        if board_idle:
+            self.log(f"[{job.board}] 队列所有命令执行完毕")
+        self._notify()
+
+class HapsEngine:
+    """HAPS控制引擎 - 配置、板卡连接、路径解析、TCL生成、命令执行和任务调度
+
+    不依赖任何界面：日志交给log回调（默认输出到标准输出），错误提示和状态变化通过
+    report_error/notify_ssh_status/update_exec_status通知，图形界面重写这些方法。
+    auto_connect为True时默认板卡在首次执行任务时自动建立SSH连接（命令行和守护进程使用）。
+    """
+    FPGA_DONE_MARKER = "HAPS_FPGA_DONE"  # 配置状态查询每个FPGA输出一行：标记 FPGA 0/1
+    HASH_MARKER = "HAPS_HASH"  # 远程批量计算哈希时每个文件前输出的标记
+
+    def __init__(self, config_file="haps_config.json", log=None, auto_connect=True):
+        self.log = log or self.print_log
+        self.auto_connect = auto_connect
+
+        # 配置相关初始化
+        self.config_file = config_file
+        self.default_xactorscmd = "C:\\Synopsys\\protocomp-rtV-2024.09\\bin\\xactorscmd.bat"
+        
+        self.config = {
+            "mode": "local",  # 模式配置 local/ssh
+            "ssh_host": "192.168.1.1",
+            "ssh_port": 22,
+            "ssh_user": "admin",
+            "ssh_password": "",
+            "base_dir": "D:\\zxl_haps12\\mc8860\\mc20l\\mc20l_haps100_va_v2024",
+            "xactorscmd_path": self.default_xactorscmd,
+            "haps_control_path": "C:\\Synopsys\\tcl\\haps100control.bat",
+            "load_all_tcl": "C:\\Synopsys\\tcl\\load.tcl",
+            "load_master_tcl": "C:\\Synopsys\\tcl\\load_master.tcl",
+            "load_slave_tcl": "C:\\Synopsys\\tcl\\load_slave.tcl",
+            "reset_all_tcl": "C:\\Synopsys\\tcl\\reset.tcl",
+            "reset_master_tcl": "C:\\Synopsys\\tcl\\reset_master.tcl",
+            "reset_slave_tcl": "C:\\Synopsys\\tcl\\reset_slave.tcl",
+            "custom_commands": [""],
+            "custom_idempotent": [False],  # 与custom_commands一一对应，标记幂等命令
+            "default_tcl_path": "C:\\Synopsys\\tcl\\haps_control_default.tcl",
+            "session_mode": False,  # 常驻proto_rt会话，避免每条命令冷启动xactorscmd
+            "custom_batch": False,  # 连续等待中的自定义命令合并到一个临时TCL中执行（只打开/关闭一次句柄）
+            "custom_batch_max": 20,
+            "path_cache_ttl": 60,  # 远程路径元数据缓存有效期（秒）
+            "hw_cache_ttl": 3600,  # 硬件发现（DEVICE/SERIAL）缓存有效期（秒），0为每次都执行cfg_scan
+            "load_state_file": "haps_load_state.json",  # 各板卡最近一次成功加载的设计指纹，相对路径以配置文件所在目录为准
+            "bit_manifest_file": "haps_bit_manifest.json",  # bit文件(路径, 大小, 修改时间) -> SHA1清单，只重新计算变化的文件
+            "hash_workers": 4,  # 本地并行计算哈希的线程数
+            "script_store_dir": "",  # 临时脚本目录，为空时使用Bitfile路径下的.haps_scripts
+            "script_store_max_files": 200,
+            "script_store_max_mb": 50,
+            "ssh_keepalive": 30,  # transport保活间隔（秒）
+            "ssh_max_channels": 8,  # 共享连接上的最大并发通道数
+            "ssh_reconnect_retries": 5,
+            "output_encoding": "auto",  # 命令输出编码：auto/utf-8/gbk
+            "spool_dir": "",  # 任务完整输出暂存目录，为空时使用系统临时目录
+            "output_tail_lines": 200,
+            "spool_keep_files": 50,
+            "run_log_dir": "runs",  # 每条任务的运行日志目录，相对路径以配置文件所在目录为准
+            "run_log_file_mb": 50,  # 单个运行日志超过该大小时滚动为分段
+            "run_log_keep_plain": 20,  # 最近几条运行日志保持明文，更早的gzip压缩
+            "run_log_max_days": 30,
+            "run_log_max_mb": 1024,  # 运行日志目录总大小上限，超出时删除最早的日志
+            "run_log_index": "",  # 运行日志全文索引（SQLite），为空时为运行日志目录下的index.sqlite
+            "log_view_lines": 2000,  # 日志框中最多保留的行数，更早的日志滚动到顶部时从历史文件换入
+            "log_history_dir": "",  # 界面日志历史文件目录，为空时使用系统临时目录下的haps_logs
+            "log_history_keep": 10,  # 保留最近几个会话的日志历史文件
+            "phase_stats_file": "haps_phase_stats.json",  # 加载/复位各阶段耗时记录，相对路径以配置文件所在目录为准
+            "phase_stats_keep": 200,  # 每个板卡每条命令保留最近几次运行
+            "phase_markers": [list(item) for item in DEFAULT_PHASE_MARKERS],  # [阶段名, 该阶段开始时输出的文本]，按顺序
+            # 板卡注册表：每项为 {"name": 名称, 以及覆盖的配置项如 mode/ssh_host/ssh_user/ssh_password/base_dir}
+            "boards": [],
+            # 同一板卡上目标FPGA不冲突的任务最多同时执行数；默认的预设TCL会清除并配置整个系统（cfg_project_clear），
+            # 且同一时间只能有一个cfg_open，只有各预设脚本确实只操作各自FPGA时才可调大
+            "board_max_parallel": 1,
+            "preset_priority": {},  # 预设命令的默认优先级，如 {"reset_all": 10}，数值越大越先执行
+            # 各类命令的最长执行时间（秒，0为不限制），custom为自定义命令
+            "command_timeouts": {
+                "load_all": 1800, "load_master": 1200, "load_slave": 1200,
+                "reset_all": 300, "reset_master": 300, "reset_slave": 300,
+                "custom": 600
+            },
+            "inactivity_timeout": 600,  # 连续无输出超过该时间（秒）视为卡住，0为不限制
+            # 输出中出现这些内容说明命令在等待输入（如haps100control.bat的pause），立即终止
+            "stall_patterns": [
+                "Press any key to continue",
+                "请按任意键继续",
+                "xactorscmd.bat not found",
+                "TCL script not found"
+            ],
+            "daemon_port": 47100,  # haps守护进程监听的本机端口
+            "api_port": 47101,  # 守护进程的HTTP任务接口端口，0为不启用
+            "api_host": "127.0.0.1",  # 默认只监听本机
+            "api_stream_buffer": 1000,  # 每个输出订阅者最多缓存的行数，消费过慢时丢弃最旧的行
+            # 流程：步骤按目标FPGA和after声明的前置步骤组成依赖图，互不依赖的步骤并行执行
+            "campaigns": {
+                "加载并复位": [
+                    {"id": "load_master", "preset": "load_master"},
+                    {"id": "load_slave", "preset": "load_slave"},
+                    {"id": "reset", "preset": "reset_all", "after": ["load_master", "load_slave"]}
+                ]
+            }
+        }
+        
+        # 加载配置
+        self.load_config()
+        
+        # 板卡注册表：默认板卡使用全局配置（连接配置页中的SSH连接），其余板卡按需自动连接
+        self.boards = OrderedDict()
+        self.boards["default"] = HapsBoard("default", self.config)
+        for entry in self.config.get("boards", []):
+            name = str(entry.get("name", "")).strip()
+            if name and name not in self.boards:
+                self.boards[name] = HapsBoard(name, self.config, entry)
+        self.target_board = "default"
+        self.urgent = False  # 紧急模式：新命令以最高优先级提交并抢占正在执行的冲突任务
+        self.load_if_changed = False  # 仅设计变化时加载：load_*在设计未变化且FPGA已配置时跳过
+        
+        # 多板卡依赖调度：目标不冲突的任务并行执行
+        self.scheduler = BoardScheduler(
+            self.run_job, on_change=self.update_exec_status, log=self.sync_log,
+            max_parallel=lambda name: max(int(self.boards[name].config.get("board_max_parallel", 1)), 1),
+            batch_limit=self.custom_batch_limit, on_finish=lambda job: self.run_logs.finish(job)
+        )
+        
+        # 每条任务的运行日志，由后台线程写入
+        self.run_logs = RunLogWriter(
+            self.data_file("run_log_dir", "runs"),
+            file_max_bytes=self.config.get("run_log_file_mb", 50) * 1024 * 1024,
+            keep_plain=self.config.get("run_log_keep_plain", 20),
+            max_age_days=self.config.get("run_log_max_days", 30),
+            max_bytes=self.config.get("run_log_max_mb", 1024) * 1024 * 1024,
+            index=RunLogIndex(self.run_log_index_path()),
+            log=self.sync_log
+        )
+        
+        # 远程路径元数据缓存和默认TCL内容缓存
+        self.path_cache = RemotePathCache(self.config.get("path_cache_ttl", 60))
+        self._default_tcl_cache = {}
+        
+        # 各主机cfg_scan结果缓存，命中时生成的脚本跳过硬件扫描
+        self.hardware_cache = HardwareCache(self.config.get("hw_cache_ttl", 3600), log=self.sync_log)
+        
+        # 加载记录、bit文件清单和设计指纹计算（与加载并行）
+        self.load_state = LoadStateStore(self.data_file("load_state_file", "haps_load_state.json"), log=self.sync_log)
+        self.bit_manifest = BitfileManifest(self.data_file("bit_manifest_file", "haps_bit_manifest.json"),
+                                            self.config.get("hash_workers", 4), log=self.sync_log)
+        self._fingerprint_pool = ThreadPoolExecutor(max_workers=2)
+        
+        # 加载/复位的阶段耗时统计
+        self.phase_profiler = PhaseProfiler(self.data_file("phase_stats_file", "haps_phase_stats.json"),
+                                            self.config.get("phase_markers"), self.config.get("phase_stats_keep", 200),
+                                            log=self.sync_log)
+        
+        # 所有任务输出共用的读取循环，以及各主机探测到的输出编码
+        self.output_mux = OutputMultiplexer(log=self.sync_log)
+        self._host_encodings = {}
+
+    def data_file(self, key, default):
+        """配置中的数据文件路径，相对路径以配置文件所在目录为准"""
+        path = self.config.get(key, default)
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(self.config_file)), path)
+        return path
+
+    def run_log_index_path(self):
+        """运行日志全文索引的路径，未配置时放在运行日志目录下"""
+        if self.config.get("run_log_index"):
+            return self.data_file("run_log_index", "")
+        return os.path.join(self.data_file("run_log_dir", "runs"), "index.sqlite")
+
+    def search_run_logs(self, query, **filters):
+        """检索运行日志，参数见RunLogIndex.search"""
+        return RunLogIndex(self.run_log_index_path()).search(query, **filters)
+
+    # 默认板卡的SSH连接（连接配置页和远程文件浏览使用）
+    @property
+    def ssh_client(self):
+        return self.boards["default"].ssh_client
+
+    @ssh_client.setter
+    def ssh_client(self, value):
+        self.boards["default"].ssh_client = value
+
+    @property
+    def ssh_connected(self):
+        return self.boards["default"].ssh_connected
+
+    @ssh_connected.setter
+    def ssh_connected(self, value):
+        self.boards["default"].ssh_connected = value
+
+    # SSH连接逻辑
+    def connect_ssh(self):
+        try:
+            host = self.config["ssh_host"]
+            port = self.config["ssh_port"]
+            user = self.config["ssh_user"]
+            pwd = self.config["ssh_password"]
+            
+            if not host or not user:
+                self.sync_log("SSH连接失败：IP地址和用户名不能为空")
+                self.report_error("参数错误", "IP地址和用户名不能为空")
+                return
+            
+            self.sync_log(f"正在连接SSH：{host}:{port}")
+            self.open_board_connection(self.boards["default"])
+            self.path_cache.invalidate()
+            self.sync_log(f"SSH连接成功：{host}:{port}（耗时{self.ssh_client.connect_latency:.2f}s）")
+            self.check_remote_paths()
+                
+        except AuthenticationException:
+            self.sync_log("SSH认证失败：用户名或密码错误")
+            self.report_error("认证失败", "用户名或密码错误")
+        except SSHException as e:
+            self.sync_log(f"SSH协议错误：{str(e)}")
+            self.report_error("SSH错误", f"协议错误：{str(e)}")
+        except Exception as e:
+            self.sync_log(f"SSH连接失败：{str(e)}")
+            self.report_error("连接失败", f"无法连接：{str(e)}")
+        finally:
+            if not self.ssh_connected:
+                if self.ssh_client is not None:
+                    self.ssh_client.close()
+                self.ssh_client = None
+                
+            self.notify_ssh_status()
+
+    def open_board_connection(self, board):
+        """为板卡建立SSH连接并验证，失败时抛出异常"""
+        config = board.config
+        board.ssh_client = SSHConnectionManager(
+            config["ssh_host"], config["ssh_port"], config["ssh_user"], config["ssh_password"],
+            keepalive=config.get("ssh_keepalive", 30),
+            max_channels=config.get("ssh_max_channels", 8),
+            max_retries=config.get("ssh_reconnect_retries", 5),
+            log=self.sync_log,
+            on_state_change=lambda: self.on_ssh_reconnect(board)
+        )
+        board.ssh_client.connect()
+        
+        # 验证连接
+        stdin, stdout, stderr = board.ssh_client.exec_command("echo HAPS_CONNECTED", timeout=5)
+        output = self.process_data(stdout.read())
+        error = self.process_data(stderr.read())
+        
+        if error:
+            self.sync_log(f"连接验证错误: {error}")
+        
+        if "HAPS_CONNECTED" not in output and "484150535f434f4e4e4543544544" not in output:
+            raise Exception(f"连接验证失败，响应：{output}")
+        board.ssh_connected = True
+
+    def ensure_board_connected(self, board):
+        """注册板卡在首次执行任务时自动连接；图形界面中默认板卡需在连接配置页手动连接"""
+        if board.config.get("mode", "local") != "ssh" or board.ssh_connected:
+            return
+        if board.name == "default" and not self.auto_connect:
+            raise Exception("请先建立SSH连接")
+        self.sync_log(f"[{board.name}] 正在连接SSH：{board.config['ssh_host']}")
+        try:
+            self.open_board_connection(board)
+        except Exception:
+            if board.ssh_client is not None:
+                board.ssh_client.close()
+            board.ssh_client = None
+            raise
+        self.sync_log(f"[{board.name}] SSH连接成功（耗时{board.ssh_client.connect_latency:.2f}s）")
+
+    def on_ssh_reconnect(self, board=None):
+        """SSH自动重连成功或失败后：失效依赖旧连接的缓存和会话，刷新状态显示"""
+        board = board or self.boards["default"]
+        self.path_cache.invalidate(board.host)
+        board.sftp = None
+        self.notify_ssh_status()
+
+    def disconnect_board(self, board):
+        """关闭板卡的会话、SFTP和SSH连接"""
+        self.close_session(board)
+        self.close_sftp(board)
+        if board.ssh_client:
+            try:
+                board.ssh_client.close()
+                self.sync_log("SSH连接已断开" if board.name == "default" else f"[{board.name}] SSH连接已断开")
+            except Exception as e:
+                self.sync_log(f"断开SSH时出错：{str(e)}")
+        board.ssh_connected = False
+        board.ssh_client = None
+
+    def disconnect_ssh(self):
+        self.disconnect_board(self.boards["default"])
+        self.path_cache.invalidate()
+        self.notify_ssh_status()
+
+    def check_remote_paths(self):
+        """检查远程关键路径 - 所有候选路径（原始路径及Bitfile路径拼接）一次往返批量检查"""
+        base_dir = self.config.get("base_dir", "").strip()
+        
+        # 1. Bitfile路径（只需要是目录即可）
+        entries = []
+        if base_dir:
+            entries.append((base_dir, "基础目录", True))
+        
+        # 2. 其他文件路径
+        entries.extend([
+            (self.config["haps_control_path"], "haps100control.bat", False),
+            (self.config["xactorscmd_path"], "xactorscmd.bat", False),
+            (os.path.join(base_dir, "system", "targetsystem.tsd") if base_dir else "system\\targetsystem.tsd", "targetsystem.tsd", False),
+            (self.get_full_default_tcl_path(), "haps_control_default.tcl", False),
+            (self.config["load_all_tcl"], "Load All TCL", False),
+            (self.config["load_master_tcl"], "Load Master TCL", False),
+            (self.config["load_slave_tcl"], "Load Slave TCL", False),
+            (self.config["reset_all_tcl"], "Reset All TCL", False),
+            (self.config["reset_master_tcl"], "Reset Master TCL", False),
+            (self.config["reset_slave_tcl"], "Reset Slave TCL", False)
+        ])
+        
+        # 收集所有候选路径：原始路径 + Bitfile路径拼接
+        candidates = []
+        for path, desc, is_dir in entries:
+            if not path:
+                continue
+            candidates.append(path)
+            if base_dir and not os.path.isabs(path):
+                candidates.append(os.path.join(base_dir, path))
+        
+        try:
+            results = self.check_paths_batch(candidates)
+        except Exception as e:
+            self.sync_log(f"批量检查远程路径失败：{str(e)}")
+            return
+        
+        # 输出检查结果表
+        for path, desc, is_dir in entries:
+            if not path:
+                continue
+            found = self._log_path_result(path, desc, is_dir, results)
+            if not found and base_dir and not os.path.isabs(path):
+                combined_path = os.path.join(base_dir, path).replace("/", "\\")
+                self._log_path_result(combined_path, f"{desc} (Bitfile路径拼接)", is_dir, results)
+
+    def check_paths_batch(self, paths, use_cache=True, board=None, precise=False):
+        """批量检查远程路径，一次exec往返返回 {路径: {"type", "size", "mtime"}}
+        
+        type为 "dir"/"file"/None（不存在）；使用cmd的for变量修饰符一次取得属性、大小和修改时间。
+        命中路径缓存的条目不再访问远程，只有未命中的路径参与本次往返。
+        %~t只精确到分钟，precise为True时改由一次PowerShell取得LastWriteTimeUtc的ticks（100ns）作为mtime，
+        用于判断文件内容是否变化；PowerShell不可用时退回cmd探测。
+        """
+        normalized = []
+        for path in paths:
+            path = path.replace("/", "\\")
+            if path and path not in normalized:
+                normalized.append(path)
+        
+        board = board or self.boards["default"]
+        results = {}
+        host = board.host
+        if use_cache:
+            pending = []
+            for path in normalized:
+                entry = self.path_cache.get(host, path, precise)
+                if entry is None:
+                    pending.append(path)
+                else:
+                    results[path] = entry
+            normalized = pending
+        if not normalized:
+            return results
+        
+        # cmd命令行长度有限（8191），按长度分块，通常一块即可覆盖全部路径
+        chunks, current, length = [], [], 0
+        for index, path in enumerate(normalized):
+            if current and length + len(path) + 60 > 6000:
+                chunks.append(current)
+                current, length = [], 0
+            current.append(index)
+            length += len(path) + 60
+        chunks.append(current)
+        
+        for chunk in chunks:
+            parsed = self._probe_paths(board, normalized, chunk, precise)
+            if precise and not parsed:
+                self.sync_log("PowerShell探测失败，退回cmd探测（修改时间只精确到分钟）")
+                parsed = self._probe_paths(board, normalized, chunk, False)
+            results.update(parsed)
+        
+        # 没有返回结果的路径按不存在处理，并写入缓存（PowerShell不可用退回cmd探测的条目按cmd格式存放）
+        for path in normalized:
+            results.setdefault(path, {"type": None, "size": None, "mtime": None})
+            mtime = results[path]["mtime"]
+            self.path_cache.put(host, path, results[path], precise and (mtime is None or str(mtime).isdigit()))
+        return results
+
+    def _probe_paths(self, board, paths, indexes, precise):
+        """执行一次路径探测，输出每行为"序号|属性|大小|修改时间"，返回 {路径: 条目}"""
+        if precise:
+            quoted = ",".join("'" + paths[index].replace("'", "''") + "'" for index in indexes)
+            command = (
+                'powershell -NoProfile -NonInteractive -Command "'
+                f"$ids=@({','.join(str(index) for index in indexes)});$ps=@({quoted});"
+                "for($k=0;$k -lt $ps.Count;$k++){"
+                "$f=Get-Item -LiteralPath $ps[$k] -Force -ErrorAction SilentlyContinue;"
+                "if($f){if($f.PSIsContainer){$a='d';$z=''}else{$a='-';$z=$f.Length};"
+                "'{0}|{1}|{2}|{3}' -f $ids[$k],$a,$z,$f.LastWriteTimeUtc.Ticks}"
+                "else{'{0}|||' -f $ids[$k]}}\""
+            )
+        else:
+            command = " & ".join(f'(for %I in ("{paths[index]}") do @echo {index}^|%~aI^|%~zI^|%~tI)'
+                                 for index in indexes)
+        stdin, stdout, stderr = board.ssh_client.exec_command(command, timeout=30 if precise else 10)
+        output = self.process_data(stdout.read())
+        error = self.process_data(stderr.read())
+        if error:
+            self.sync_log(f"路径批量检查错误：{error}")
+        
+        results = {}
+        for line in output.splitlines():
+            line = line.strip()
+            # 兼容部分SSH服务端以十六进制返回输出的情况
+            if line and "|" not in line:
+                try:
+                    line = bytes.fromhex(line).decode("gbk", errors="replace").strip()
+                except ValueError:
+                    continue
+            parts = line.split("|", 3)
+            if len(parts) != 4 or not parts[0].isdigit():
+                continue
+            index = int(parts[0])
+            if index >= len(paths):
+                continue
+            attrs, size, mtime = parts[1].strip(), parts[2].strip(), parts[3].strip()
+            if not attrs:
+                entry = {"type": None, "size": None, "mtime": None}
+            else:
+                entry = {
+                    "type": "dir" if attrs.lower().startswith("d") else "file",
+                    "size": int(size) if size.isdigit() else None,
+                    "mtime": mtime or None
+                }
+            results[paths[index]] = entry
+        return results
+
+    def _log_path_result(self, path, description, is_directory, results):
+        """根据批量检查结果输出日志，返回路径是否符合预期类型"""
+        path = path.replace("/", "\\")
+        path_type = results.get(path, {}).get("type")
+        
+        if is_directory:
+            if path_type == "dir":
+                self.sync_log(f"[{description}] 目录存在：{path}")
+                return True
+            elif path_type == "file":
+                self.sync_log(f"[{description}] 路径存在但不是目录：{path}")
+            else:
+                self.sync_log(f"[{description}] 目录不存在：{path}")
+        else:
+            if path_type == "file":
+                self.sync_log(f"[{description}] 文件存在：{path}")
+                return True
+            elif path_type == "dir":
+                self.sync_log(f"[{description}] 路径存在但不是文件：{path}")
+            else:
+                self.sync_log(f"[{description}] 文件不存在：{path}")
+        return False
+
+    def refresh_path_cache(self):
+        """手动失效路径缓存和硬件发现缓存并输出命中统计"""
+        stats = self.path_cache.stats()
+        self.path_cache.invalidate()
+        self.sync_log(f"路径缓存已刷新（命中：{stats['hits']}，未命中：{stats['misses']}，条目：{stats['entries']}）")
+        stats = self.hardware_cache.stats()
+        self.hardware_cache.invalidate()
+        self.sync_log(f"硬件发现缓存已刷新（命中：{stats['hits']}，未命中：{stats['misses']}）")
+
+    def check_path(self, path, description, is_directory=False, return_full_path=False):
+        """检查路径是否存在"""
+        path = path.replace("/", "\\")
+        try:
+            results = self.check_paths_batch([path])
+            found = self._log_path_result(path, description, is_directory, results)
+        except Exception as e:
+            self.sync_log(f"[{description}] 检查失败：{str(e)}")
+            found = False
+        return (found, path) if return_full_path else found
+
+    # 命令执行逻辑
+    def target_boards(self, board_name=None):
+        """解析目标板卡，"全部"表示所有已注册板卡"""
+        board_name = board_name or self.target_board
+        if board_name == "全部":
+            return list(self.boards.values())
+        if board_name not in self.boards:
+            raise ValueError(f"未注册的板卡：{board_name}")
+        return [self.boards[board_name]]
+
+    def submit_job(self, kind, content, board_name=None, idempotent=False, urgent=None, on_output=None,
+                   if_changed=None):
+        """按目标板卡提交任务，返回提交的任务列表（含入队时被合并的任务）
+
+        urgent、if_changed为None时沿用界面上的紧急模式和仅设计变化时加载；if_changed只对load_*有效；
+        on_output(job, line)接收任务的每行命令输出，被合并的任务转而接收保留任务的输出。
+        """
+        try:
+            boards = self.target_boards(board_name)
+        except ValueError as e:
+            self.report_error("参数错误", str(e))
+            return []
+        
+        default = self.boards["default"]
+        if (not self.auto_connect and default in boards
+                and default.config.get("mode", "local") == "ssh" and not default.ssh_connected):
+            self.report_error("未连接", "请先建立SSH连接")
+            return []
+        
+        if self.urgent if urgent is None else urgent:
+            priority, preempt = URGENT_PRIORITY, True
+        else:
+            priority, preempt = self.config.get("preset_priority", {}).get(content, 0) if kind == 'preset' else 0, False
+        if_changed = (kind == 'preset' and content.startswith("load_")
+                      and (self.load_if_changed if if_changed is None else if_changed))
+        jobs = []
+        for board in boards:
+            job = Job(board.name, kind, content, idempotent=idempotent, priority=priority, preempt=preempt,
+                      if_changed=if_changed)
+            if on_output is not None:
+                job.output_hooks.append(lambda line, job=job: on_output(job, line))
+            jobs.append(self.scheduler.submit(job))
+        for job in jobs:
+            if job.state == "merged":
+                if on_output is not None:
+                    job.merged_into.output_hooks.append(lambda line, job=job: on_output(job, line))
+                self.sync_log(f"[{job.board}] 与等待中的{job.merged_into}相同，已合并")
+            for old in job.superseded:
+                self.sync_log(f"[{job.board}] 等待中的{old}已被新命令替代")
+        return jobs
+
+    def submit_campaign(self, campaign_name, board_name=None, on_output=None):
+        """按依赖图提交流程，目标为"全部"时每个板卡各提交一份，返回提交的任务列表"""
+        steps = self.config.get("campaigns", {}).get(campaign_name)
+        if not steps:
+            self.report_error("参数错误", f"未定义的流程：{campaign_name}")
+            return []
+        
+        try:
+            boards = self.target_boards(board_name)
+            jobs = []
+            for board in boards:
+                by_id = {}
+                for step in steps:
+                    after = []
+                    for dep in step.get("after", []):
+                        if dep not in by_id:
+                            raise ValueError(f"流程[{campaign_name}]步骤{step.get('id')}的前置步骤{dep}未在其之前定义")
+                        after.append(by_id[dep])
+                    if "preset" in step:
+                        if step["preset"] not in PRESET_TARGETS:
+                            raise ValueError(f"流程[{campaign_name}]中未知的预设命令：{step['preset']}")
+                        job = Job(board.name, 'preset', step["preset"], step.get("targets"), after,
+                                  if_changed=bool(step.get("if_changed")) and step["preset"].startswith("load_"))
+                    elif step.get("custom", "").strip():
+                        job = Job(board.name, 'custom', step["custom"].strip(), step.get("targets"), after)
+                    else:
+                        raise ValueError(f"流程[{campaign_name}]步骤{step.get('id')}缺少preset或custom")
+                    by_id[step.get("id", str(job.id))] = job
+                    jobs.append(job)
+        except ValueError as e:
+            self.report_error("参数错误", str(e))
+            return []
+        
+        default = self.boards["default"]
+        if (not self.auto_connect and default in boards
+                and default.config.get("mode", "local") == "ssh" and not default.ssh_connected):
+            self.report_error("未连接", "请先建立SSH连接")
+            return []
+        
+        for job in jobs:
+            if on_output is not None:
+                job.output_hooks.append(lambda line, job=job: on_output(job, line))
+            self.scheduler.submit(job)
+        self.sync_log(f"流程[{campaign_name}]已提交：{len(jobs)}个任务，目标板卡：{'、'.join(board.name for board in boards)}")
+        return jobs
+
+    def queue_command(self, cmd_type, board_name=None):
+        """将预设命令加入目标板卡的队列"""
+        for job in self.submit_job('preset', cmd_type, board_name):
+            if job.state != "merged":
+                pending, running = self.scheduler.depth(job.board)
+                self.sync_log(f"预设命令[{cmd_type}]加入板卡[{job.board}]队列，当前队列：{pending}")
+
+    def queue_custom_command(self, cmd_text, board_name=None, idempotent=False):
+        """将自定义命令加入目标板卡的队列"""
+        cmd_text = cmd_text.strip()
+        if not cmd_text:
+            self.report_error("命令为空", "请输入有效的命令", level="warning")
+            return
+        
+        for job in self.submit_job('custom', cmd_text, board_name, idempotent):
+            if job.state != "merged":
+                self.sync_log(f"自定义命令加入板卡[{job.board}]队列：{cmd_text}")
+
+    def run_job(self, job):
+        """在板卡通道的工作线程中执行一条任务，返回(成功, 消息)"""
+        board = self.boards[job.board]
+        for item in [job] + job.batch:
+            self.run_logs.start(item)
+            item.output_hooks.append(lambda line, item=item: self.run_logs.line(item, line))
+        try:
+            self.ensure_board_connected(board)
+        except Exception as e:
+            self.sync_log(f"[{board.name}] SSH连接失败：{str(e)}")
+            return False, str(e)
+        
+        # 按命令类型的超时、无输出超时和等待输入提示终止卡住的命令；合并执行时总超时按命令条数累加
+        config = board.config
+        timeouts = config.get("command_timeouts", {})
+        job.watchdog = CommandWatchdog(
+            job,
+            timeout=timeouts.get(job.content if job.kind == 'preset' else 'custom', 0) * (1 + len(job.batch)),
+            inactivity=config.get("inactivity_timeout", 0),
+            patterns=config.get("stall_patterns", []),
+            log=self.sync_log
+        ).start()
+        for member in job.batch:
+            member.watchdog = job.watchdog
+        try:
+            if job.batch:
+                self.sync_log(f"[{board.name}] 合并执行{len(job.batch) + 1}条自定义命令："
+                              f"{'、'.join(f'#{item.id}' for item in [job] + job.batch)}")
+                result = self.run_custom_batch([job] + job.batch, board)
+            elif job.kind == 'preset' and job.content.startswith("load_"):
+                result = self.run_load(job.content, board, job)
+            elif job.kind == 'preset':
+                self.sync_log(f"[{board.name}] 开始执行预设命令：{job.content}")
+                result = self.run_profiled(job.content, board, job)
+            elif job.kind == 'script':
+                self.sync_log(f"[{board.name}] 开始执行TCL脚本：{job.content}")
+                result = self.run_tcl_script(job.content, f"TCL脚本[{job.content}]", board, job)
+            else:
+                self.sync_log(f"[{board.name}] 开始执行自定义命令：{job.content}")
+                result = self.run_custom_tcl_command(job.content, board, job)
+        finally:
+            job.watchdog.stop()
+        
+        if board.config.get("mode", "local") == "ssh":
+            stats = self.path_cache.stats()
+            self.sync_log(f"路径缓存统计：命中 {stats['hits']}，未命中 {stats['misses']}")
+        return result
+
+    def run_profiled(self, cmd_type, board, job):
+        """执行预设命令并按输出中的里程碑记录阶段耗时
+
+        计时只覆盖命令本身：仅变化时加载的配置检查同样输出扫描/连接的里程碑，不能计入；跳过的加载不记录。
+        """
+        tracker = self.phase_profiler.tracker()
+        job.output_hooks.append(tracker.feed)
+        try:
+            result = self.run_haps_command(cmd_type, board, job)
+        finally:
+            job.output_hooks.remove(tracker.feed)
+        self.record_phases(board, job, tracker, result[0])
+        return result
+
+    def record_phases(self, board, job, tracker, ok):
+        """记录一次加载/复位的阶段耗时并写入日志，超过该阶段历史p95的阶段标记为偏慢"""
+        history = {row["phase"]: row for row in self.phase_profiler.summary(board.name, job.content)
+                   if row["command"] == job.content}
+        durations = self.phase_profiler.record(board.name, job.content, tracker, ok)
+        if durations is None:
+            return
+        slow = [phase for phase, seconds in durations.items()
+                if phase in history and history[phase]["count"] >= 5 and seconds > history[phase]["p95"]]
+        parts = "、".join(f"{phase} {seconds:.1f}s" for phase, seconds in durations.items())
+        note = f"；偏慢（超过p95）：{'、'.join(slow)}" if ok and slow else ""
+        self.sync_log(f"[{board.name}] {job.content}阶段耗时：{parts}（共{sum(durations.values()):.1f}s）{note}")
+
+    def phase_summary(self, board=None, command=None):
+        """各板卡各命令的阶段耗时统计（p50/p95），见PhaseProfiler.summary"""
+        return self.phase_profiler.summary(board, command)
+
+    def run_load(self, cmd_type, board, job):
+        """执行load_*预设命令并记录设计指纹
+
+        指纹在后台线程中与加载并行计算，加载成功后记录到目标FPGA，失败时清除记录；
+        job.if_changed时先比较指纹，设计未变化且所有FPGA仍处于已配置状态则跳过加载。
+        """
+        targets = PRESET_TARGETS[cmd_type]
+        pending = self._fingerprint_pool.submit(self.project_fingerprint, board)
+        if job.if_changed:
+            fingerprint = self.wait_fingerprint(pending, board)
+            if fingerprint is None or not self.load_state.matches(board.name, targets, fingerprint):
+                self.sync_log(f"[{board.name}] 设计已变化或没有加载记录，执行加载：{cmd_type}")
+            else:
+                configured, states = self.check_fpgas_configured(board, job)
+                if configured:
+                    self.sync_log(f"[{board.name}] 设计未变化且FPGA均已配置（{'、'.join(states)}），跳过加载：{cmd_type}")
+                    return True, "设计未变化，跳过加载"
+                if job.cancel_event.is_set():
+                    return False, job.cancel_text
+                self.sync_log(f"[{board.name}] 设计未变化但FPGA未全部配置，执行加载：{cmd_type}")
+        
+        self.sync_log(f"[{board.name}] 开始执行预设命令：{cmd_type}")
+        success, msg = self.run_profiled(cmd_type, board, job)
+        fingerprint = self.wait_fingerprint(pending, board) if success else None
+        if fingerprint is not None:
+            self.load_state.record(board.name, targets, fingerprint)
+        else:
+            self.load_state.clear(board.name, targets)
+        return success, msg
+
+    def wait_fingerprint(self, pending, board):
+        """等待后台计算的设计指纹，失败时返回None"""
+        try:
+            return pending.result()
+        except Exception as e:
+            self.sync_log(f"[{board.name}] 计算设计指纹失败：{str(e)}")
+            return None
+
+    def check_fpgas_configured(self, board, job):
+        """查询板卡上各用户FPGA的配置完成状态，返回(是否全部已配置, {FPGA: 是否已配置})"""
+        script = ("foreach __haps_fpga [cfg_status_get_user_fpgas $HAPS_HANDLE] {\n"
+                  f"    puts \"{self.FPGA_DONE_MARKER} $__haps_fpga [cfg_status_get_done $HAPS_HANDLE $__haps_fpga]\"\n"
+                  "}")
+        states = {}
+        log_line = self.output_logger(board, job)
+        
+        def on_line(line):
+            log_line(line)
+            parts = line.split()
+            if len(parts) == 3 and parts[0] == self.FPGA_DONE_MARKER:
+                states[parts[1]] = parts[2] == "1"
+        
+        success, msg = self.run_custom_tcl_command(script, board, job, on_line=on_line)
+        return success and bool(states) and all(states.values()), states
+
+    def project_fingerprint(self, board):
+        """计算板卡工程的设计指纹：targetsystem.tsd及其引用的bit文件内容的SHA1
+
+        tsd中找不到bit文件引用时退而使用Bitfile路径下的全部bit文件；SSH模式下所有bit文件的哈希
+        在一次exec中由certutil批量计算，不传输文件内容。
+        """
+        config = board.config
+        pathmod = ntpath if config.get("mode", "local") == "ssh" else os.path
+        base_dir = config.get("base_dir", "").strip()
+        tsd_path = pathmod.join(base_dir, "system", "targetsystem.tsd")
+        tsd = self.read_board_file(board, tsd_path)
+        
+        # tsd引用的bit文件：绝对路径直接使用，相对路径依次按tsd所在目录和Bitfile路径解析
+        tsd_dir = pathmod.dirname(tsd_path)
+        references = []
+        for ref in dict.fromkeys(BIT_FILE_PATTERN.findall(tsd.decode("utf-8", errors="replace"))):
+            if pathmod.isabs(ref):
+                references.append([pathmod.normpath(ref)])
+            else:
+                references.append([pathmod.normpath(pathmod.join(tsd_dir, ref)),
+                                   pathmod.normpath(pathmod.join(base_dir, ref))])
+        bit_files = self.resolve_bit_files(board, references)
+        if not bit_files:
+            bit_files = self.list_bit_files(board, base_dir)
+        
+        hashes = self.hash_files(board, bit_files)
+        digest = hashlib.sha1(tsd)
+        for path in sorted(bit_files, key=str.lower):
+            digest.update(f"\n{path.lower()}={hashes[path]}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def read_board_file(self, board, path):
+        """读取板卡主机上的文件内容（bytes）"""
+        if board.config.get("mode", "local") == "local":
+            with open(path, 'rb') as f:
+                return f.read()
+        stdin, stdout, stderr = board.ssh_client.exec_command(f'type "{path}"', timeout=30)
+        content = stdout.read()
+        error = self.process_data(stderr.read())
+        if error:
+            raise Exception(f"读取{path}失败：{error}")
+        return content
+
+    def resolve_bit_files(self, board, references):
+        """每个引用取第一个存在的候选路径，返回存在的bit文件列表"""
+        if board.config.get("mode", "local") == "local":
+            exists = lambda path: os.path.isfile(path)
+        else:
+            results = self.check_paths_batch([path for options in references for path in options], board=board)
+            exists = lambda path: results.get(path, {}).get("type") == "file"
+        bit_files = []
+        for options in references:
+            path = next((path for path in options if exists(path)), None)
+            if path is not None and path not in bit_files:
+                bit_files.append(path)
+        return bit_files
+
+    def list_bit_files(self, board, base_dir):
+        """列出Bitfile路径下（含子目录）的全部bit文件"""
+        if not base_dir:
+            return []
+        if board.config.get("mode", "local") == "local":
+            return [os.path.join(root, name) for root, dirs, files in os.walk(base_dir)
+                    for name in files if name.lower().endswith(".bit")]
+        stdin, stdout, stderr = board.ssh_client.exec_command(f'dir /s /b /a-d "{base_dir}\\*.bit"', timeout=60)
+        output = self.process_data(stdout.read())
+        return [line.strip() for line in output.splitlines() if line.strip().lower().endswith(".bit")]
+
+    def hash_files(self, board, paths):
+        """计算文件的SHA1，返回 {路径: 十六进制摘要}；大小和修改时间与bit文件清单一致的文件不重新计算
+
+        远程修改时间取精确的ticks；PowerShell不可用退回%~t时修改时间只精确到分钟，这些文件每次都重新计算。
+        """
+        if board.config.get("mode", "local") == "local":
+            return self.bit_manifest.hash_local(paths)
+        
+        results = self.check_paths_batch(paths, use_cache=False, board=board, precise=True)
+        stats, imprecise = {}, []
+        for path in paths:
+            entry = results.get(path.replace("/", "\\"), {})
+            if entry.get("type") != "file":
+                raise Exception(f"文件不存在：{path}")
+            if str(entry["mtime"] or "").isdigit():
+                stats[path] = (entry["size"], entry["mtime"])
+            else:
+                imprecise.append(path)
+        hashes, changed = self.bit_manifest.lookup(board.host, stats)
+        changed += imprecise
+        if changed:
+            self.sync_log(f"[{board.name}] 计算{len(changed)}个远程文件的哈希（{len(hashes)}个未变化）")
+            computed = self.remote_hash_files(board, changed)
+            self.bit_manifest.update(board.host, {path: stats[path] + (computed[path],)
+                                                  for path in changed if path in stats})
+            hashes.update(computed)
+        return hashes
+
+    def remote_hash_files(self, board, paths):
+        """在板卡主机上用certutil批量计算SHA1，按命令行长度分块，通常一次exec完成"""
+        hashes = {}
+        chunks, current, length = [], [], 0
+        for index, path in enumerate(paths):
+            probe = f'(echo {self.HASH_MARKER} {index} & certutil -hashfile "{path}" SHA1)'
+            if current and length + len(probe) > 6000:
+                chunks.append(current)
+                current, length = [], 0
+            current.append(probe)
+            length += len(probe) + 3
+        if current:
+            chunks.append(current)
+        
+        for chunk in chunks:
+            stdin, stdout, stderr = board.ssh_client.exec_command(" & ".join(chunk), timeout=300)
+            index = None
+            # certutil的提示文字随系统语言变化，只取标记之后第一行40位十六进制摘要（旧版本以空格分隔字节）
+            for line in self.process_data(stdout.read()).splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == self.HASH_MARKER and parts[1].isdigit():
+                    index = int(parts[1])
+                    continue
+                compact = line.replace(" ", "").strip().lower()
+                if index is not None and len(compact) == 40 and all(ch in "0123456789abcdef" for ch in compact):
+                    hashes[paths[index]] = compact
+                    index = None
+        
+        missing = [path for path in paths if path not in hashes]
+        if missing:
+            raise Exception(f"计算文件哈希失败：{'、'.join(missing)}")
+        return hashes
+
+    def bit_manifest_of(self, board):
+        """Bitfile路径下全部bit文件的 {路径: SHA1}（变化检测、上传判断和审计共用）"""
+        base_dir = board.config.get("base_dir", "").strip()
+        if not base_dir:
+            raise ValueError("Bitfile路径未设置")
+        return self.hash_files(board, self.list_bit_files(board, base_dir))
+
+    def custom_batch_limit(self, board_name):
+        """板卡上一次最多合并执行的自定义命令数；常驻会话模式下命令本身已无冷启动开销，不合并"""
+        config = self.boards[board_name].config
+        if not config.get("custom_batch", False) or config.get("session_mode", False):
+            return 1
+        return max(int(config.get("custom_batch_max", 20)), 1)
+
+    def run_custom_batch(self, jobs, board):
+        """把多条自定义命令合并到一个临时TCL中执行，为每条命令设置result，返回第一条的结果"""
+        batch = CustomBatch(jobs, {job.id: self.output_logger(board, job) for job in jobs},
+                            self.output_logger(board, jobs[0]))
+        
+        # 其中任一条被取消时终止整个批次
+        leader = jobs[0]
+        hooks = []
+        for job in jobs[1:]:
+            hook = lambda job=job: leader.cancel(job.cancel_reason or "cancelled", f"合并执行的{job}被终止")
+            job.add_cancel_hook(hook)
+            hooks.append((job, hook))
+        try:
+            success, msg = self.run_custom_tcl_command(batch.script(), board, leader, on_line=batch.feed)
+        finally:
+            for job, hook in hooks:
+                job.remove_cancel_hook(hook)
+        
+        for job in jobs:
+            if job is not leader and job.id not in batch.codes and leader.cancel_event.is_set():
+                continue  # 批次被终止，由调度器按终止原因记录
+            job.result = batch.result(job, msg)
+            if job.id in batch.codes:
+                job.return_code = batch.codes[job.id]
+            self.sync_log(f"[{board.name}] {job}：{'成功' if job.result[0] else '失败'}，{job.result[1]}")
+        return leader.result
+
+    def get_full_default_tcl_path(self, board=None):
+        """获取完整的默认TCL文件路径"""
+        config = (board or self.boards["default"]).config
+        default_tcl_path = config.get("default_tcl_path", "tcl\\haps_control_default.tcl").strip()
+        base_dir = config.get("base_dir", "").strip()
+        
+        # 检查是否为绝对路径
+        if os.path.isabs(default_tcl_path) or (len(default_tcl_path) > 1 and default_tcl_path[1] == ':'):
+            return default_tcl_path
+        # 否则拼接Bitfile路径
+        if base_dir:
+            return os.path.join(base_dir, default_tcl_path).replace("/", "\\")
+        return default_tcl_path
+
+    def read_default_tcl(self, default_tcl_path, base_dir, board=None):
+        """读取默认TCL内容，以(主机, 路径)为键、(大小, 修改时间)为版本缓存"""
+        board = board or self.boards["default"]
+        mode = board.config.get("mode", "local")
+        if mode == "local":
+            # 本地模式：一次stat判断是否变化
+            stat = os.stat(default_tcl_path)
+            host, full_path, version = "", default_tcl_path, (stat.st_size, stat.st_mtime_ns)
+        else:
+            # SSH模式：原始路径和Bitfile路径拼接一次批量stat，修改时间取精确的ticks；
+            # 版本在路径缓存的TTL内复用，连续执行的自定义命令不必每条都远程探测
+            candidates = [default_tcl_path]
+            if base_dir and not os.path.isabs(default_tcl_path):
+                candidates.append(os.path.join(base_dir, default_tcl_path))
+            results = self.check_paths_batch(candidates, board=board, precise=True)
+            
+            full_path = None
+            for candidate in candidates:
+                candidate = candidate.replace("/", "\\")
+                entry = results.get(candidate, {})
+                if entry.get("type") == "file":
+                    full_path = candidate
+                    break
+            if not full_path:
+                raise Exception(f"默认TCL文件不存在：{default_tcl_path}")
+            host, version = board.host, (entry.get("size"), entry.get("mtime"))
+        
+        key = (host, RemotePathCache.normalize(full_path))
+        cached = self._default_tcl_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        self.sync_log(f"读取默认TCL文件内容：{full_path}")
+        if mode == "local":
+            with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+        else:
+            cat_cmd = f'type "{full_path}"'  # Windows系统使用type命令
+            stdin, stdout, stderr = board.ssh_client.exec_command(cat_cmd, timeout=30)
+            content_bytes = stdout.read()
+            error = self.process_data(stderr.read())
+            if error:
+                raise Exception(f"读取默认TCL文件错误：{error}")
+            
+            # 处理内容编码
+            try:
+                content = content_bytes.decode('gbk', errors='replace')
+            except:
+                content = content_bytes.decode('utf-8', errors='replace')
+        
+        self._default_tcl_cache[key] = (version, content)
+        return content
+
+    def get_sftp(self, board=None):
+        """获取板卡复用的SFTP会话，断开后自动重新打开"""
+        board = board or self.boards["default"]
+        channel = board.sftp.get_channel() if board.sftp is not None else None
+        if channel is None or channel.closed:
+            board.sftp = board.ssh_client.open_sftp()
+        return board.sftp
+
+    def close_sftp(self, board=None):
+        """关闭板卡复用的SFTP会话"""
+        board = board or self.boards["default"]
+        if board.sftp is not None:
+            try:
+                board.sftp.close()
+            except Exception:
+                pass
+        board.sftp = None
+        board.script_store = None
+        board.script_store_key = None
+
+    def get_script_store(self, board=None):
+        """获取板卡当前模式和目录对应的脚本存储"""
+        board = board or self.boards["default"]
+        config = board.config
+        mode = config.get("mode", "local")
+        base_dir = config.get("base_dir", "").strip()
+        root_dir = config.get("script_store_dir", "").strip()
+        if not root_dir:
+            root_dir = os.path.join(base_dir, ".haps_scripts") if base_dir else ".haps_scripts"
+        
+        key = (mode, board.host, root_dir)
+        if board.script_store is None or board.script_store_key != key:
+            board.script_store = ScriptStore(
+                mode, root_dir,
+                sftp_factory=lambda: self.get_sftp(board),
+                max_files=config.get("script_store_max_files", 200),
+                max_bytes=config.get("script_store_max_mb", 50) * 1024 * 1024,
+                log=self.sync_log,
+                key=key
+            )
+            board.script_store_key = key
+        return board.script_store
+
+    def generate_temp_tcl_file(self, custom_command, board=None, pin=False):
+        """生成临时TCL文件；pin为True时脚本固定到release_script为止"""
+        board = board or self.boards["default"]
+        try:
+            # 1. 获取路径信息
+            default_tcl_path = self.get_full_default_tcl_path(board)
+            base_dir = board.config.get("base_dir", "").strip()
+            
+            self.sync_log(f"默认TCL路径：{default_tcl_path}")
+            
+            # 2. 读取默认TCL文件内容（按路径+修改时间/大小缓存，未变化时不再读取）
+            mode = board.config.get("mode", "local")
+            default_content = self.read_default_tcl(default_tcl_path, base_dir, board)
+            
+            # 3. 构建临时文件内容（硬件发现缓存命中时先预设DEVICE/SERIAL，跳过cfg_scan）
+            temp_content = self.hardware_cache.prelude(board.host)
+            temp_content += f"{default_content}\n"  # 默认内容
+            temp_content += f"{custom_command}\n"  # 自定义命令
+            temp_content += "cfg_close $HAPS_HANDLE\n"  # 关闭句柄命令
+            
+            # 4. 写入内容寻址的脚本存储（相同内容已存在时跳过上传）
+            temp_tcl_path = self.get_script_store(board).put(temp_content, pin=pin)
+            if mode == "ssh":
+                self.path_cache.invalidate(board.host, temp_tcl_path)
+            
+            self.sync_log(f"临时TCL文件生成成功：{temp_tcl_path}")
+            return temp_tcl_path
+            
+        except Exception as e:
+            self.sync_log(f"生成临时TCL文件失败：{str(e)}")
+            raise
+
+    def run_custom_tcl_command(self, custom_command, board=None, job=None, on_line=None):
+        """执行自定义命令；on_line为None时输出按任务写入日志，否则交给on_line（合并执行时按标记拆分）"""
+        board = board or self.boards["default"]
+        temp_tcl_path = None
+        try:
+            # 1. 验证必要路径配置
+            config = board.config
+            haps_ctrl = config["haps_control_path"]
+            xactorscmd = config["xactorscmd_path"]
+            base_dir = config.get("base_dir", "").strip()
+            
+            if not haps_ctrl or not xactorscmd:
+                raise ValueError("haps100control和xactorscmd路径不能为空")
+            
+            # 处理haps_control路径
+            resolved_haps = self.resolve_path(haps_ctrl, base_dir, board)
+            # 处理xactorscmd路径
+            resolved_xactor = self.resolve_path(xactorscmd, base_dir, board)
+            
+            # 常驻会话模式：直接在已打开的$HAPS_HANDLE上执行，无需生成临时文件
+            handled, success, msg = False, False, ""
+            if on_line is None:
+                handled, success, msg = self.run_in_session(resolved_xactor, base_dir, script=custom_command,
+                                                            board=board, job=job)
+            if handled:
+                if success:
+                    self.sync_log(f"自定义命令执行成功：{msg}")
+                else:
+                    self.sync_log(f"自定义命令执行失败：{msg}")
+                return success, msg
+            
+            # 2. 生成临时TCL文件
+            temp_tcl_path = self.generate_temp_tcl_file(custom_command, board, pin=True)
+            
+            # 3. 构建执行命令
+            mode = config.get("mode", "local")
+            
+            # 构建命令
+            if base_dir:
+                cmd = f'cd /d "{base_dir}" && call "{resolved_haps}" "{resolved_xactor}" "{temp_tcl_path}"'
+            else:
+                cmd = f'call "{resolved_haps}" "{resolved_xactor}" "{temp_tcl_path}"'
+            
+            self.sync_log(f"执行命令：{cmd}")
+            
+            # 4. 执行命令
+            if mode == "local":
+                # 本地模式：使用subprocess执行
+                try:
+                    return_code = self.run_local_command(cmd, board, job, on_line)
+                    
+                    if return_code == 0:
+                        self.sync_log(f"自定义命令执行成功，返回码：{return_code}")
+                        return True, f"返回码{return_code}"
+                    else:
+                        self.sync_log(f"自定义命令执行失败，返回码：{return_code}")
+                        return False, f"返回码{return_code}"
+                        
+                except Exception as e:
+                    return False, str(e)
+            else:
+                # SSH模式：使用SSH执行
+                success, msg = self.run_remote_command(cmd, board, job, on_line)[:2]
+                if success:
+                    self.sync_log(f"自定义命令执行成功：{msg}")
+                else:
+                    self.sync_log(f"自定义命令执行失败：{msg}")
+                    self.show_job_error(job, "执行失败", f"自定义命令失败：{msg}")
+                return success, msg
+                
+        except ValueError as e:
+            self.sync_log(f"参数错误：{str(e)}")
+            self.report_error("参数错误", str(e))
+            return False, str(e)
+        except Exception as e:
+            self.sync_log(f"自定义命令执行异常：{str(e)}")
+            self.report_error("执行异常", str(e))
+            return False, str(e)
+        finally:
+            if temp_tcl_path:
+                self.release_script(board, temp_tcl_path)
+
+    def release_script(self, board, path):
+        """命令执行完毕，解除临时脚本的固定"""
+        store = board.script_store
+        if store is not None:
+            store.release(path)
+
+    def run_haps_command(self, cmd_type, board=None, job=None):
+        """执行HAPS预设命令"""
+        config = (board or self.boards["default"]).config
+        tcl_map = {
+            "load_all": config["load_all_tcl"],
+            "load_master": config["load_master_tcl"],
+            "load_slave": config["load_slave_tcl"],
+            "reset_all": config["reset_all_tcl"],
+            "reset_master": config["reset_master_tcl"],
+            "reset_slave": config["reset_slave_tcl"]
+        }
+        return self.run_tcl_script(tcl_map[cmd_type], f"预设命令[{cmd_type}]", board, job)
+
+    def run_tcl_script(self, tcl_script, label, board=None, job=None):
+        """通过haps100control.bat执行TCL脚本（预设脚本或命令行指定的脚本）"""
+        board = board or self.boards["default"]
+        wrapper = None
+        try:
+            config = board.config
+            haps_ctrl = config["haps_control_path"]
+            xactorscmd = config["xactorscmd_path"]
+            base_dir = config["base_dir"]
+            mode = config.get("mode", "local")
+            
+            if not haps_ctrl or not xactorscmd:
+                raise ValueError("haps100control和xactorscmd路径不能为空")
+            
+            # 处理路径：先检查原始路径，找不到则尝试用Bitfile路径拼接
+            resolved_tcl = self.resolve_path(tcl_script, base_dir, board)
+            if not resolved_tcl:
+                raise ValueError(f"找不到{label}的TCL脚本：{tcl_script}")
+            
+            # 处理haps_control路径
+            resolved_haps = self.resolve_path(haps_ctrl, base_dir, board)
+            # 处理xactorscmd路径
+            resolved_xactor = self.resolve_path(xactorscmd, base_dir, board)
+            
+            # 常驻会话模式：在会话中source脚本
+            handled, success, msg = self.run_in_session(resolved_xactor, base_dir, tcl_path=resolved_tcl,
+                                                        board=board, job=job)
+            if handled:
+                if success:
+                    self.sync_log(f"{label}执行成功：{msg}")
+                else:
+                    self.sync_log(f"{label}执行失败：{msg}")
+                    self.show_job_error(job, "执行失败", f"{label}失败：{msg}")
+                return success, msg
+            
+            # 硬件发现缓存命中：执行预设DEVICE/SERIAL后source原脚本的包装脚本，跳过cfg_scan
+            prelude = self.hardware_cache.prelude(board.host)
+            if prelude:
+                source_path = resolved_tcl.replace("\\", "/")
+                resolved_tcl = wrapper = self.get_script_store(board).put(prelude + f"source {{{source_path}}}\n",
+                                                                          pin=True)
+                if mode == "ssh":
+                    self.path_cache.invalidate(board.host, resolved_tcl)
+                self.sync_log(f"使用缓存的硬件发现结果，包装脚本：{resolved_tcl}")
+            
+            # 构建命令
+            if base_dir:
+                cmd = f'cd /d "{base_dir}" && call "{resolved_haps}" "{resolved_xactor}" "{resolved_tcl}"'
+            else:
+                cmd = f'call "{resolved_haps}" "{resolved_xactor}" "{resolved_tcl}"'
+            
+            self.sync_log(f"构建命令：{cmd}")
+            
+            # 执行命令
+            if mode == "local":
+                # 本地模式：使用subprocess执行
+                try:
+                    return_code = self.run_local_command(cmd, board, job)
+                    
+                    if return_code == 0:
+                        self.sync_log(f"{label}执行成功，返回码：{return_code}")
+                        return True, f"返回码{return_code}"
+                    else:
+                        self.sync_log(f"{label}执行失败，返回码：{return_code}")
+                        self.show_job_error(job, "执行失败", f"{label}失败，返回码：{return_code}")
+                        return False, f"返回码{return_code}"
+                        
+                except Exception as e:
+                    error_msg = str(e)
+                    self.sync_log(f"{label}执行异常：{error_msg}")
+                    self.report_error("执行异常", error_msg)
+                    return False, error_msg
+            else:
+                # SSH模式：使用SSH执行
+                success, msg = self.run_remote_command(cmd, board, job)[:2]
+                if success:
+                    self.sync_log(f"{label}执行成功：{msg}")
+                else:
+                    self.sync_log(f"{label}执行失败：{msg}")
+                    self.show_job_error(job, "执行失败", f"{label}失败：{msg}")
+                return success, msg
+                
+        except ValueError as e:
+            self.sync_log(f"参数错误：{str(e)}")
+            self.report_error("参数错误", str(e))
+            return False, str(e)
+        except Exception as e:
+            self.sync_log(f"HAPS命令执行异常：{str(e)}")
+            self.report_error("执行异常", str(e))
+            return False, str(e)
+        finally:
+            if wrapper:
+                self.release_script(board, wrapper)
+
+    def resolve_path(self, path, base_dir, board=None):
+        """解析路径：如果路径不存在，尝试用Bitfile路径拼接"""
+        if not path:
+            return None
+        
+        board = board or self.boards["default"]
+        mode = board.config.get("mode", "local")
+        resolved_path = path
+        
+        # 检查路径是否存在
+        if mode == "local":
+            # 本地模式检查
+            if not os.path.exists(resolved_path):
+                # 尝试用Bitfile路径拼接
+                if base_dir and not os.path.isabs(resolved_path):
+                    combined_path = os.path.join(base_dir, resolved_path)
+                    if os.path.exists(combined_path):
+                        self.sync_log(f"路径不存在，使用Bitfile路径拼接：{combined_path}")
+                        resolved_path = combined_path
+                    else:
+                        self.sync_log(f"路径不存在：{resolved_path} 和 {combined_path}")
+                        return None
+                else:
+                    self.sync_log(f"路径不存在：{resolved_path}")
+                    return None
+        else:
+            # SSH模式检查
+            if not board.ssh_connected:
+                return resolved_path
+                
+            # 原始路径和Bitfile路径拼接一次往返同时检查
+            combined_path = None
+            candidates = [resolved_path]
+            if base_dir and not os.path.isabs(resolved_path):
+                combined_path = os.path.join(base_dir, resolved_path).replace("/", "\\")
+                candidates.append(combined_path)
+            try:
+                results = self.check_paths_batch(candidates, board=board)
+            except Exception as e:
+                self.sync_log(f"路径解析失败：{str(e)}")
+                return None
+            
+            exists = self._log_path_result(resolved_path, "路径解析", False, results)
+            
+            # 如果不存在，尝试用Bitfile路径拼接
+            if not exists and combined_path:
+                exists = self._log_path_result(combined_path, "路径解析(拼接后)", False, results)
+                if exists:
+                    self.sync_log(f"路径不存在，使用Bitfile路径拼接：{combined_path}")
+                    resolved_path = combined_path
+                else:
+                    self.sync_log(f"路径不存在：{resolved_path} 和 {combined_path}")
+                    return None
+            elif not exists:
+                self.sync_log(f"路径不存在：{resolved_path}")
+                return None
+                
+        return resolved_path
+
+    def get_session(self, resolved_xactor, base_dir, board=None):
+        """获取（必要时启动）板卡的常驻proto_rt会话，启动失败返回None"""
+        board = board or self.boards["default"]
+        mode = board.config.get("mode", "local")
+        default_tcl = self.get_full_default_tcl_path(board)
+        key = (mode, board.host, resolved_xactor, default_tcl, base_dir)
+        
+        if board.session is not None and (board.session_key != key or not board.session.alive):
+            self.close_session(board)
+        
+        if board.session is None:
+            self.sync_log(f"[{board.name}] 启动proto_rt常驻会话...")
+            session = ProtoRtSession(
+                mode, resolved_xactor, default_tcl, base_dir,
+                ssh_client=board.ssh_client, mux=self.output_mux,
+                decoder=self.make_decoder(board), log=self.sync_log
+            )
+            try:
+                session.start()
+            except Exception as e:
+                self.sync_log(f"常驻会话启动失败，改用单次执行：{str(e)}")
+                return None
+            board.session = session
+            board.session_key = key
+        return board.session
+
+    def close_session(self, board=None):
+        """关闭常驻proto_rt会话，未指定板卡时关闭所有板卡的会话"""
+        for item in ([board] if board is not None else self.boards.values()):
+            if item.session is not None:
+                item.session.close()
+                self.sync_log(f"[{item.name}] proto_rt常驻会话已关闭")
+            item.session = None
+            item.session_key = None
+
+    def run_in_session(self, resolved_xactor, base_dir, script=None, tcl_path=None, board=None, job=None):
+        """尝试在常驻会话中执行，返回(是否已处理, 成功, 消息)"""
+        board = board or self.boards["default"]
+        if not board.config.get("session_mode", False) or not resolved_xactor:
+            return False, False, ""
+        
+        # 同一板卡上并行的另一条任务正在使用会话时，本任务改用单次执行
+        if not board.session_lock.acquire(blocking=False):
+            return False, False, ""
+        try:
+            session = self.get_session(resolved_xactor, base_dir, board)
+            if session is None:
+                return False, False, ""
+            
+            on_line = self.output_logger(board, job)
+            start = time.time()
+            # 取消时强制结束会话，下一条命令重新建立
+            if job is not None:
+                job.add_cancel_hook(session.kill)
+            try:
+                if tcl_path:
+                    success, return_code = session.run_script_file(tcl_path, on_line,
+                                                                   self.hardware_cache.prelude(board.host))
+                else:
+                    success, return_code = session.run(script, on_line)
+            except Exception as e:
+                self.close_session(board)
+                return True, False, f"会话执行异常：{str(e)}"
+            finally:
+                if job is not None:
+                    job.remove_cancel_hook(session.kill)
+            
+            if not session.alive:
+                self.close_session(board)
+            if job is not None and job.cancel_event.is_set():
+                return True, False, job.cancel_text
+            return True, success, f"返回码{return_code}（会话执行，耗时{time.time() - start:.2f}s）"
+        finally:
+            board.session_lock.release()
+
+    def create_spool(self, prefix):
+        """为一次任务创建输出暂存"""
+        spool_dir = self.config.get("spool_dir", "").strip() or os.path.join(tempfile.gettempdir(), "haps_spool")
+        return OutputSpool(
+            spool_dir,
+            tail_lines=self.config.get("output_tail_lines", 200),
+            keep_files=self.config.get("spool_keep_files", 50),
+            prefix=prefix
+        )
+
+    def output_logger(self, board, job=None):
+        """命令输出逐行写入日志并交给任务看门狗；非默认板卡的输出带板卡名前缀"""
+        prefix = "" if board.name == "default" else f"[{board.name}] "
+        watchdog = job.watchdog if job is not None else None
+        
+        hooks = job.output_hooks if job is not None else ()
+        hardware = self.hardware_cache.watcher(board.host)
+        
+        def on_line(line):
+            self.sync_log(f"{prefix}输出：{line}")
+            hardware(line)
+            if watchdog is not None:
+                watchdog.feed(line)
+            for hook in hooks:
+                hook(line)
+        return on_line
+
+    def make_decoder(self, board=None):
+        """按配置创建输出解码器；auto模式下沿用该主机上次探测到的编码"""
+        board = board or self.boards["default"]
+        host = board.host
+        encoding = board.config.get("output_encoding", "auto")
+        if encoding == "auto":
+            encoding = self._host_encodings.get(host, "auto")
+        
+        def on_detect(detected):
+            self._host_encodings[host] = detected
+            self.sync_log(f"检测到输出编码：{detected}（{host}）")
+        
+        return StreamDecoder(encoding, on_detect=on_detect)
+
+    def run_local_command(self, cmd, board=None, job=None, on_line=None):
+        """执行本地命令，输出由共享读取循环按行写入日志（或交给on_line），返回退出码；取消时结束整个进程树"""
+        board = board or self.boards["default"]
+        process = subprocess.Popen(
+            cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=dict(os.environ, HAPS_JOB=new_job_token()),
+            **local_popen_kwargs()
+        )
+        kill = lambda: kill_process_tree(process)
+        if job is not None:
+            job.add_cancel_hook(kill)
+        try:
+            self.output_mux.add_pipe(process.stdout, on_line or self.output_logger(board, job),
+                                     self.make_decoder(board)).wait()
+            return_code = process.wait()
+            if job is not None:
+                job.return_code = return_code
+            return return_code
+        finally:
+            if job is not None:
+                job.remove_cancel_hook(kill)
+
+    def run_remote_command(self, cmd, board=None, job=None, on_line=None):
+        """执行远程命令（SSH模式），返回(成功, 消息, 返回码, 输出暂存)
+        
+        通道建立前或尚无任何输出时连接中断，视为命令未开始，重连后重试一次；
+        执行中途连接中断则明确返回失败，由队列继续处理后续命令。
+        命令行带有HAPS_JOB标记，取消时先按标记结束远程进程树再关闭通道。
+        """
+        board = board or self.boards["default"]
+        log_line = on_line or self.output_logger(board, job)
+        token = new_job_token()
+        cmd = f'set "HAPS_JOB={token}" && {cmd}'
+        for attempt in range(2):
+            if job is not None and job.cancel_event.is_set():
+                return False, job.cancel_text, -1, None
+            try:
+                channel = board.ssh_client.open_session()
+                channel.set_combine_stderr(True)  # 合并stderr到stdout
+                channel.exec_command(cmd)
+            except Exception as e:
+                if attempt == 0:
+                    self.sync_log(f"打开远程通道失败，重连后重试：{str(e)}")
+                    continue
+                return False, f"打开远程通道失败：{str(e)}", -1, None
+            
+            # 完整输出写入磁盘暂存，内存中只保留末尾若干行
+            spool = self.create_spool(board.name)
+            
+            def on_line(line):
+                spool.write(line)
+                log_line(line)
+            
+            def kill():
+                # 先按标记结束远程进程树，再关闭通道；先关通道时远程进程可能已脱离而继续占用硬件
+                self.kill_remote_job(board, token)
+                channel.close()
+            
+            # 由共享读取循环按行收集输出
+            if job is not None:
+                job.add_cancel_hook(kill)
+            try:
+                self.output_mux.add_channel(channel, on_line, self.make_decoder(board)).wait()
+            finally:
+                spool.close()
+                if job is not None:
+                    job.remove_cancel_hook(kill)
+            
+            # 等待命令完成；连接断开时通道被关闭，退出码为-1
+            return_code = channel.recv_exit_status()
+            channel.close()
+            if job is not None:
+                job.return_code = return_code
+            if job is not None and job.cancel_event.is_set():
+                return False, f"{job.cancel_text}，完整输出：{spool}", -1, spool
+            if return_code == -1 and not board.ssh_client.connected:
+                if attempt == 0 and not spool.line_count:
+                    self.sync_log("SSH连接在命令开始前中断，重连后重试")
+                    continue
+                return False, f"SSH连接中断，命令执行结果未知，完整输出：{spool}", -1, spool
+            
+            if return_code == 0:
+                return True, f"返回码0，完整输出：{spool}", return_code, spool
+            else:
+                tail = spool.tail_text(10)
+                return False, f"返回码{return_code}，输出末尾：\n{tail}\n完整输出：{spool}", return_code, spool
+
+    def kill_remote_job(self, board, token):
+        """按HAPS_JOB标记结束远程进程树"""
+        try:
+            stdin, stdout, stderr = board.ssh_client.exec_command(remote_kill_command(token), timeout=15)
+            stdout.read()
+            self.sync_log(f"[{board.name}] 已结束远程进程：{token}")
+        except Exception as e:
+            self.sync_log(f"[{board.name}] 结束远程进程失败：{str(e)}")
+
+    def show_job_error(self, job, title, message):
+        """弹出失败提示；用户主动终止或被抢占的任务不弹窗"""
+        if job is None or not job.cancel_event.is_set():
+            self.report_error(title, message)
+
+    def process_data(self, data):
+        """处理数据编码"""
+        if isinstance(data, str):
+            return data.rstrip('\r\n')
+            
+        if isinstance(data, bytes):
+            # 强制使用GBK解码
+            try:
+                return data.decode('gbk', errors='replace').rstrip('\r\n')
+            except:
+                return data.decode('latin-1').rstrip('\r\n')
+            
+        return str(data)
+
+    def load_config(self):
+        """加载配置"""
+        try:
+            if os.path.exists(self.config_file):
+                try:
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        loaded_config = json.load(f)
+                        for key in self.config:
+                            if key in loaded_config:
+                                self.config[key] = loaded_config[key]
+                    
+                    self.sync_log("配置文件加载成功")
+                except Exception as e:
+                    self.sync_log(f"加载配置失败：{str(e)}")
+                    self.save_config()
+            else:
+                self.save_config()
+                self.sync_log("配置文件不存在，已创建默认配置")
+        finally:
+            pass
+
+    def save_config(self):
+        """保存配置"""
+        try:
+            with open(self.config_file, 'w', encoding='utf-8') as f:
+                json.dump(self.config, f, indent=4, ensure_ascii=False)
+            self.sync_log("配置已保存")
+        except Exception as e:
+            error_msg = f"保存配置失败：{str(e)}"
+            self.sync_log(error_msg)
+            self.report_error("保存失败", error_msg)
+
+    # 日志和通知（图形界面重写）
+    def sync_log(self, message):
+        """输出一行日志，可在任意线程调用"""
+        self.log(message)
+
+    @staticmethod
+    def print_log(message):
+        """默认日志输出：带时间戳写到标准输出"""
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    def report_error(self, title, message, level="error"):
+        """提示错误或警告；无界面时写入日志"""
+        self.sync_log(f"{title}：{message}")
+
+    def notify_ssh_status(self):
+        """SSH连接状态变化"""
+
+    def update_exec_status(self):
+        """队列深度或任务状态变化"""
+
+    def queue_summary(self):
+        """各板卡队列深度的显示文本，返回(文本, 是否有任务执行中)"""
+        parts, busy = [], False
+        for name, (pending, running) in self.scheduler.depths().items():
+            if running:
+                busy = True
+                parts.append(f"{name} 执行中{running}条，剩余：{pending}")
+            elif pending:
+                parts.append(f"{name} 等待：{pending}")
+        stats = self.scheduler.coalesce_stats
+        if any(stats.values()):
+            parts.append(f"已合并 重复{stats['duplicate']}/替代{stats['superseded']}/幂等{stats['idempotent']}")
+        return "；".join(parts), busy
+
+    def cancel_running(self):
+        """终止目标板卡上正在执行的命令（等待中的命令保留）"""
+        board_name = None if self.target_board == "全部" else self.target_board
+        count = self.scheduler.cancel(board=board_name, pending=False)
+        self.sync_log(f"已请求终止{count}条正在执行的命令" if count else "没有正在执行的命令")
+
+    def shutdown(self):
+        """关闭所有板卡的常驻会话、SFTP和SSH连接"""
+        self._fingerprint_pool.shutdown(wait=False)
+        self.run_logs.close()
+        self.bit_manifest.close()
+        self.close_session()
+        for board in self.boards.values():
+            if board.name != "default" and board.ssh_client is not None:
+                self.disconnect_board(board)
+        if self.ssh_connected:
+            self.disconnect_ssh()
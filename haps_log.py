@@ -0,0 +1,304 @@
+"""HAPS日志 - 执行线程与Tk主循环之间的日志管道，以及有界的虚拟化日志视图
+
+执行线程只向无锁队列（deque的append/popleft在CPython中是原子操作）追加(到达时间, 消息)，
+不调用任何Tk接口；主循环按固定节拍取出一批交给渲染回调。每批的行数按到达速率和每行的
+渲染耗时自适应：积压时尽量在一帧内追上，但单帧渲染不超过帧预算，界面不会卡顿。
+"""
+import os
+import tempfile
+import time
+import tkinter as tk
+from collections import deque
+
+class LogPipeline:
+    """执行线程 -> Tk主循环的日志管道
+
+    push可在任意线程调用；start/stop/clear和渲染回调只在主循环中执行。
+    时间戳在消息到达时记录；drain_lag为最近一帧中最早一行从到达到显示的延迟（秒）。
+    """
+    INTERVAL_MS = 50  # 固定节拍
+    FRAME_BUDGET = 0.012  # 每帧渲染耗时上限（秒）
+    MIN_BATCH = 50
+    MAX_BATCH = 5000
+    STATS_INTERVAL = 1.0  # 上报统计的间隔（秒）
+
+    def __init__(self, root, render, on_stats=None):
+        self.root = root
+        self.render = render  # render(格式化后的行列表)
+        self.on_stats = on_stats  # on_stats(stats()的结果)
+        self._queue = deque()
+        self._timer = None
+        self._last_drain = None
+        self._last_stats = 0
+        self._left = 0  # 上一帧结束时的积压行数，用于计算到达速率
+        self._line_cost = None  # 每行渲染耗时的指数平均
+        self.batch = self.MIN_BATCH
+        self.rate = 0.0  # 到达速率（行/秒）的指数平均
+        self.drain_lag = 0.0
+        self.max_lag = 0.0
+
+    def push(self, message):
+        """追加一行日志（线程安全，不阻塞）"""
+        self._queue.append((time.time(), message))
+
+    def start(self):
+        if self._timer is None:
+            self._last_drain = time.perf_counter()
+            self._timer = self.root.after(self.INTERVAL_MS, self._drain)
+
+    def stop(self):
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+
+    def clear(self):
+        """丢弃所有尚未显示的日志"""
+        while True:
+            try:
+                self._queue.popleft()
+            except IndexError:
+                break
+        self._left = 0
+
+    @property
+    def backlog(self):
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            "backlog": len(self._queue),
+            "batch": self.batch,
+            "rate": round(self.rate, 1),
+            "lag_ms": int(self.drain_lag * 1000),
+            "max_lag_ms": int(self.max_lag * 1000)
+        }
+
+    @staticmethod
+    def format(arrived, message):
+        return f"[{time.strftime('%H:%M:%S', time.localtime(arrived))}] {message}"
+
+    def _drain(self):
+        """主循环节拍：取出一批日志渲染，并按速率和渲染耗时调整下一批的行数"""
+        try:
+            started = time.perf_counter()
+            items = []
+            while len(items) < self.batch:
+                try:
+                    items.append(self._queue.popleft())
+                except IndexError:
+                    break
+            if items:
+                self.render([self.format(arrived, message) for arrived, message in items])
+                self.drain_lag = time.time() - items[0][0]
+                self.max_lag = max(self.max_lag, self.drain_lag)
+                cost = (time.perf_counter() - started) / len(items)
+                self._line_cost = cost if self._line_cost is None else 0.8 * self._line_cost + 0.2 * cost
+            else:
+                self.drain_lag = 0.0
+            left = len(self._queue)
+            self._adapt(started, len(items) + left - self._left)
+            self._left = left
+            self._report()
+        finally:
+            self._timer = self.root.after(self.INTERVAL_MS, self._drain)
+
+    def _adapt(self, now, arrived):
+        """下一批行数：够覆盖一个节拍的到达量并追回积压，但渲染耗时不超过帧预算"""
+        elapsed = max(now - self._last_drain, 1e-3)
+        self._last_drain = now
+        self.rate = 0.8 * self.rate + 0.2 * (arrived / elapsed)
+        wanted = self.rate * self.INTERVAL_MS / 1000 + len(self._queue)
+        affordable = self.FRAME_BUDGET / self._line_cost if self._line_cost else self.MAX_BATCH
+        self.batch = int(min(max(min(wanted, affordable), self.MIN_BATCH), self.MAX_BATCH))
+
+    def _report(self):
+        now = time.time()
+        if self.on_stats is not None and now - self._last_stats >= self.STATS_INTERVAL:
+            self._last_stats = now
+            self.on_stats(self.stats())
+            self.max_lag = 0.0
+
+class LogHistory:
+    """日志历史文件 - 追加写入显示过的全部日志行，并按字节偏移向前/向后分页读取
+
+    每个界面会话一个文件（目录下只保留最近keep个，directory为空时使用系统临时目录下的haps_logs），
+    内存中不保留历史，只记录文件大小。
+    """
+    CHUNK = 64 * 1024
+
+    def __init__(self, directory="", prefix="haps_gui", keep=10):
+        directory = directory or os.path.join(tempfile.gettempdir(), "haps_logs")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.log")
+        self._writer = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+        self.size = os.path.getsize(self.path)
+        self._cleanup(directory, prefix, keep)
+
+    @staticmethod
+    def _cleanup(directory, prefix, keep):
+        """删除较早会话的历史文件"""
+        names = sorted(name for name in os.listdir(directory) if name.startswith(prefix + "_") and name.endswith(".log"))
+        for name in names[:max(len(names) - keep, 0)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    def append(self, data):
+        """追加已编码的行（以换行结尾），返回写入前的文件大小"""
+        offset = self.size
+        self._writer.write(data)
+        self._writer.flush()
+        self.size += len(data)
+        return offset
+
+    def read_before(self, offset, count, floor=0):
+        """读取offset之前（不早于floor）的最多count行，返回(行列表, 第一行的起始偏移)"""
+        position, data = offset, b""
+        while position > floor and data.count(b"\n") <= count:
+            step = min(self.CHUNK, position - floor)
+            position -= step
+            self._reader.seek(position)
+            data = self._reader.read(step) + data
+        lines = data.split(b"\n")[:-1]
+        if position > floor:
+            # 第一段可能是不完整的行
+            position += len(lines.pop(0)) + 1
+        for line in lines[:max(len(lines) - count, 0)]:
+            position += len(line) + 1
+        return lines[-count:] if count else [], position
+
+    def read_after(self, offset, count):
+        """读取offset开始的最多count个完整行，返回(行列表, 最后一行之后的偏移)"""
+        self._reader.seek(offset)
+        data = b""
+        while data.count(b"\n") < count and offset + len(data) < self.size:
+            block = self._reader.read(min(self.CHUNK, self.size - offset - len(data)))
+            if not block:
+                break
+            data += block
+        lines = data.split(b"\n")[:-1][:count]
+        return lines, offset + sum(len(line) + 1 for line in lines)
+
+    def close(self):
+        for f in (self._writer, self._reader):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+class LogView:
+    """日志框的虚拟化显示 - 控件中只保留一个视窗的行，全部历史在LogHistory中
+
+    视窗对应历史文件中[top, bottom)的字节范围，_lengths按顺序记录视窗内每行的字节数（环形缓冲，
+    行数不超过capacity）。视图停在底部且视窗包含最新内容时新日志直接追加，超出容量时丢弃最早的行；
+    滚动到顶部或底部时从历史文件换入更早或更新的一页。没有历史文件时只保留最近capacity行。
+    所有方法只在Tk主循环中调用。
+    """
+    def __init__(self, text, history=None, capacity=2000, page=500):
+        self.text = text
+        self.history = history
+        self.capacity = max(int(capacity), page)
+        self.page = page
+        self._lengths = deque()
+        self._top = self._bottom = self._floor = 0  # 清空后不再换入floor之前的历史
+        self._paging = False
+        self._scrollbar = getattr(text, "vbar", None)
+        text.configure(yscrollcommand=self._on_yscroll)
+
+    def append(self, lines):
+        """写入一批日志行（每行可含换行）"""
+        lines = [part for line in lines for part in line.split("\n")]
+        encoded = [line.encode("utf-8", errors="replace") for line in lines]
+        if self.history is not None:
+            offset = self.history.append(b"".join(item + b"\n" for item in encoded))
+            if self._bottom != offset or self.text.yview()[1] < 0.999:
+                return  # 视图不在最新处：只写历史，滚动到底部时再换入
+            self._bottom = self.history.size
+        self._edit(lambda: self._insert_end(lines, encoded))
+        self.text.see(tk.END)
+
+    def clear(self):
+        self._edit(lambda: self.text.delete("1.0", tk.END))
+        self._lengths.clear()
+        end = self.history.size if self.history is not None else 0
+        self._top = self._bottom = self._floor = end
+
+    def _edit(self, action):
+        self._paging = True
+        self.text.config(state=tk.NORMAL)
+        try:
+            action()
+        finally:
+            self.text.config(state=tk.DISABLED)
+            self._paging = False
+
+    def _insert_end(self, lines, encoded):
+        self.text.insert(tk.END, "".join(line + "\n" for line in lines))
+        self._lengths.extend(len(item) + 1 for item in encoded)
+        self._trim_top(len(self._lengths) - self.capacity)
+
+    def _trim_top(self, count):
+        if count <= 0:
+            return
+        self.text.delete("1.0", f"{count + 1}.0")
+        for _ in range(count):
+            self._top += self._lengths.popleft()
+
+    def _trim_bottom(self, count):
+        if count <= 0:
+            return
+        self.text.delete(f"{len(self._lengths) - count + 1}.0", tk.END)
+        for _ in range(count):
+            self._bottom -= self._lengths.pop()
+
+    def _on_yscroll(self, first, last):
+        if self._scrollbar is not None:
+            self._scrollbar.set(first, last)
+        if self._paging or self.history is None:
+            return
+        if float(first) <= 0.0 and self._top > self._floor:
+            self._paging = True
+            self.text.after_idle(self._page_older)
+        elif float(last) >= 1.0 and self._bottom < self.history.size:
+            self._paging = True
+            self.text.after_idle(self._page_newer)
+
+    def _first_visible(self):
+        return int(self.text.index("@0,0").split(".")[0])
+
+    def _page_older(self):
+        """换入更早的一页，超出容量时丢弃视窗末尾的行，视图保持在原来的内容上"""
+        lines, start = self.history.read_before(self._top, self.page, self._floor)
+        if not lines:
+            self._paging = False
+            return
+        first = self._first_visible()
+
+        def action():
+            self.text.insert("1.0", "".join(line.decode("utf-8", errors="replace") + "\n" for line in lines))
+            self._lengths.extendleft(len(line) + 1 for line in reversed(lines))
+            self._top = start
+            self._trim_bottom(len(self._lengths) - self.capacity)
+        self._edit(action)
+        self.text.yview(f"{first + len(lines)}.0")
+
+    def _page_newer(self):
+        """换入更新的一页，超出容量时丢弃视窗开头的行"""
+        lines, end = self.history.read_after(self._bottom, self.page)
+        if not lines:
+            self._paging = False
+            return
+        first = self._first_visible()
+        removed = []
+
+        def action():
+            self.text.insert(tk.END, "".join(line.decode("utf-8", errors="replace") + "\n" for line in lines))
+            self._lengths.extend(len(line) + 1 for line in lines)
+            self._bottom = end
+            count = len(self._lengths) - self.capacity
+            self._trim_top(count)
+            removed.append(max(count, 0))
+        self._edit(action)
+        self.text.yview(f"{max(first - removed[0], 1)}.0")
@@ -0,0 +1,146 @@
+"""HAPS阶段耗时 - 按输出中的里程碑行把加载/复位划分为阶段，统计各板卡各阶段耗时的分位数
+
+    启动  任务开始 -> "Scaning HW attached"
+    扫描  -> "Starting to connect HAPS HW"
+    连接  -> "Clear previous FPGA images"
+    清除  -> "Starting to Configue HAPS"
+    配置  -> "cfg Done!"
+    收尾  -> "Close Handler"
+    关闭  -> 任务结束
+
+里程碑可在配置的phase_markers中修改（[阶段名, 该阶段开始时输出的文本]，按顺序）。每行输出只做一次
+正则匹配，时间取该行到达的时刻；里程碑只会向后推进，重复或乱序出现的里程碑不改变阶段。
+统计只依赖标准库，命令行查看无需加载引擎。
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+FIRST_PHASE = "启动"
+DEFAULT_PHASE_MARKERS = [
+    ["扫描", "Scaning HW attached"],
+    ["连接", "Starting to connect HAPS HW"],
+    ["清除", "Clear previous FPGA images"],
+    ["配置", "Starting to Configue HAPS"],
+    ["收尾", "cfg Done!"],
+    ["关闭", "Close Handler"]
+]
+
+class PhaseTracker:
+    """一次运行的阶段计时，feed作为任务的输出钩子在执行线程中调用"""
+    def __init__(self, pattern, names):
+        self.pattern = pattern
+        self.names = names
+        self.started = time.monotonic()
+        self.marks = [(FIRST_PHASE, self.started)]  # (阶段名, 开始时刻)
+        self._index = 0  # 当前阶段在names中的序号，0为启动阶段
+
+    def feed(self, line):
+        match = self.pattern.search(line)
+        if match is not None and match.lastindex > self._index:
+            self._index = match.lastindex
+            self.marks.append((self.names[match.lastindex], time.monotonic()))
+
+    @property
+    def matched(self):
+        return len(self.marks) > 1
+
+    def durations(self, finished=None):
+        """各阶段耗时（秒），最后一个阶段到finished（默认为当前时刻）结束"""
+        finished = time.monotonic() if finished is None else finished
+        ends = [mark[1] for mark in self.marks[1:]] + [finished]
+        return {name: round(end - start, 3) for (name, start), end in zip(self.marks, ends)}
+
+class PhaseProfiler:
+    """阶段耗时记录（JSON文件，跨进程保留）
+
+    按板卡和命令保存最近keep次运行的各阶段耗时；分位数只统计成功的运行。
+    """
+    def __init__(self, path, markers=None, keep=200, log=print):
+        self.path = path
+        self.keep = keep
+        self.log = log
+        markers = markers or DEFAULT_PHASE_MARKERS
+        self.phases = [FIRST_PHASE] + [name for name, _ in markers]
+        # 每个里程碑一个分组，分组序号即阶段序号
+        self.pattern = re.compile("|".join(f"({re.escape(text)})" for _, text in markers))
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.log(f"读取阶段耗时记录失败，忽略：{str(e)}")
+            return {}
+
+    def _save(self):
+        """先写临时文件再替换（需持有锁）"""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.log(f"保存阶段耗时记录失败：{str(e)}")
+
+    def tracker(self):
+        return PhaseTracker(self.pattern, self.phases)
+
+    def record(self, board, command, tracker, ok):
+        """记录一次运行，返回各阶段耗时；没有匹配到任何里程碑（如跳过加载）时不记录，返回None"""
+        if not tracker.matched:
+            return None
+        durations = tracker.durations()
+        with self._lock:
+            runs = self._state.setdefault(board, {}).setdefault(command, [])
+            runs.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "ok": bool(ok), "phases": durations})
+            del runs[:max(len(runs) - self.keep, 0)]
+            self._save()
+        return durations
+
+    def summary(self, board=None, command=None):
+        """各阶段耗时统计：[{board, command, phase, count, p50, p95, last}, ...]，按板卡、命令和阶段顺序"""
+        with self._lock:
+            state = {name: {cmd: list(runs) for cmd, runs in commands.items()} for name, commands in self._state.items()}
+        rows = []
+        for board_name in sorted(state):
+            if board and board_name != board:
+                continue
+            for cmd in sorted(state[board_name]):
+                if command and command not in cmd:
+                    continue
+                runs = [run for run in state[board_name][cmd] if run.get("ok")]
+                phases = [name for name in self.phases if any(name in run["phases"] for run in runs)]
+                # 配置中已去掉的阶段仍按记录中的顺序列出
+                phases += [name for run in runs for name in run["phases"] if name not in phases]
+                for phase in dict.fromkeys(phases):
+                    values = sorted(run["phases"][phase] for run in runs if phase in run["phases"])
+                    rows.append({"board": board_name, "command": cmd, "phase": phase, "count": len(values),
+                                 "p50": percentile(values, 50), "p95": percentile(values, 95),
+                                 "last": runs[-1]["phases"].get(phase)})
+        return rows
+
+def percentile(values, p):
+    """已排序数值的p分位数（最近秩法），空列表返回None"""
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+def open_profiler(config_file, log=print):
+    """按配置文件打开阶段耗时记录（与HapsEngine一致，相对路径以配置文件所在目录为准），不加载引擎"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    path = os.path.join(os.path.dirname(os.path.abspath(config_file)),
+                        config.get("phase_stats_file", "haps_phase_stats.json"))
+    return PhaseProfiler(path, config.get("phase_markers"), config.get("phase_stats_keep", 200), log=log)
@@ -0,0 +1,210 @@
+"""HAPS运行日志检索 - 运行日志写入时同步建立的SQLite全文索引
+
+    runs    每条运行日志一行：文件、板卡、命令类型和内容、开始/结束时间、状态、返回码
+    lines   FTS5全文索引（SQLite未编译FTS5时退化为普通表加LIKE匹配），每行输出一条，
+            行号为运行日志中的行号（含头部，按大小滚动出的分段累计计数）
+    chunks  运行日志每次滚动后新分段的起始行号，检索时据此换算为分段文件和其中的行号
+    spans   每条运行日志的输出行在lines中的rowid范围，删除时按rowid范围定位，不必扫描整个lines表
+
+写入只在运行日志写线程中进行（RunLogWriter），一批事件一个事务；检索可在任意线程调用，
+每次使用独立的只读连接，数据库为WAL模式，检索不会阻塞写入。只依赖标准库，命令行检索无需加载引擎。
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+
+# 按大小滚动出的分段命名为"<主文件名去掉.log>~seg<N>.log"；运行日志的文件名中不会出现"~"，
+# 因此分段不会与名称以".数字"结尾的主文件混淆
+SEGMENT_PATTERN = re.compile(r"~seg\d+\.log$")
+
+def segment_path(path, segment):
+    """运行日志path（.log）的第segment个分段（从1计）的路径"""
+    return f"{path[:-4]}~seg{segment}.log"
+
+class RunLogIndex:
+    """运行日志全文索引"""
+    def __init__(self, path):
+        self.path = path
+        self._conn = None  # 写连接，只在写线程中使用
+        self.fts = True
+
+    # 写入（运行日志写线程）
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY, path TEXT, board TEXT, kind TEXT, content TEXT,
+            created REAL, started REAL, finished REAL, state TEXT, return_code INTEGER)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_board_created ON runs (board, created)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (run INTEGER, chunk INTEGER, first_lineno INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_run ON chunks (run)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS spans (run INTEGER PRIMARY KEY, first INTEGER, last INTEGER)")
+        try:
+            # "_"作为词内字符，FB1_C等名称整体成词
+            self._conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS lines USING fts5(
+                text, run UNINDEXED, lineno UNINDEXED, tokenize="unicode61 tokenchars '_'")""")
+        except sqlite3.OperationalError:
+            self.fts = False
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lines (text TEXT, run INTEGER, lineno INTEGER)")
+        self._conn.commit()
+        return self
+
+    def add_run(self, job, path, started):
+        """登记一条运行日志，返回其编号"""
+        cursor = self._conn.execute(
+            "INSERT INTO runs (path, board, kind, content, created, started) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, job.board, job.kind, job.content, job.created, started))
+        return cursor.lastrowid
+
+    def add_lines(self, rows):
+        """rows为[(输出行, 运行编号, 行号), ...]
+
+        rowid由这里显式分配并按运行记录到spans（FTS5的run列不能建索引，按run删除需要扫描整个表）。
+        """
+        row = self._conn.execute("SELECT rowid FROM lines ORDER BY rowid DESC LIMIT 1").fetchone()
+        start = (row[0] if row else 0) + 1
+        spans = {}
+        for rowid, (text, run_id, lineno) in enumerate(rows, start):
+            spans[run_id] = (spans.get(run_id, (rowid,))[0], rowid)
+        self._conn.executemany("INSERT INTO lines (rowid, text, run, lineno) VALUES (?, ?, ?, ?)",
+                               [(rowid,) + tuple(item) for rowid, item in enumerate(rows, start)])
+        self._conn.executemany(
+            "INSERT INTO spans (run, first, last) VALUES (?, ?, ?) "
+            "ON CONFLICT (run) DO UPDATE SET last = excluded.last",
+            [(run_id, first, last) for run_id, (first, last) in spans.items()])
+
+    def add_chunk(self, run_id, chunk, first_lineno):
+        """运行日志滚动：第chunk段（从0计）从first_lineno行开始，之前的内容已改名为第chunk个分段"""
+        self._conn.execute("INSERT INTO chunks (run, chunk, first_lineno) VALUES (?, ?, ?)",
+                           (run_id, chunk, first_lineno))
+
+    def finish_run(self, run_id, job, finished):
+        self._conn.execute("UPDATE runs SET finished = ?, state = ?, return_code = ? WHERE id = ?",
+                           (finished, job.state, job.return_code, run_id))
+
+    def rename(self, old_path, new_path):
+        """运行日志被压缩后更新文件路径"""
+        self._conn.execute("UPDATE runs SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def remove(self, path):
+        """运行日志被删除时同时删除其索引"""
+        ids = [row[0] for row in self._conn.execute("SELECT id FROM runs WHERE path = ?", (path,))]
+        for run_id in ids:
+            span = self._conn.execute("SELECT first, last FROM spans WHERE run = ?", (run_id,)).fetchone()
+            if span is not None:
+                # 范围内可能夹有同时运行的其他任务的行，再按run过滤
+                self._conn.execute("DELETE FROM lines WHERE rowid BETWEEN ? AND ? AND run = ?", span + (run_id,))
+            else:
+                # 旧版本建立的索引没有spans表中的记录
+                self._conn.execute("DELETE FROM lines WHERE run = ?", (run_id,))
+            self._conn.execute("DELETE FROM chunks WHERE run = ?", (run_id,))
+            self._conn.execute("DELETE FROM spans WHERE run = ?", (run_id,))
+        self._conn.execute("DELETE FROM runs WHERE path = ?", (path,))
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    # 检索（任意线程）
+    def search(self, query, board=None, command=None, since=None, until=None, limit=100, raw=False):
+        """检索输出行，返回结果列表（按运行时间倒序）
+
+        query默认按短语匹配（大小写不敏感）；raw为True时按FTS5查询语法解析（AND/OR/NOT、前缀*等）。
+        command匹配命令内容的子串；since/until为时间戳，按任务提交时间过滤。
+        结果中path和lineno为该行实际所在的文件（滚动出的分段为~segN.log或~segN.log.gz）和文件中的行号，
+        log为运行日志的主文件。
+        """
+        if not os.path.exists(self.path):
+            return []
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'lines' AND sql LIKE '%fts5%'").fetchone()
+            if fts:
+                match = query if raw else '"' + query.replace('"', '""') + '"'
+                sql = "SELECT runs.*, lines.lineno, lines.text FROM lines JOIN runs ON runs.id = lines.run WHERE lines MATCH ?"
+            else:
+                match = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                sql = ("SELECT runs.*, lines.lineno, lines.text FROM lines JOIN runs ON runs.id = lines.run "
+                       "WHERE lines.text LIKE ? ESCAPE '\\'")
+            params = [match]
+            if board:
+                sql += " AND runs.board = ?"
+                params.append(board)
+            if command:
+                sql += " AND runs.content LIKE ?"
+                params.append(f"%{command}%")
+            if since is not None:
+                sql += " AND runs.created >= ?"
+                params.append(since)
+            if until is not None:
+                sql += " AND runs.created < ?"
+                params.append(until)
+            sql += " ORDER BY runs.created DESC, lines.lineno LIMIT ?"
+            params.append(int(limit))
+            columns = ("run", "path", "board", "kind", "content", "created", "started", "finished",
+                       "state", "return_code", "lineno", "text")
+            results = [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+            chunks = {}
+            for item in results:
+                if item["run"] not in chunks:
+                    chunks[item["run"]] = self._chunks(conn, item["run"])
+                self._locate(item, chunks[item["run"]])
+            return results
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _chunks(conn, run_id):
+        try:
+            return conn.execute("SELECT chunk, first_lineno FROM chunks WHERE run = ? ORDER BY chunk",
+                                (run_id,)).fetchall()
+        except sqlite3.OperationalError:
+            return []  # 旧版本建立的索引没有chunks表
+
+    @staticmethod
+    def _locate(item, chunks):
+        """把运行日志中的累计行号换算为实际所在的文件和其中的行号
+
+        滚动n次后第k段（k<n）在第k+1个分段（压缩后为.log.gz），最后一段仍在主文件中。
+        """
+        item["log"] = item["path"]
+        chunk, first = 0, 1
+        for index, start in chunks:
+            if start > item["lineno"]:
+                break
+            chunk, first = index, start
+        item["lineno"] -= first - 1
+        if chunk < len(chunks):
+            stem = item["path"][:-3] if item["path"].endswith(".gz") else item["path"]
+            path = segment_path(stem, chunk + 1)
+            item["path"] = path if os.path.exists(path) or not os.path.exists(path + ".gz") else path + ".gz"
+
+def parse_date(text, end=False):
+    """解析"YYYY-MM-DD"或"YYYY-MM-DD HH:MM"为时间戳；end为True且只有日期时取次日零点"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            stamp = time.mktime(time.strptime(text.strip(), fmt))
+        except ValueError:
+            continue
+        return stamp + 86400 if end and fmt == "%Y-%m-%d" else stamp
+    raise ValueError(f"日期格式错误：{text}（应为YYYY-MM-DD或YYYY-MM-DD HH:MM）")
+
+def index_path(config_file):
+    """按配置文件得到运行日志索引路径（与HapsEngine一致，相对路径以配置文件所在目录为准），不加载引擎"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    base = os.path.dirname(os.path.abspath(config_file))
+    run_log_dir = os.path.join(base, config.get("run_log_dir", "runs"))
+    return os.path.join(base, config.get("run_log_index", "") or os.path.join(run_log_dir, "index.sqlite"))
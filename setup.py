@@ -4,7 +4,7 @@ from cx_Freeze import setup, Executable
 
 # 打包配置
 build_exe_options = {
-    "packages": ["os", "tkinter", "json", "subprocess", "threading", "time", "tempfile", "queue"],
+    "packages": ["os", "tkinter", "json", "subprocess", "threading", "time", "tempfile", "queue", "socketserver"],
     "includes": [],
     "include_files": ["haps_control_default.tcl", "haps_config.json"],  # 包含需要打包的文件
     "excludes": [],
@@ -23,6 +23,12 @@ executables = [
         base=base,
         target_name="HAPSAutomation.exe",
         icon=None  # 可以指定图标文件，如 "app_icon.ico"
+    ),
+    # 命令行和守护进程（不依赖Tkinter）
+    Executable(
+        "haps_cli.py",
+        base=None,
+        target_name="haps.exe"
     )
 ]
 
@@ -33,8 +33,12 @@ if not exist %TCL_SCRIPT% (
     exit /b 1
 )
 
-REM Create temporary command file
-set CMD_FILE=%temp%\haps_commands.txt
+REM Create temporary command file (one per run, parallel runs must not share it)
+if defined HAPS_JOB (
+    set CMD_FILE=%temp%\haps_commands_%HAPS_JOB%.txt
+) else (
+    set CMD_FILE=%temp%\haps_commands_%RANDOM%_%RANDOM%.txt
+)
 echo confprosh %TCL_SCRIPT% > "%CMD_FILE%"
 echo exit >> "%CMD_FILE%" 
 
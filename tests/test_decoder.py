@@ -0,0 +1,33 @@
+"""StreamDecoder自动编码探测"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haps_engine import StreamDecoder
+
+class AutoEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.detected = []
+        self.decoder = StreamDecoder("auto", on_detect=self.detected.append)
+
+    def test_gbk_that_is_valid_utf8_is_not_misdetected(self):
+        """只含双字节序列的GBK行也是合法UTF-8，按GBK解码且不记录为UTF-8"""
+        data = "系统\n扫\n".encode("gbk")
+        lines = self.decoder.feed(data[:3]) + self.decoder.feed(data[3:])
+        self.assertEqual(lines, ["系统", "扫"])
+        self.assertEqual(self.detected, [])
+
+    def test_utf8_detected_on_three_byte_sequence(self):
+        data = "Scaning HW attached\n加载完成\n剩余".encode("utf-8")
+        lines = self.decoder.feed(data[:22]) + self.decoder.feed(data[22:]) + self.decoder.feed(b"", final=True)
+        self.assertEqual(lines, ["Scaning HW attached", "加载完成", "剩余"])
+        self.assertEqual(self.detected, ["utf-8"])
+
+    def test_invalid_utf8_selects_gbk(self):
+        self.assertEqual(self.decoder.feed("错误: 加载\n".encode("gbk")), ["错误: 加载"])
+        self.assertEqual(self.detected, ["gbk"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""BoardScheduler依赖与合并规则"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haps_engine import URGENT_PRIORITY, BoardScheduler, Job
+
+class CoalescedDependencyTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.scheduler = BoardScheduler(self.run_job, log=lambda message: None)
+
+    def run_job(self, job):
+        if job.content == "load_all":
+            deadline = time.monotonic() + 5
+            while not (self.release.is_set() or job.cancel_event.is_set()) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        return True, ""
+
+    def test_step_merged_into_pending_job_keeps_dependents(self):
+        """流程步骤入队时被合并到已有的等待任务，依赖它的步骤等待保留的任务而不是被跳过"""
+        blocker = self.scheduler.submit(Job("default", "preset", "load_all"))
+        queued = self.scheduler.submit(Job("default", "preset", "load_master"))
+        load_master = self.scheduler.submit(Job("default", "preset", "load_master"))
+        load_slave = self.scheduler.submit(Job("default", "preset", "load_slave"))
+        reset = self.scheduler.submit(Job("default", "preset", "reset_all", after=[load_master, load_slave]))
+
+        self.assertEqual(load_master.state, "merged")
+        self.assertIs(load_master.merged_into, queued)
+        self.assertEqual(reset.state, "pending")
+
+        self.release.set()
+        for job in (blocker, queued, load_slave, reset):
+            self.assertIsNotNone(job.wait(5))
+        self.assertEqual(reset.state, "done")
+        self.assertLess(queued.finished, reset.started + 1e-6)
+
+    def test_job_depended_on_through_merge_is_not_superseded(self):
+        """被依赖（经合并）的等待加载任务不被后来的load_all替代"""
+        blocker = self.scheduler.submit(Job("default", "preset", "load_all"))
+        queued = self.scheduler.submit(Job("default", "preset", "load_master"))
+        step = self.scheduler.submit(Job("default", "preset", "load_master"))
+        reset = self.scheduler.submit(Job("default", "preset", "reset_master", after=[step]))
+        self.scheduler.submit(Job("default", "preset", "load_all"))
+
+        self.assertNotEqual(queued.state, "superseded")
+        self.release.set()
+        self.assertIsNotNone(reset.wait(5))
+        self.assertEqual(reset.state, "done")
+        blocker.wait(5)
+
+    def test_urgent_job_not_merged_into_normal_job(self):
+        """紧急reset_all不并入等待中的普通reset_all，并抢占正在执行的load_all"""
+        blocker = self.scheduler.submit(Job("default", "preset", "load_all"))
+        normal = self.scheduler.submit(Job("default", "preset", "reset_all"))
+        urgent = self.scheduler.submit(Job("default", "preset", "reset_all", priority=URGENT_PRIORITY, preempt=True))
+
+        self.assertIsNone(urgent.merged_into)
+        self.assertIsNotNone(urgent.wait(5))
+        self.assertEqual(urgent.state, "done")
+        self.assertEqual(blocker.state, "preempted")
+        self.assertIsNotNone(normal.wait(5))
+
+    def test_normal_job_merges_into_urgent_job(self):
+        blocker = self.scheduler.submit(Job("default", "preset", "load_all"))
+        self.scheduler.submit(Job("default", "preset", "load_master"))
+        urgent = self.scheduler.submit(Job("default", "preset", "reset_all", priority=URGENT_PRIORITY))
+        normal = self.scheduler.submit(Job("default", "preset", "reset_all"))
+
+        self.assertIs(normal.merged_into, urgent)
+        self.release.set()
+        self.assertIsNotNone(urgent.wait(5))
+        blocker.wait(5)
+
+if __name__ == "__main__":
+    unittest.main()